@@ -0,0 +1,43 @@
+"""Per-day log state of every habit, for the dashboard agenda.
+
+One statement joins every habit with each day of the requested window and
+LEFT JOINs its logs through the (habit_id, log_date) unique index of the
+window's partitions (archived months included, see partitions.py), so its
+cost follows habits x days and not the size of the log history.
+"""
+from datetime import date
+from typing import List, Optional, Tuple
+
+from sqlalchemy import Date, bindparam, text
+from sqlalchemy.orm import Session
+
+MAX_DAYS = 31
+
+AGENDA_SQL = text("""
+    SELECT h.id AS habit_id,
+           d.day::date AS log_date,
+           l.id AS log_id,
+           COALESCE(l.completed, false) AS completed,
+           l.notes,
+           l.completed_at
+    FROM habits h
+    CROSS JOIN generate_series(:start, :end, interval '1 day') AS d(day)
+    LEFT JOIN habit_log_history(:start, :end) l ON l.habit_id = h.id AND l.log_date = d.day::date
+    ORDER BY h.id, d.day
+""").bindparams(bindparam("start", type_=Date), bindparam("end", type_=Date))
+
+
+def window(day: Optional[date], start: Optional[date], end: Optional[date]) -> Tuple[date, date]:
+    """The requested days as (start, end); raises ValueError for a missing or oversized window."""
+    if day is not None:
+        return day, day
+    if start is None or end is None:
+        raise ValueError("Pass date, or start and end")
+    if end < start or (end - start).days >= MAX_DAYS:
+        raise ValueError(f"Window must span 1 to {MAX_DAYS} days")
+    return start, end
+
+
+def load_agenda(db: Session, start: date, end: date) -> List[tuple]:
+    return db.execute(AGENDA_SQL, {"start": start, "end": end}).all()
+
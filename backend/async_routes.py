@@ -0,0 +1,93 @@
+"""Async handlers for the hot routes, enabled with ``DATABASE_ASYNC=true``.
+
+They run on the event loop with an ``AsyncSession`` on the asyncpg engine
+instead of occupying a threadpool worker per request, so slow queries stop
+capping concurrency at the threadpool size. main.py registers this router
+ahead of its sync routes, which keep serving everything else. Shared sync
+code (the read responses of reads.py, the writes of writes.py) runs
+through ``AsyncSession.run_sync``; reads go to a replica as the sync
+routes' do (see DatabaseManager.get_async_read_db).
+"""
+from datetime import date
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Header, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import reads
+import schemas
+import writes
+from database import db_manager
+
+router = APIRouter()
+
+
+# The reads build their responses in reads.py, as the sync routes do, through run_sync:
+# the same ETags, response cache entries and JSON whichever routes serve them
+
+@router.get("/habits/", response_model=List[schemas.HabitDetail])
+async def read_habits(
+    request: Request,
+    cursor: Optional[str] = None,
+    sort: schemas.HabitSort = schemas.HabitSort.id,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    recent_days: int = Query(0, ge=0, le=reads.MAX_RECENT_DAYS),
+    tags: Optional[str] = Query(None, description="Comma-separated tag names"),
+    match: schemas.TagMatch = schemas.TagMatch.any,
+    db: AsyncSession = Depends(db_manager.get_async_read_db),
+):
+    return await db.run_sync(reads.habits_response, request, cursor, sort, skip, limit, recent_days, tags, match)
+
+
+@router.get("/habits/with-stats/", response_model=List[schemas.HabitWithStats])
+async def read_habits_with_stats(
+    request: Request,
+    skip: int = 0,
+    limit: int = 100,
+    db: AsyncSession = Depends(db_manager.get_async_db),
+):
+    return await db.run_sync(reads.habits_with_stats_response, request, skip, limit)
+
+
+@router.get("/habits/logs", response_model=List[schemas.HabitLogState])
+@router.get("/habits/logs/", response_model=List[schemas.HabitLogState], include_in_schema=False)
+async def read_habit_logs(
+    request: Request,
+    day: Optional[date] = Query(None, alias="date"),
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    db: AsyncSession = Depends(db_manager.get_async_db),
+):
+    return await db.run_sync(reads.habit_logs_response, request, day, start, end)
+
+
+# ":int" lets non-numeric paths such as /habits/heatmap fall through to the sync routes
+@router.get("/habits/{habit_id:int}", response_model=schemas.HabitDetail)
+async def read_habit(
+    request: Request,
+    habit_id: int,
+    recent_days: int = Query(0, ge=0, le=reads.MAX_RECENT_DAYS),
+    db: AsyncSession = Depends(db_manager.get_async_read_db),
+):
+    return await db.run_sync(reads.habit_response, request, habit_id, recent_days)
+
+
+@router.post("/habits/{habit_id}/complete", response_model=schemas.HabitLog)
+async def complete_habit(
+    habit_id: int,
+    completion: Optional[schemas.HabitCompletion] = None,
+    idempotency_key: Optional[str] = Header(None),
+    db: AsyncSession = Depends(db_manager.get_async_db),
+):
+    return await db.run_sync(writes.write_completion, habit_id, completion, True, idempotency_key)
+
+
+@router.delete("/habits/{habit_id}/complete", response_model=schemas.HabitLog)
+async def uncomplete_habit(
+    habit_id: int,
+    completion: Optional[schemas.HabitCompletion] = None,
+    idempotency_key: Optional[str] = Header(None),
+    db: AsyncSession = Depends(db_manager.get_async_db),
+):
+    return await db.run_sync(writes.write_completion, habit_id, completion, False, idempotency_key)
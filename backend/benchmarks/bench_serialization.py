@@ -0,0 +1,101 @@
+"""Benchmark a 10k-habit /habits/ page: ORM instances + response_model vs column tuples + fastjson.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_serialization --rows 10000
+
+Both routes serve the same rows from an in-memory SQLite copy of the
+habits, tags and habit_tags tables through FastAPI, so the timings cover
+loading, validation and encoding. No Postgres is needed.
+"""
+import argparse
+import json
+import random
+import timeit
+from datetime import date, timedelta
+from typing import List
+
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import selectinload, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import models
+import schemas
+from database import Base
+from fastjson import json_list_response
+from reads import habit_dicts
+
+
+def seed(engine, rows: int, seed_value: int) -> None:
+    rng = random.Random(seed_value)
+    habit_tags = models.Habit.tags.property.secondary
+    Base.metadata.create_all(engine, tables=[models.Habit.__table__, models.Tag.__table__, habit_tags])
+    start = date.today() - timedelta(days=365)
+    with engine.begin() as conn:
+        conn.execute(insert(models.Tag), [{"id": i, "name": f"tag-{i}"} for i in range(1, 21)])
+        conn.execute(insert(models.Habit), [{
+            "id": i,
+            "title": f"Habit {i}",
+            "description": "Benchmark habit" if i % 3 else None,
+            "periodicity": rng.choice(list(models.PeriodicityEnum)),
+            "frequency": rng.randint(1, 5),
+            "start_date": start + timedelta(days=rng.randrange(365)),
+            "reminder": bool(i % 2),
+        } for i in range(1, rows + 1)])
+        conn.execute(insert(habit_tags), [
+            {"habit_id": i, "tag_id": tag_id}
+            for i in range(1, rows + 1) for tag_id in rng.sample(range(1, 21), 2)
+        ])
+
+
+def build_app(rows: int, seed_value: int) -> FastAPI:
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    seed(engine, rows, seed_value)
+    SessionLocal = sessionmaker(bind=engine)
+
+    def get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+
+    @app.get("/orm", response_model=List[schemas.HabitDetail])
+    def orm_path(db=Depends(get_db)):
+        return db.scalars(select(models.Habit).options(selectinload(models.Habit.tags)).order_by(models.Habit.id)).all()
+
+    @app.get("/fast", response_model=List[schemas.HabitDetail])
+    def fast_path(db=Depends(get_db)):
+        rows = db.execute(select(*models.Habit.__table__.c).order_by(models.Habit.id)).all()
+        return json_list_response(schemas.HabitDetail, habit_dicts(db, rows, 0))
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    client = TestClient(build_app(args.rows, args.seed))
+    orm_body, fast_body = client.get("/orm").content, client.get("/fast").content
+    # Tag order within a habit is not defined on the ORM path
+    normalize = lambda body: [dict(habit, tags=sorted(habit["tags"], key=lambda tag: tag["id"])) for habit in json.loads(body)]
+    assert normalize(orm_body) == normalize(fast_body), "paths disagree"
+    print(f"{args.rows} habits, {len(fast_body) / 1024:.0f} KiB of JSON")
+
+    timings = {}
+    for path in ("/orm", "/fast"):
+        timings[path] = min(timeit.repeat(lambda: client.get(path), number=1, repeat=args.repeat))
+        print(f"{path:>6}: best of {args.repeat}: {timings[path] * 1000:.1f} ms")
+    print(f"speedup: {timings['/orm'] / timings['/fast']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""Generate a large synthetic dataset of habits and logs for capacity planning.
+
+Run from the backend directory against a migrated database:
+
+    python -m benchmarks.generate_data --users 20000 --years 5 --workers 8
+
+Simulated users sign up during the first half of the window and take up
+``--habits-per-user`` of seed.py's sample habits, starting on their signup
+day. Logs follow the completion patterns of ``seed.run()``: a habit is
+completed on the days ``seed.completion_days`` allows with a rate of its
+own, drawn from a beta distribution per periodicity (``--daily-rate
+0.7:0.15`` is a mean of 0.7 with a standard deviation of 0.15). The schema
+has no users table; users only group habits by signup day.
+
+Habits and their tags are written first. Worker processes then generate the
+logs of ``--chunk-habits`` habits at a time and stream each chunk into
+``habit_logs`` with COPY, recomputing its streak states in the same
+transaction; the statement triggers keep the rollups current. A chunk
+depends only on ``--seed`` and its number, so the same options produce the
+same data with any number of workers.
+
+On one core the logs go in at about 30k rows/s with one worker or two, so
+100M rows take about an hour: the COPY, the rollup trigger and the streak
+recompute all compete for that core. Workers never wait on one another's
+locks (collection versions are inserts since migration 0006). How far the
+rate grows with more cores has not been measured.
+
+Every month of the window gets its partition up front; run
+``python partitions.py maintain`` afterwards to archive the months past
+``LOG_ARCHIVE_AFTER_MONTHS``. Days before the archive boundary of a database
+that already has archived months go through the restore trigger row by
+row, so generate into a fresh database.
+"""
+import argparse
+import csv
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from functools import partial
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+import seed
+from config import settings
+from models import PeriodicityEnum
+from partitions import add_months
+from streak_state import recompute_streak_states
+
+DEFAULT_RATE_STDDEV = 0.1
+
+RESERVE_IDS_SQL = text("SELECT nextval('habits_id_seq') FROM generate_series(1, :count)")
+
+# Set in each worker process
+_engine: Optional[Engine] = None
+
+
+class HabitSpec(NamedTuple):
+    habit_id: int
+    title: str
+    periodicity: PeriodicityEnum
+    select_days: Optional[str]
+    start_date: date
+    completion_rate: float
+
+
+def rate_distribution(value: str) -> Tuple[float, float]:
+    """Parse ``MEAN[:STDDEV]`` into the parameters of a beta distribution."""
+    mean, _, stddev = value.partition(":")
+    try:
+        mean, stddev = float(mean), float(stddev or DEFAULT_RATE_STDDEV)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected MEAN[:STDDEV], got {value!r}")
+    if not 0 < mean < 1 or not 0 < stddev ** 2 < mean * (1 - mean):
+        raise argparse.ArgumentTypeError(f"need 0 < MEAN < 1 and 0 < STDDEV < sqrt(MEAN * (1 - MEAN)), got {value!r}")
+    concentration = mean * (1 - mean) / stddev ** 2 - 1
+    return mean * concentration, (1 - mean) * concentration
+
+
+def plan_habits(rng: np.random.Generator, users: int, habits_per_user: int, first_day: date, last_day: date,
+                rates: Dict[PeriodicityEnum, Tuple[float, float]]) -> Iterator[Tuple[dict, date, float]]:
+    """Sample habit, start date and completion rate of every habit of every user."""
+    signup_days = max((last_day - first_day).days // 2, 1)
+    catalog = seed.SAMPLE_HABITS
+    for _ in range(users):
+        signup = first_day + timedelta(days=int(rng.integers(signup_days)))
+        for index in rng.choice(len(catalog), habits_per_user, replace=habits_per_user > len(catalog)):
+            habit = catalog[index]
+            yield habit, signup, float(rng.beta(*rates[habit["periodicity"]]))
+
+
+def insert_habits(db: Session, planned: List[Tuple[dict, date, float]]) -> List[HabitSpec]:
+    """COPY the planned habits and their tags; returns them with their ids."""
+    habit_ids = db.execute(RESERVE_IDS_SQL, {"count": len(planned)}).scalars().all()
+    db.execute(text("INSERT INTO tags (name) SELECT unnest(:names) ON CONFLICT (name) DO NOTHING"),
+               {"names": seed.TAG_NAMES})
+    tag_ids = dict(db.execute(text("SELECT name, id FROM tags WHERE name = ANY(:names)"),
+                              {"names": seed.TAG_NAMES}).all())
+
+    habits, habit_rows, tag_rows = [], io.StringIO(), io.StringIO()
+    habit_writer, tag_writer = csv.writer(habit_rows), csv.writer(tag_rows)
+    for habit_id, (habit, start_date, rate) in zip(habit_ids, planned):
+        habit_writer.writerow((habit_id, habit["title"], habit["description"], habit["periodicity"].value,
+                               habit["frequency"], habit.get("select_days"), start_date, habit["reminder"],
+                               habit["icon"]))
+        tag_writer.writerows((habit_id, tag_ids[name]) for name in habit["tag_names"])
+        habits.append(HabitSpec(habit_id, habit["title"], habit["periodicity"], habit.get("select_days"),
+                                start_date, rate))
+
+    cursor = db.connection().connection.cursor()
+    habit_rows.seek(0)
+    cursor.copy_expert("COPY habits (id, title, description, periodicity, frequency, select_days, start_date, "
+                       "reminder, icon) FROM STDIN WITH (FORMAT csv)", habit_rows)
+    tag_rows.seek(0)
+    cursor.copy_expert("COPY habit_tags (habit_id, tag_id) FROM STDIN WITH (FORMAT csv)", tag_rows)
+    return habits
+
+
+def create_partitions(engine: Engine, first_day: date, last_day: date) -> int:
+    """Create the partition of every month from ``first_day`` to ``last_day``; returns the number created."""
+    created, month = 0, add_months(first_day, 0)
+    while month <= last_day:
+        with engine.begin() as conn:
+            created += conn.execute(text("SELECT create_habit_log_partition(:month)"), {"month": month}).scalar()
+        month = add_months(month, 1)
+    return created
+
+
+def _init_worker() -> None:
+    global _engine
+    _engine = create_engine(settings.database_url)
+
+
+def chunk_logs(rng: np.random.Generator, habits: List[HabitSpec], last_day: date) -> Tuple[io.StringIO, int]:
+    """The completed logs of ``habits`` up to ``last_day`` as CSV for COPY; returns the buffer and its row count."""
+    buffer, rows = io.StringIO(), 0
+    end = np.datetime64(last_day + timedelta(days=1), "D")
+    for habit in habits:
+        days = np.arange(np.datetime64(habit.start_date, "D"), end)
+        days = days[seed.completion_days(habit.periodicity, habit.select_days, days)]
+        days = days[rng.random(len(days)) < habit.completion_rate]
+        hours = rng.integers(6, 23, len(days))
+        note = '"' + f"Completed {habit.title}".replace('"', '""') + '"'
+        buffer.writelines(
+            f"{habit.habit_id},{day},t,{note},{day} {hour:02d}:00,{day} {hour:02d}:00\n"
+            for day, hour in zip(np.datetime_as_string(days).tolist(), hours.tolist())
+        )
+        rows += len(days)
+    buffer.seek(0)
+    return buffer, rows
+
+
+def write_logs(db: Session, rng: np.random.Generator, habits: List[HabitSpec], last_day: date) -> int:
+    """COPY generated logs of ``habits`` and stage their streak states, without committing; returns the rows written."""
+    buffer, rows = chunk_logs(rng, habits, last_day)
+    cursor = db.connection().connection.cursor()
+    cursor.copy_expert("COPY habit_logs (habit_id, log_date, completed, notes, completed_at, created_at) "
+                       "FROM STDIN WITH (FORMAT csv)", buffer)
+    recompute_streak_states(db, [habit.habit_id for habit in habits])
+    return rows
+
+
+def write_chunk(chunk: Tuple[int, List[HabitSpec]], last_day: date, seed_value: int) -> int:
+    """Generate and write one chunk in a transaction; returns the rows written."""
+    chunk_no, habits = chunk
+    with Session(_engine) as db:
+        rows = write_logs(db, np.random.default_rng([seed_value, chunk_no]), habits, last_day)
+        db.commit()
+    return rows
+
+
+def generate(users: int, habits_per_user: int, years: float, last_day: date,
+             rates: Dict[PeriodicityEnum, Tuple[float, float]], workers: int, chunk_habits: int,
+             seed_value: int) -> Tuple[int, int]:
+    """Write the habits and logs of ``users`` simulated users; returns the numbers of habits and logs."""
+    first_day = last_day - timedelta(days=round(365.25 * years))
+    rng = np.random.default_rng(seed_value)
+
+    engine = create_engine(settings.database_url)
+    try:
+        with Session(engine) as db:
+            habits = insert_habits(db, list(plan_habits(rng, users, habits_per_user, first_day, last_day, rates)))
+            db.commit()
+        print(f"Created {len(habits)} habits for {users} users")
+        print(f"Created {create_partitions(engine, first_day, last_day)} partition(s)")
+    finally:
+        # Workers open their own connections
+        engine.dispose()
+
+    chunks = [(chunk_no, habits[i:i + chunk_habits])
+              for chunk_no, i in enumerate(range(0, len(habits), chunk_habits))]
+    written = 0
+    started = time.perf_counter()
+    with ProcessPoolExecutor(workers, initializer=_init_worker) as pool:
+        for done, rows in enumerate(pool.map(partial(write_chunk, last_day=last_day, seed_value=seed_value),
+                                             chunks), 1):
+            written += rows
+            elapsed = time.perf_counter() - started
+            print(f"chunk {done}/{len(chunks)}: {written} logs, {written / elapsed:,.0f} rows/s", flush=True)
+    elapsed = time.perf_counter() - started
+
+    engine = create_engine(settings.database_url)
+    try:
+        with engine.connect() as conn:
+            # The planner should see the new sizes before anything is measured
+            conn.execute(text("ANALYZE habits"))
+            conn.execute(text("ANALYZE habit_logs"))
+            conn.commit()
+    finally:
+        engine.dispose()
+    print(f"Wrote {written} logs in {elapsed:.1f}s ({written / max(elapsed, 1e-9):,.0f} rows/s)")
+    return len(habits), written
+
+
+def default_rates() -> Dict[PeriodicityEnum, Tuple[float, float]]:
+    """seed.py's completion rates with the default spread"""
+    return {periodicity: rate_distribution(f"{rate}:{DEFAULT_RATE_STDDEV}")
+            for periodicity, rate in seed.COMPLETION_RATES.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--habits-per-user", type=int, default=6)
+    parser.add_argument("--years", type=float, default=2)
+    parser.add_argument("--end-date", type=date.fromisoformat, default=date.today(),
+                        help="last day with logs (default: today)")
+    for periodicity in PeriodicityEnum:
+        parser.add_argument(f"--{periodicity.value}-rate", type=rate_distribution, metavar="MEAN[:STDDEV]",
+                            default=f"{seed.COMPLETION_RATES[periodicity]}:{DEFAULT_RATE_STDDEV}",
+                            help=f"completion rate of {periodicity.value} habits on the days they can be completed")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk-habits", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rates = {periodicity: getattr(args, f"{periodicity.value}_rate") for periodicity in PeriodicityEnum}
+    generate(args.users, args.habits_per_user, args.years, args.end_date, rates, args.workers, args.chunk_habits,
+             args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""In-process load harness for every API route.
+
+Part of the benchmark suite (see benchmarks/suite.py). Requests go straight
+to ``main.app`` through httpx's ASGI transport: no server, sockets or
+other processes, so the numbers cover routing, validation, the handlers,
+their queries and serialization. Each route gets ``requests`` requests
+from ``concurrency`` concurrent clients, after ``warmup`` unrecorded ones;
+latency percentiles and throughput are reported per route.
+
+Reads pick random seeded habits. Writes only touch habits and tags the
+harness creates itself, which are deleted at the end. ``ROUTES`` must cover
+every route of the app: one without a scenario stops the run, unless it is
+in ``EXCLUDED``.
+"""
+import asyncio
+import itertools
+import random
+import time
+import uuid
+from datetime import date, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import httpx
+from fastapi import FastAPI
+from fastapi.routing import APIRoute
+from sqlalchemy import text
+
+from benchmarks.load_async import percentile
+from database import db_manager
+
+# Routes the harness leaves alone, with the reason
+EXCLUDED = {
+    "GET /events": "streams until the client disconnects",
+}
+
+# Scratch habits the write routes spread over
+SCRATCH_HABITS = 20
+BULK_ROWS = 50
+
+
+class LoadContext:
+    """What the scenarios draw their requests from"""
+
+    def __init__(self, habit_ids: List[int], seed_value: int):
+        self.habit_ids = habit_ids
+        self.rng = random.Random(seed_value)
+        self.today = date.today()
+        self.run_id = uuid.uuid4().hex[:8]
+        self.counter = itertools.count()
+        # Habits created by the harness: written to by the write routes, deleted by DELETE /habits/{habit_id}
+        self.scratch: List[int] = []
+        self.created: List[int] = []
+        self.tag_ids: List[int] = []
+
+    def habit_id(self) -> int:
+        return self.rng.choice(self.habit_ids)
+
+    def scratch_id(self) -> int:
+        return self.rng.choice(self.scratch)
+
+    def recent_day(self, days: int = 60) -> str:
+        return (self.today - timedelta(days=self.rng.randrange(days))).isoformat()
+
+    def habit_payload(self) -> dict:
+        return {
+            "title": f"benchmark {self.run_id} {next(self.counter)}",
+            "periodicity": "daily",
+            "frequency": 1,
+            "start_date": (self.today - timedelta(days=90)).isoformat(),
+            "tag_ids": self.tag_ids[:1],
+        }
+
+
+# method, url and httpx request arguments
+Request = Tuple[str, str, dict]
+
+
+class Scenario(NamedTuple):
+    build: Callable[[LoadContext], Request]
+    # Called with each successful response
+    after: Optional[Callable[[LoadContext, httpx.Response], None]] = None
+
+
+def _heatmap_params(ctx: LoadContext, habits: int) -> dict:
+    return {"habit_ids": [ctx.habit_id() for _ in range(habits)],
+            "start": (ctx.today - timedelta(days=364)).isoformat(), "end": ctx.today.isoformat()}
+
+
+def _bulk_rows(ctx: LoadContext) -> list:
+    habit_id = ctx.scratch_id()
+    return [{"habit_id": habit_id, "log_date": ctx.recent_day(), "completed": ctx.rng.random() < 0.8}
+            for _ in range(BULK_ROWS)]
+
+
+# Keyed "<METHOD> <path>" as in the app's routes, in the order they run: reads first, so
+# the writes' dead rows do not slow them down
+ROUTES: Dict[str, Scenario] = {
+    "GET /tags/": Scenario(lambda ctx: ("GET", "/tags/", {"params": {"with_counts": ctx.rng.random() < 0.5}})),
+    "GET /habits/": Scenario(
+        lambda ctx: ("GET", "/habits/", {"params": {"limit": 100, "skip": ctx.rng.randrange(len(ctx.habit_ids)),
+                                                    "recent_days": ctx.rng.choice([0, 7])}})),
+    "GET /habits/with-stats/": Scenario(
+        lambda ctx: ("GET", "/habits/with-stats/", {"params": {"limit": 20,
+                                                               "skip": ctx.rng.randrange(len(ctx.habit_ids))}})),
+    "GET /habits/{habit_id}": Scenario(
+        lambda ctx: ("GET", f"/habits/{ctx.habit_id()}", {"params": {"recent_days": ctx.rng.choice([0, 7])}})),
+    "GET /habits/logs": Scenario(lambda ctx: ("GET", "/habits/logs", {"params": {"date": ctx.recent_day(7)}})),
+    "GET /habits/heatmap": Scenario(lambda ctx: ("GET", "/habits/heatmap", {"params": _heatmap_params(ctx, 20)})),
+    "GET /habits/{habit_id}/heatmap": Scenario(
+        lambda ctx: ("GET", f"/habits/{ctx.habit_id()}/heatmap",
+                     {"params": {k: v for k, v in _heatmap_params(ctx, 0).items() if k != "habit_ids"}})),
+    "GET /analytics/completion": Scenario(
+        lambda ctx: ("GET", "/analytics/completion",
+                     {"params": {"start": (ctx.today - timedelta(days=89)).isoformat(), "end": ctx.today.isoformat(),
+                                 "group_by": ctx.rng.choice([["habit"], ["tag"], ["periodicity", "week"]])}})),
+    "GET /metrics/db-pool": Scenario(lambda ctx: ("GET", "/metrics/db-pool", {})),
+    "GET /metrics/cache": Scenario(lambda ctx: ("GET", "/metrics/cache", {})),
+    "GET /metrics/events": Scenario(lambda ctx: ("GET", "/metrics/events", {})),
+    "POST /tags/": Scenario(
+        lambda ctx: ("POST", "/tags/", {"json": {"name": f"benchmark {ctx.run_id} {next(ctx.counter)}"}})),
+    "POST /habits/": Scenario(
+        lambda ctx: ("POST", "/habits/", {"json": ctx.habit_payload()}),
+        lambda ctx, response: ctx.created.append(response.json()["id"]),
+    ),
+    "DELETE /habits/{habit_id}": Scenario(lambda ctx: ("DELETE", f"/habits/{ctx.created.pop()}", {})),
+    "POST /habits/{habit_id}/complete": Scenario(
+        lambda ctx: ("POST", f"/habits/{ctx.scratch_id()}/complete", {"json": {"log_date": ctx.recent_day()}})),
+    "DELETE /habits/{habit_id}/complete": Scenario(
+        lambda ctx: ("DELETE", f"/habits/{ctx.scratch_id()}/complete", {"json": {"log_date": ctx.recent_day()}})),
+    "POST /habits/logs/bulk": Scenario(lambda ctx: ("POST", "/habits/logs/bulk", {"json": _bulk_rows(ctx)})),
+}
+
+
+def app_routes(app: FastAPI) -> List[str]:
+    """The app's documented routes as ``"<METHOD> <path>"``"""
+    return [f"{method} {route.path}" for route in app.routes
+            if isinstance(route, APIRoute) and route.include_in_schema for method in sorted(route.methods)]
+
+
+def check_coverage(app: FastAPI) -> None:
+    missing = sorted(set(app_routes(app)) - set(ROUTES) - set(EXCLUDED))
+    if missing:
+        raise SystemExit(f"No load scenario for {', '.join(missing)}; add one to benchmarks/load.py ROUTES")
+
+
+async def _send(client: httpx.AsyncClient, ctx: LoadContext, scenario: Scenario) -> Tuple[float, Optional[int]]:
+    """One request; returns its latency and, if it failed, its status"""
+    method, url, kwargs = scenario.build(ctx)
+    started = time.perf_counter()
+    response = await client.request(method, url, **kwargs)
+    elapsed = time.perf_counter() - started
+    if response.status_code >= 400:
+        return elapsed, response.status_code
+    if scenario.after:
+        scenario.after(ctx, response)
+    return elapsed, None
+
+
+async def run_route(client: httpx.AsyncClient, ctx: LoadContext, scenario: Scenario,
+                    requests: int, concurrency: int, warmup: int) -> dict:
+    """Latency percentiles (ms), throughput (req/s) and failures of ``requests`` requests"""
+    for _ in range(warmup):
+        await _send(client, ctx, scenario)
+
+    remaining = itertools.count(requests, -1)
+    latencies, errors = [], []
+
+    async def client_loop():
+        while next(remaining) > 0:
+            elapsed, error = await _send(client, ctx, scenario)
+            if error is None:
+                latencies.append(elapsed)
+            else:
+                errors.append(error)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    result = {f"p{int(q * 100)}_ms": percentile(latencies, q) * 1000 for q in (0.5, 0.95, 0.99)}
+    result.update(requests=len(latencies), errors=len(errors), throughput=len(latencies) / elapsed)
+    if errors:
+        result["error_statuses"] = sorted(set(errors))
+    return result
+
+
+async def _set_up(client: httpx.AsyncClient, ctx: LoadContext) -> None:
+    response = await client.post("/tags/", json={"name": f"benchmark {ctx.run_id}"})
+    response.raise_for_status()
+    ctx.tag_ids.append(response.json()["id"])
+    for _ in range(SCRATCH_HABITS):
+        response = await client.post("/habits/", json=ctx.habit_payload())
+        response.raise_for_status()
+        ctx.scratch.append(response.json()["id"])
+
+
+async def _clean_up(client: httpx.AsyncClient, ctx: LoadContext) -> None:
+    for habit_id in ctx.scratch + ctx.created:
+        await client.delete(f"/habits/{habit_id}")
+    # There is no route for deleting tags
+    db = db_manager.SessionLocal()
+    try:
+        db.execute(text("DELETE FROM tags WHERE name LIKE :prefix"), {"prefix": f"benchmark {ctx.run_id}%"})
+        db.commit()
+    finally:
+        db.close()
+
+
+async def run_load(app: FastAPI, habit_ids: List[int], requests: int, concurrency: int, warmup: int,
+                   seed_value: int) -> Dict[str, dict]:
+    """Load every route of a started ``app`` in turn; keyed like ``ROUTES``."""
+    check_coverage(app)
+    ctx = LoadContext(habit_ids, seed_value)
+    routes = set(app_routes(app))
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        await _set_up(client, ctx)
+        try:
+            for key, scenario in ROUTES.items():
+                if key not in routes:
+                    continue
+                results[key] = await run_route(client, ctx, scenario, requests, concurrency, warmup)
+                result = results[key]
+                print(f"  {key:<36} p50 {result['p50_ms']:8.2f}  p95 {result['p95_ms']:8.2f}  "
+                      f"p99 {result['p99_ms']:8.2f} ms  {result['throughput']:8.1f} req/s"
+                      + (f"  {result['errors']} failed {result['error_statuses']}" if result["errors"] else ""),
+                      flush=True)
+        finally:
+            await _clean_up(client, ctx)
+    return results
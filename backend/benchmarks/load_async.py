@@ -0,0 +1,97 @@
+"""Load test comparing the sync and async database layers.
+
+Start the API once per mode and point this at it, e.g. from the backend
+directory:
+
+    DATABASE_ASYNC=false uvicorn main:app --port 8000
+    python -m benchmarks.load_async --url http://localhost:8000 --clients 500 --duration 30
+
+    DATABASE_ASYNC=true uvicorn main:app --port 8000
+    python -m benchmarks.load_async --url http://localhost:8000 --clients 500 --duration 30
+
+Each client loops over a mix of hot reads and completion writes for
+``--duration`` seconds; throughput and latency percentiles are printed at the end.
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import date
+
+import httpx
+
+DEFAULT_PATHS = ("/habits/with-stats/?limit=20", "/habits/logs?date={today}", "/habits/{habit_id}")
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+async def client_loop(client: httpx.AsyncClient, habit_ids: list, paths: list, write_ratio: float,
+                      deadline: float, rng: random.Random, latencies: list, errors: list) -> None:
+    today = date.today().isoformat()
+    while time.perf_counter() < deadline:
+        habit_id = rng.choice(habit_ids)
+        started = time.perf_counter()
+        try:
+            if rng.random() < write_ratio:
+                response = await client.post(f"/habits/{habit_id}/complete")
+            else:
+                response = await client.get(rng.choice(paths).format(today=today, habit_id=habit_id))
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+                continue
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+async def run(args) -> None:
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+        habits = (await client.get("/habits/", params={"limit": 1000})).json()
+        habit_ids = [habit["id"] for habit in habits]
+        if not habit_ids:
+            raise SystemExit("No habits to load test against; seed the database first")
+
+        latencies, errors = [], []
+        deadline = time.perf_counter() + args.duration
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            client_loop(client, habit_ids, args.paths, args.write_ratio, deadline,
+                        random.Random(args.seed + i), latencies, errors)
+            for i in range(args.clients)
+        ))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"{args.clients} clients for {elapsed:.1f}s against {args.url}")
+    print(f"  requests: {len(latencies)} ok, {len(errors)} failed")
+    print(f"  throughput: {len(latencies) / elapsed:.1f} req/s")
+    print("  latency ms: " + "  ".join(
+        f"p{int(q * 100)}={percentile(latencies, q) * 1000:.1f}" for q in (0.5, 0.95, 0.99)
+    ))
+    if errors:
+        print(f"  first errors: {errors[:10]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--write-ratio", type=float, default=0.1)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--path", dest="paths", action="append",
+                        help="Read path to request; {today} and {habit_id} are filled in (repeatable)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    args.paths = args.paths or list(DEFAULT_PATHS)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
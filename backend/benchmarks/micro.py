@@ -0,0 +1,89 @@
+"""Micro-benchmarks of the ``Habit`` streak and completion methods.
+
+Part of the benchmark suite (see benchmarks/suite.py). For every periodicity
+and each of ``HISTORY_DAYS`` a habit of seed.py's catalog is created with
+that much generated history, the methods are timed on it ``repeat`` times,
+and the habits are deleted again. The session is expired before every call,
+so each one reads from the database as a request would; ``mark_completed``
+is timed on a day that was just marked incomplete, so every call changes
+the streak.
+"""
+import time
+from datetime import date, timedelta
+from typing import Callable, Dict, List
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+import seed
+from benchmarks.generate_data import HabitSpec, insert_habits, write_logs
+from benchmarks.load_async import percentile
+from models import Habit, PeriodicityEnum
+
+HISTORY_DAYS = (30, 365, 1825)
+
+# One sample habit per periodicity
+SUBJECTS = {
+    PeriodicityEnum.daily: "Drink 8 glasses of water",
+    PeriodicityEnum.weekly: "Learn something new",
+    PeriodicityEnum.monthly: "Review monthly budget",
+}
+
+METHODS: Dict[str, Callable[[Habit, Session], object]] = {
+    "get_current_streak": lambda habit, db: habit.get_current_streak(db),
+    "get_longest_streak": lambda habit, db: habit.get_longest_streak(db),
+    "is_completed_today": lambda habit, db: habit.is_completed_today(db),
+    "mark_completed": lambda habit, db: habit.mark_completed(db),
+}
+
+
+def create_subjects(db: Session, today: date, seed_value: int) -> List[HabitSpec]:
+    """Create and commit one habit per periodicity and history length, with generated logs."""
+    catalog = {habit["title"]: habit for habit in seed.SAMPLE_HABITS}
+    planned = [
+        (catalog[title], today - timedelta(days=days - 1),
+         seed.completion_rate(title, periodicity, catalog[title].get("select_days")))
+        for periodicity, title in SUBJECTS.items()
+        for days in HISTORY_DAYS
+    ]
+    habits = insert_habits(db, planned)
+    write_logs(db, np.random.default_rng(seed_value), habits, today)
+    db.commit()
+    return habits
+
+
+def time_method(db: Session, habit: Habit, name: str, repeat: int) -> dict:
+    """Median and 95th percentile of ``repeat`` calls, in milliseconds."""
+    method = METHODS[name]
+    timings = []
+    for _ in range(repeat):
+        if name == "mark_completed":
+            habit.mark_incomplete(db)
+        db.expire_all()
+        started = time.perf_counter()
+        method(habit, db)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return {"median_ms": percentile(timings, 0.5) * 1000, "p95_ms": percentile(timings, 0.95) * 1000}
+
+
+def run_micro(db: Session, repeat: int, seed_value: int) -> Dict[str, dict]:
+    """Time every method on every subject habit; keyed ``"<method> <periodicity> <days>d"``."""
+    today = date.today()
+    subjects = create_subjects(db, today, seed_value)
+    results = {}
+    try:
+        for subject in subjects:
+            habit = db.get(Habit, subject.habit_id)
+            days = (today - subject.start_date).days + 1
+            for name in METHODS:
+                key = f"{name} {subject.periodicity.value} {days}d"
+                results[key] = time_method(db, habit, name, repeat)
+                print(f"  {key:<40} median {results[key]['median_ms']:8.3f} ms  "
+                      f"p95 {results[key]['p95_ms']:8.3f} ms", flush=True)
+    finally:
+        db.rollback()
+        for subject in subjects:
+            db.delete(db.get(Habit, subject.habit_id))
+        db.commit()
+    return results
@@ -0,0 +1,245 @@
+"""Reproducible benchmark suite: Habit methods and every API route at fixed data scales.
+
+Run from the backend directory against a local Postgres database of its own
+(DATABASE_URL). Seed it once per scale, then run the suite:
+
+    python -m benchmarks.suite seed --scale small
+    python -m benchmarks.suite run --scale small --update-baseline   # on the reference build
+    python -m benchmarks.suite run --scale small                     # on a change
+
+``seed`` fills an empty database through benchmarks.generate_data with the
+scale's fixed parameters and RNG seed. ``run`` times the ``Habit`` methods
+(benchmarks/micro.py) and loads every route in-process
+(benchmarks/load.py), writes the results as JSON to ``--output`` and
+compares them with the baseline: a method's median or a route's p50 or
+p95 more than ``--tolerance`` slower than the baseline, a route's
+throughput lower by the same margin, or any failed request fails the run
+(exit status 1). Differences below
+``--min-delta-ms`` are noise and never fail it. ``--update-baseline``
+stores the results as the new baseline instead. ``compare`` compares two
+result files.
+
+Baselines are only comparable on the same machine and configuration;
+each result records both.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+from datetime import date, datetime
+from pathlib import Path
+from typing import List, NamedTuple
+
+from sqlalchemy import text
+
+import main as api
+from benchmarks import generate_data
+from benchmarks.load import run_load
+from benchmarks.micro import run_micro
+from config import settings
+from database import db_manager
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+SEED = 42
+
+
+class Scale(NamedTuple):
+    users: int
+    habits_per_user: int
+    years: float
+
+
+SCALES = {
+    "small": Scale(users=200, habits_per_user=6, years=2),
+    "medium": Scale(users=2000, habits_per_user=6, years=3),
+    "large": Scale(users=20000, habits_per_user=6, years=5),
+}
+
+# (metric, whether higher is better) compared against the baseline; a p95 over a hundred
+# sub-millisecond calls is one outlier, so the Habit methods are compared on their median
+MICRO_METRICS = (("median_ms", False),)
+ROUTE_METRICS = (("p50_ms", False), ("p95_ms", False), ("throughput", True))
+
+# Tables the benchmarks write to and clean up after
+VACUUMED_TABLES = ("habits", "habit_tags", "tags", "habit_logs", "habit_streak_states", "habit_completion_rollups",
+                   "collection_changes")
+
+
+def _scale_habits(scale: Scale) -> int:
+    return scale.users * scale.habits_per_user
+
+
+def seed_scale(name: str, workers: int) -> None:
+    scale = SCALES[name]
+    db_manager.initialize_database()
+    db = db_manager.SessionLocal()
+    try:
+        if db.execute(text("SELECT EXISTS (SELECT 1 FROM habits)")).scalar():
+            raise SystemExit("The database already has habits; seed an empty one")
+    finally:
+        db.close()
+    generate_data.generate(scale.users, scale.habits_per_user, scale.years, date.today(),
+                           generate_data.default_rates(), workers, 500, SEED)
+
+
+def _environment(db) -> dict:
+    return {
+        "python": platform.python_version(),
+        "postgres": db.execute(text("SHOW server_version")).scalar(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "database_async": settings.database_async,
+        "cache_backend": settings.cache_backend,
+        "completion_index": settings.completion_index_enabled,
+    }
+
+
+def _vacuum() -> None:
+    """Clear the dead rows a part left behind, so the next one (or the next run) starts from the same state."""
+    with db_manager.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for table in VACUUMED_TABLES:
+            conn.execute(text(f"VACUUM (ANALYZE) {table}"))
+
+
+async def _run(args) -> dict:
+    # Startup and shutdown handlers run as under a server
+    async with api.app.router.lifespan_context(api.app):
+        db = db_manager.SessionLocal()
+        try:
+            habit_ids = db.execute(text("SELECT id FROM habits ORDER BY id")).scalars().all()
+            expected = _scale_habits(SCALES[args.scale])
+            if len(habit_ids) != expected:
+                raise SystemExit(f"Expected the {expected} habits of the {args.scale} scale, found {len(habit_ids)}; "
+                                 f"run 'python -m benchmarks.suite seed --scale {args.scale}' on an empty database")
+            results = {
+                "scale": args.scale,
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "environment": _environment(db),
+                "data": {
+                    "habits": len(habit_ids),
+                    "logs": db.execute(text("SELECT COUNT(*) FROM habit_logs")).scalar(),
+                    "last_log_date": str(db.execute(text("SELECT MAX(log_date) FROM habit_logs")).scalar()),
+                },
+            }
+            if "micro" in args.parts:
+                print("Habit methods:")
+                results["micro"] = run_micro(db, args.repeat, SEED)
+        finally:
+            db.close()
+        _vacuum()
+        if "routes" in args.parts:
+            print("Routes:")
+            results["routes"] = await run_load(api.app, habit_ids, args.requests, args.concurrency, args.warmup, SEED)
+            _vacuum()
+    return results
+
+
+class Regression(NamedTuple):
+    name: str
+    metric: str
+    baseline: float
+    current: float
+
+
+def compare(baseline: dict, current: dict, tolerance: float, min_delta_ms: float) -> List[Regression]:
+    """Metrics that got worse than ``baseline`` by more than ``tolerance``; failed requests count as regressions."""
+    regressions = []
+    for section, metrics in (("micro", MICRO_METRICS), ("routes", ROUTE_METRICS)):
+        for name, result in current.get(section, {}).items():
+            if result.get("errors"):
+                regressions.append(Regression(name, "errors", 0, result["errors"]))
+            before = baseline.get(section, {}).get(name)
+            if before is None:
+                continue
+            for metric, higher_is_better in metrics:
+                old, new = before[metric], result[metric]
+                if higher_is_better:
+                    worse = new < old / (1 + tolerance)
+                else:
+                    worse = new > old * (1 + tolerance) and new - old >= min_delta_ms
+                if worse:
+                    regressions.append(Regression(name, metric, old, new))
+    return regressions
+
+
+def report(baseline: dict, current: dict, args) -> int:
+    if baseline.get("scale") != current.get("scale"):
+        raise SystemExit(f"Baseline is for the {baseline.get('scale')} scale, results for {current.get('scale')}")
+    if baseline.get("environment") != current.get("environment"):
+        print(f"Warning: baseline environment {baseline.get('environment')} differs from {current.get('environment')}")
+    regressions = compare(baseline, current, args.tolerance, args.min_delta_ms)
+    for regression in regressions:
+        change = (f"{regression.current / regression.baseline - 1:+.0%}" if regression.baseline else "new")
+        print(f"REGRESSION {regression.name} {regression.metric}: "
+              f"{regression.baseline:.2f} -> {regression.current:.2f} ({change})")
+    print(f"{len(regressions)} regression(s) against the baseline "
+          f"(tolerance {args.tolerance:.0%}, min delta {args.min_delta_ms} ms)")
+    return 1 if regressions else 0
+
+
+def _read(path: Path) -> dict:
+    return json.loads(path.read_text())
+
+
+def _write(path: Path, results: dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(results, indent=2) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = subparsers.add_parser("seed", help="fill an empty database at a fixed scale")
+    seed_parser.add_argument("--scale", choices=SCALES, default="small")
+    seed_parser.add_argument("--workers", type=int, default=os.cpu_count())
+
+    run_parser = subparsers.add_parser("run", help="run the benchmarks and compare them with the baseline")
+    run_parser.add_argument("--scale", choices=SCALES, default="small")
+    run_parser.add_argument("--part", dest="parts", action="append", choices=["micro", "routes"],
+                            help="run only this part (repeatable; default: both)")
+    run_parser.add_argument("--repeat", type=int, default=100, help="calls per Habit method and history size")
+    run_parser.add_argument("--requests", type=int, default=200, help="requests per route")
+    run_parser.add_argument("--concurrency", type=int, default=8)
+    run_parser.add_argument("--warmup", type=int, default=10, help="unrecorded requests per route")
+    run_parser.add_argument("--output", type=Path, help="default: benchmarks/results/<scale>-<time>.json")
+    run_parser.add_argument("--baseline", type=Path, help="default: benchmarks/baselines/<scale>.json")
+    run_parser.add_argument("--update-baseline", action="store_true", help="store the results as the baseline")
+
+    compare_parser = subparsers.add_parser("compare", help="compare a results file with a baseline")
+    compare_parser.add_argument("baseline", type=Path)
+    compare_parser.add_argument("results", type=Path)
+
+    for subparser in (run_parser, compare_parser):
+        subparser.add_argument("--tolerance", type=float, default=0.25,
+                               help="allowed slowdown as a fraction of the baseline")
+        subparser.add_argument("--min-delta-ms", type=float, default=1.0,
+                               help="latency differences below this never count as regressions")
+    args = parser.parse_args()
+
+    if args.command == "seed":
+        seed_scale(args.scale, args.workers)
+        return
+    if args.command == "compare":
+        sys.exit(report(_read(args.baseline), _read(args.results), args))
+
+    args.parts = args.parts or ["micro", "routes"]
+    results = asyncio.run(_run(args))
+    output = args.output or BENCHMARKS_DIR / "results" / f"{args.scale}-{datetime.now():%Y%m%d-%H%M%S}.json"
+    _write(output, results)
+    print(f"Results written to {output}")
+
+    baseline = args.baseline or BENCHMARKS_DIR / "baselines" / f"{args.scale}.json"
+    if args.update_baseline:
+        _write(baseline, results)
+        print(f"Baseline stored at {baseline}")
+    elif baseline.exists():
+        sys.exit(report(_read(baseline), results, args))
+    else:
+        print(f"No baseline at {baseline}; store one with --update-baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""Bulk habit-log ingestion.
+
+Rows are validated in Python, streamed into a temporary staging table with
+COPY and merged into ``habit_logs`` with one
+``INSERT ... ON CONFLICT (habit_id, log_date)``. Within a batch the last row
+for a (habit, date) pair wins. Derived state (streak states, the completion
+index) is refreshed once per batch for the affected habits; the completion
+rollups follow the merge through triggers on ``habit_logs``.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime
+from typing import Any, AsyncIterator, Iterable, List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+import events
+from completion_index import record_bulk_write
+from streak_state import recompute_streak_states
+
+MAX_REPORTED_REJECTS = 1000
+
+# Merges at least this large refresh the planner statistics of the partitions they wrote
+ANALYZE_AFTER_ROWS = 10000
+
+INT32_MIN, INT32_MAX = -2 ** 31, 2 ** 31 - 1
+
+CREATE_STAGING_SQL = text("""
+    CREATE TEMP TABLE habit_log_import (
+        row_no integer NOT NULL,
+        habit_id integer NOT NULL,
+        log_date date NOT NULL,
+        completed boolean NOT NULL,
+        notes text,
+        completed_at timestamp
+    ) ON COMMIT DROP
+""")
+
+UNKNOWN_HABITS_SQL = text("""
+    SELECT s.row_no, s.habit_id
+    FROM habit_log_import s
+    WHERE NOT EXISTS (SELECT 1 FROM habits h WHERE h.id = s.habit_id)
+    ORDER BY s.row_no
+""")
+
+# Archived months the batch writes to become live rows first (see partitions.py)
+RESTORE_ARCHIVED_SQL = text("""
+    SELECT restore_archived_habit_log_month(a.habit_id, a.month)
+    FROM habit_log_archive a
+    WHERE (a.habit_id, a.month) IN (
+        SELECT DISTINCT habit_id, date_trunc('month', log_date)::date FROM habit_log_import
+    )
+""")
+
+# RETURNING cannot read xmax from a partitioned table, so new rows are told apart by
+# their created_at: the merge's statement time, which no earlier statement (not even a
+# restore of archived days in this transaction, stamped with now()) can have written
+MERGE_SQL = text("""
+    WITH staged AS (
+        SELECT DISTINCT ON (s.habit_id, s.log_date)
+               s.habit_id, s.log_date, s.completed, s.notes,
+               CASE WHEN s.completed THEN COALESCE(s.completed_at, now()) END AS completed_at
+        FROM habit_log_import s
+        JOIN habits h ON h.id = s.habit_id
+        ORDER BY s.habit_id, s.log_date, s.row_no DESC
+    ),
+    merged AS (
+        INSERT INTO habit_logs (habit_id, log_date, completed, notes, completed_at, created_at)
+        SELECT habit_id, log_date, completed, notes, completed_at, statement_timestamp()
+        FROM staged
+        ON CONFLICT (habit_id, log_date) DO UPDATE
+        SET completed = EXCLUDED.completed,
+            notes = COALESCE(EXCLUDED.notes, habit_logs.notes),
+            completed_at = EXCLUDED.completed_at
+        RETURNING habit_id, created_at = statement_timestamp()::timestamp AS inserted
+    )
+    SELECT habit_id,
+           COUNT(*) FILTER (WHERE inserted) AS inserted,
+           COUNT(*) FILTER (WHERE NOT inserted) AS updated
+    FROM merged
+    GROUP BY habit_id
+""")
+
+# The partition of every month the batch wrote to (see partitions.py)
+WRITTEN_PARTITIONS_SQL = text("""
+    SELECT DISTINCT COALESCE(to_regclass('habit_logs_' || to_char(log_date, 'YYYY_MM')),
+                             'habit_logs_default'::regclass)::text
+    FROM habit_log_import
+""")
+
+
+class RowError(ValueError):
+    pass
+
+
+def parse_row(obj: Any) -> Tuple[int, date, bool, Any, Any]:
+    """Validate one incoming log; raises RowError with a readable reason.
+
+    ``obj`` may already be a RowError for input that failed to decode.
+    """
+    if isinstance(obj, RowError):
+        raise obj
+    if not isinstance(obj, dict):
+        raise RowError("row must be an object")
+
+    habit_id = obj.get("habit_id")
+    if not isinstance(habit_id, int) or isinstance(habit_id, bool):
+        raise RowError("habit_id must be an integer")
+    # Out of the column's range, the id would fail the COPY of the whole batch
+    if not INT32_MIN <= habit_id <= INT32_MAX:
+        raise RowError(f"habit {habit_id} does not exist")
+
+    try:
+        log_date = date.fromisoformat(obj["log_date"])
+    except (KeyError, TypeError, ValueError):
+        raise RowError("log_date must be an ISO date (YYYY-MM-DD)")
+
+    completed = obj.get("completed", True)
+    if not isinstance(completed, bool):
+        raise RowError("completed must be a boolean")
+
+    notes = obj.get("notes")
+    if notes is not None:
+        if not isinstance(notes, str):
+            raise RowError("notes must be a string")
+        # Either would fail the COPY of the whole batch: PostgreSQL text cannot hold NUL, and
+        # lone surrogates (as "\ud800" in JSON) cannot be encoded
+        if "\x00" in notes:
+            raise RowError("notes must not contain NUL characters")
+        try:
+            notes.encode()
+        except UnicodeEncodeError:
+            raise RowError("notes must be valid Unicode text")
+
+    completed_at = obj.get("completed_at")
+    if completed_at is not None:
+        try:
+            # Python before 3.11 does not read a trailing "Z" as UTC
+            if completed_at[-1:] in ("Z", "z"):
+                completed_at = completed_at[:-1] + "+00:00"
+            completed_at = datetime.fromisoformat(completed_at)
+            if completed_at.tzinfo is not None:
+                # Stored in the server's local time, as the completion routes' datetime.now()
+                completed_at = completed_at.astimezone().replace(tzinfo=None)
+        except (TypeError, ValueError, OverflowError):
+            raise RowError("completed_at must be an ISO timestamp")
+
+    return habit_id, log_date, completed, notes, completed_at
+
+
+async def ndjson_chunks(stream: AsyncIterator[bytes], chunk_rows: int) -> AsyncIterator[List[Tuple[int, Any]]]:
+    """Group an NDJSON byte stream into lists of ``(row_no, object)``; blank lines are skipped."""
+    chunk = []
+    row_no = 0
+    pending = b""
+    async for data in stream:
+        lines = (pending + data).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                chunk.append((row_no, json.loads(line)))
+            except ValueError:
+                chunk.append((row_no, RowError("invalid JSON")))
+            row_no += 1
+            if len(chunk) >= chunk_rows:
+                yield chunk
+                chunk = []
+    if pending.strip():
+        try:
+            chunk.append((row_no, json.loads(pending)))
+        except ValueError:
+            chunk.append((row_no, RowError("invalid JSON")))
+    if chunk:
+        yield chunk
+
+
+class LogImporter:
+    """Stages batches of rows with COPY and merges them in ``finish``, all in one transaction."""
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.received = 0
+        self.rejected = 0
+        self.rejects: List[dict] = []
+        self._staging_created = False
+
+    def reject(self, row_no: int, reason: str) -> None:
+        self.rejected += 1
+        if len(self.rejects) < MAX_REPORTED_REJECTS:
+            self.rejects.append({"row": row_no, "reason": reason})
+
+    def stage(self, rows: Iterable[Tuple[int, Any]]) -> None:
+        """Validate ``(row_no, object)`` pairs and COPY the valid ones into staging."""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row_no, obj in rows:
+            self.received += 1
+            try:
+                habit_id, log_date, completed, notes, completed_at = parse_row(obj)
+            except RowError as e:
+                self.reject(row_no, str(e))
+                continue
+            writer.writerow((row_no, habit_id, log_date.isoformat(), "t" if completed else "f",
+                             notes, completed_at.isoformat() if completed_at else None))
+
+        if not self._staging_created:
+            self.db.execute(CREATE_STAGING_SQL)
+            self._staging_created = True
+
+        buffer.seek(0)
+        cursor = self.db.connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                "COPY habit_log_import (row_no, habit_id, log_date, completed, notes, completed_at) "
+                "FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
+        finally:
+            cursor.close()
+
+    def finish(self) -> dict:
+        """Merge staged rows into ``habit_logs``, refresh derived state and commit."""
+        inserted = updated = 0
+        if self._staging_created:
+            for row_no, habit_id in self.db.execute(UNKNOWN_HABITS_SQL):
+                self.reject(row_no, f"habit {habit_id} does not exist")
+
+            # Keep the DISTINCT ON sort of large batches in memory
+            self.db.execute(text("SET LOCAL work_mem = '64MB'"))
+            self.db.execute(RESTORE_ARCHIVED_SQL)
+            habit_ids = []
+            for row in self.db.execute(MERGE_SQL):
+                habit_ids.append(row.habit_id)
+                inserted += row.inserted
+                updated += row.updated
+
+            if inserted + updated >= ANALYZE_AFTER_ROWS:
+                # Partitions filled by this batch have no statistics yet; planned as near-empty, the
+                # streak recompute below nests a loop over all their rows once per habit
+                for partition in self.db.execute(WRITTEN_PARTITIONS_SQL).scalars().all():
+                    self.db.execute(text(f"ANALYZE {partition}"))
+
+            if habit_ids:
+                recompute_streak_states(self.db, habit_ids)
+                record_bulk_write(self.db, habit_ids)
+                events.publish_logs_imported(self.db, habit_ids)
+
+        self.db.commit()
+        return {
+            "received": self.received,
+            "inserted": inserted,
+            "updated": updated,
+            "rejected": self.rejected,
+            "rejects": sorted(self.rejects, key=lambda reject: reject["row"]),
+        }
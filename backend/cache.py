@@ -0,0 +1,192 @@
+"""Response cache for the hot GET routes.
+
+Entries are encoded response bodies stored under the response's ETag (see
+etags.py), which covers the route, the query and the database versions of
+everything the response depends on. A write moves those versions, so
+entries built from older data are never looked up again and age out
+through the TTL and LRU; nothing has to be invalidated. The versions are
+read before the route queries the database, from the same database the
+route reads, so an entry is never older than its key: a response computed
+while a write commits is stored under the old versions, and a read replica
+that has not yet replayed a write still reports the old ones.
+
+Backends, chosen with ``CACHE_BACKEND``:
+
+* ``memory`` — TTL + LRU per worker, bounded by ``CACHE_MAX_ENTRIES``.
+* ``redis`` — any Redis-protocol server at ``CACHE_URL``, shared by all
+  workers. Needs the ``redis`` package.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import orjson
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# "hit" or "miss" on responses of cached routes
+CACHE_HEADER = "X-Cache"
+REDIS_KEY_PREFIX = "ritualist:cache"
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    headers: Dict[str, str]
+
+
+class MemoryBackend:
+    """Per-process TTL + LRU of responses."""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, CachedResponse]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, response = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return response
+
+    def set(self, key: str, response: CachedResponse) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class RedisBackend:
+    """Responses on a Redis-protocol server shared by every worker."""
+
+    name = "redis"
+
+    def __init__(self, url: str, ttl: float, client=None):
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+        self._client = client
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        value = self._client.get(f"{REDIS_KEY_PREFIX}:response:{key}")
+        if value is None:
+            return None
+        headers, _, body = value.partition(b"\n")
+        return CachedResponse(body, orjson.loads(headers))
+
+    def set(self, key: str, response: CachedResponse) -> None:
+        value = orjson.dumps(response.headers) + b"\n" + response.body
+        self._client.set(f"{REDIS_KEY_PREFIX}:response:{key}", value, px=int(self.ttl * 1000))
+
+    def stats(self) -> dict:
+        # Server-wide: the server evicts under its own maxmemory policy
+        info = self._client.info("stats")
+        return {"evictions": info.get("evicted_keys"), "expirations": info.get("expired_keys")}
+
+
+class ResponseCache:
+    """Looks responses up by ETag, and counts hits and misses."""
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    def lookup(self, etag: str) -> Optional[CachedResponse]:
+        """The response cached under ``etag``; None on a miss or when the backend could not be reached."""
+        try:
+            response = self.backend.get(_key(etag))
+        except Exception as e:
+            self._count_error(e)
+            return None
+        with self._lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return response
+
+    def store(self, etag: str, body: bytes, headers: Dict[str, str]) -> None:
+        try:
+            self.backend.set(_key(etag), CachedResponse(body, headers))
+        except Exception as e:
+            self._count_error(e)
+            return
+        with self._lock:
+            self.stores += 1
+
+    def stats(self) -> dict:
+        if not self.enabled:
+            return {"backend": None}
+        with self._lock:
+            stats = {
+                "backend": self.backend.name,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / (self.hits + self.misses) if self.hits + self.misses else None,
+                "stores": self.stores,
+                "errors": self.errors,
+            }
+        try:
+            stats.update(self.backend.stats())
+        except Exception as e:
+            self._count_error(e)
+        return stats
+
+    def _count_error(self, e: Exception) -> None:
+        with self._lock:
+            self.errors += 1
+        logger.warning(f"Response cache unavailable: {e}")
+
+
+def _key(etag: str) -> str:
+    # ETags are quoted hashes of the route, query and versions
+    return etag.strip('"')
+
+
+def _create_backend():
+    if settings.cache_backend == "memory":
+        return MemoryBackend(settings.cache_max_entries, settings.cache_ttl_seconds)
+    if settings.cache_backend == "redis":
+        return RedisBackend(settings.cache_url, settings.cache_ttl_seconds)
+    if settings.cache_backend != "none":
+        raise ValueError(f"Unknown CACHE_BACKEND {settings.cache_backend!r}")
+    return None
+
+
+response_cache = ResponseCache(_create_backend())
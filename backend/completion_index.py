@@ -0,0 +1,206 @@
+"""In-process completion history index.
+
+Keeps one bit per habit per day (a Python int used as a bitset) so hot
+questions — completed today, streaks — are answered without SQL once a
+habit's history is loaded. Histories are loaded
+lazily from ``habit_log_history`` (archived months included), kept in an LRU
+bounded by ``COMPLETION_INDEX_MAX_BYTES`` and updated from the
+``mark_completed`` / ``mark_incomplete`` write path once its transaction
+commits.
+
+Other workers learn about writes through Postgres LISTEN/NOTIFY: the write
+path sends ``pg_notify`` inside its transaction (delivered on commit) and
+the listener drops the affected habit from every other worker's index (see
+pg_listener.py).
+Enable with ``COMPLETION_INDEX_ENABLED=true``.
+"""
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+import pg_listener
+from config import settings
+from pg_listener import WORKER_ID
+from streaks import StreakStats, day_period, streaks_from_days
+
+INVALIDATION_CHANNEL = "ritualist_completion_index"
+# Rough per-entry cost beyond the bitset itself (dict slot, objects, ints)
+ENTRY_OVERHEAD_BYTES = 160
+
+_PENDING_KEY = "completion_index_pending"
+
+LOAD_SQL = text("SELECT log_date FROM habit_log_history() WHERE habit_id = :habit_id AND completed")
+
+
+class CompletionHistory:
+    """Completed days of one habit; bit ``i`` stands for day number ``origin + i``."""
+
+    __slots__ = ("origin", "bits")
+
+    def __init__(self, days: Iterable[int] = ()):
+        days = np.unique(np.fromiter(days, dtype=np.int64))
+        self.origin: Optional[int] = int(days[0]) if days.size else None
+        self.bits = 0
+        if days.size:
+            flags = np.zeros(int(days[-1]) - self.origin + 1, dtype=bool)
+            flags[days - self.origin] = True
+            self.bits = int.from_bytes(np.packbits(flags, bitorder="little").tobytes(), "little")
+
+    @property
+    def nbytes(self) -> int:
+        return (self.bits.bit_length() + 7) // 8 + ENTRY_OVERHEAD_BYTES
+
+    def set(self, day: int, completed: bool) -> None:
+        if self.origin is None:
+            self.origin = day
+        elif day < self.origin:
+            self.bits <<= self.origin - day
+            self.origin = day
+        if completed:
+            self.bits |= 1 << (day - self.origin)
+        else:
+            self.bits &= ~(1 << (day - self.origin))
+
+    def is_completed(self, day: int) -> bool:
+        if self.origin is None or day < self.origin:
+            return False
+        return bool(self.bits >> (day - self.origin) & 1)
+
+    def days(self) -> np.ndarray:
+        """Day numbers of all completed days, ascending."""
+        if not self.bits:
+            return np.empty(0, dtype=np.int64)
+        packed = np.frombuffer(self.bits.to_bytes((self.bits.bit_length() + 7) // 8, "little"), dtype=np.uint8)
+        return np.flatnonzero(np.unpackbits(packed, bitorder="little")).astype(np.int64) + self.origin
+
+    def streaks(self, periodicity: str, target: int, start_date: date, today: Optional[date] = None) -> StreakStats:
+        return streaks_from_days(self.days(), periodicity, target, start_date, today)
+
+
+class CompletionIndex:
+    """LRU of ``CompletionHistory`` per habit, bounded by an approximate byte budget."""
+
+    def __init__(self, max_bytes: int, enabled: bool = True):
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[int, CompletionHistory]" = OrderedDict()
+        self._bytes = 0
+        # Bumped by every write or invalidation so a load racing with one is not cached
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def history(self, db: Session, habit_id: int) -> CompletionHistory:
+        """The habit's history, loaded from the database on a miss."""
+        with self._lock:
+            entry = self._entries.get(habit_id)
+            if entry is not None:
+                self._entries.move_to_end(habit_id)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            epoch = self._epoch
+
+        rows = db.execute(LOAD_SQL, {"habit_id": habit_id})
+        entry = CompletionHistory(day_period(log_date) for log_date, in rows)
+
+        with self._lock:
+            if epoch == self._epoch and habit_id not in self._entries:
+                self._entries[habit_id] = entry
+                self._bytes += entry.nbytes
+                self._evict()
+        return entry
+
+    def apply(self, habit_id: int, log_date: date, completed: bool) -> None:
+        """Apply a committed log write to the habit's history if it is loaded."""
+        with self._lock:
+            self._epoch += 1
+            entry = self._entries.get(habit_id)
+            if entry is None:
+                return
+            self._bytes -= entry.nbytes
+            entry.set(day_period(log_date), completed)
+            self._bytes += entry.nbytes
+            self._evict()
+
+    def invalidate(self, habit_id: Optional[int] = None) -> None:
+        """Drop one habit's history, or everything when ``habit_id`` is None."""
+        with self._lock:
+            self._epoch += 1
+            if habit_id is None:
+                self._entries.clear()
+                self._bytes = 0
+                return
+            entry = self._entries.pop(habit_id, None)
+            if entry is not None:
+                self._bytes -= entry.nbytes
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _evict(self) -> None:
+        while self._bytes > self.max_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.nbytes
+            self.evictions += 1
+
+
+completion_index = CompletionIndex(settings.completion_index_max_bytes, enabled=settings.completion_index_enabled)
+
+
+def record_log_write(db: Session, habit_id: int, log_date: date, completed: bool) -> None:
+    """Queue a log write for the index and notify other workers when ``db`` commits."""
+    if not completion_index.enabled:
+        return
+    db.info.setdefault(_PENDING_KEY, []).append((habit_id, log_date, completed))
+    db.execute(text("SELECT pg_notify(:channel, :payload)"),
+               {"channel": INVALIDATION_CHANNEL, "payload": f"{WORKER_ID}:{habit_id}"})
+
+
+def record_bulk_write(db: Session, habit_ids: List[int]) -> None:
+    """Drop the habits from every worker's index once ``db`` commits a bulk write."""
+    if not completion_index.enabled:
+        return
+    db.info.setdefault(_PENDING_KEY, []).extend((habit_id, None, None) for habit_id in habit_ids)
+    db.execute(text("SELECT pg_notify(:channel, :worker_id || ':' || habit_id) FROM unnest(:habit_ids) AS habit_id"),
+               {"channel": INVALIDATION_CHANNEL, "worker_id": WORKER_ID, "habit_ids": list(habit_ids)})
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_pending(session: Session) -> None:
+    for habit_id, log_date, completed in session.info.pop(_PENDING_KEY, ()):
+        if log_date is None:
+            completion_index.invalidate(habit_id)
+        else:
+            completion_index.apply(habit_id, log_date, completed)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+def _on_notify(payload: str) -> None:
+    worker_id, _, habit_id = payload.partition(":")
+    if worker_id != WORKER_ID:
+        completion_index.invalidate(int(habit_id))
+
+
+def listen_for_invalidations() -> None:
+    """Invalidate this worker's index on writes made by other workers, once pg_listener starts."""
+    pg_listener.subscribe(INVALIDATION_CHANNEL, _on_notify, on_reset=completion_index.invalidate)
@@ -1,22 +1,95 @@
+import itertools
 import logging
+import time
+from http.cookies import SimpleCookie
 
+from fastapi import Request
 from sqlalchemy import create_engine, text
 from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from starlette.datastructures import MutableHeaders
 
-from config import settings
+import migrate
+import partitions
+from config import asyncpg_url, settings
+from db_pool import engine_options, install_session_settings, pool_status
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 Base = declarative_base()
 
+# Set on responses to writes; its value is the time of the write
+READ_YOUR_WRITES_COOKIE = "ritualist_last_write"
+
+
+class Replica:
+    """A read replica engine, skipped for a while after it fails to hand out a connection."""
+
+    def __init__(self, name, url):
+        self.name = name
+        self.engine = create_engine(url, execution_options={"postgresql_readonly": True}, **engine_options())
+        install_session_settings(self.engine)
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self.async_engine = None
+        self.AsyncSessionLocal = None
+        if settings.database_async:
+            self.async_engine = create_async_engine(asyncpg_url(url), execution_options={"postgresql_readonly": True},
+                                                    **engine_options(is_async=True))
+            install_session_settings(self.async_engine)
+            self.AsyncSessionLocal = async_sessionmaker(self.async_engine, autoflush=False, expire_on_commit=False)
+        self.down_until = 0.0
+
+    @property
+    def available(self):
+        return time.monotonic() >= self.down_until
+
+    def mark_down(self):
+        self.down_until = time.monotonic() + settings.replica_retry_seconds
+
+
+def wrote_recently(request: Request) -> bool:
+    """Whether the client made a write within the read-your-writes window"""
+    try:
+        written_at = float(request.cookies.get(READ_YOUR_WRITES_COOKIE, ""))
+    except ValueError:
+        return False
+    return time.time() - written_at < settings.read_your_writes_seconds
+
+
+class ReadYourWritesMiddleware:
+    """Pin the client's reads to the primary for a short while after it writes"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not db_manager.replicas or scope["method"] in ("GET", "HEAD", "OPTIONS"):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                cookie = SimpleCookie()
+                cookie[READ_YOUR_WRITES_COOKIE] = str(time.time())
+                cookie[READ_YOUR_WRITES_COOKIE].update({"max-age": int(settings.read_your_writes_seconds) + 1,
+                                                         "path": "/", "httponly": True, "samesite": "lax"})
+                MutableHeaders(scope=message).append("set-cookie", cookie.output(header="").strip())
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
+
 
 class DatabaseManager:
     def __init__(self):
         self.engine = None
         self.SessionLocal = None
+        self.async_engine = None
+        self.AsyncSessionLocal = None
+        self.replicas = []
+        self._next_replica = itertools.count()
 
     def create_database_if_not_exists(self):
         """Create database if it doesn't exist"""
@@ -46,31 +119,60 @@ class DatabaseManager:
             raise
 
     def initialize_database(self):
-        """Initialize database connection and create tables"""
+        """Initialize database connection and bring up or verify the schema per DB_STARTUP_MODE"""
         try:
-            # First, ensure database exists
-            self.create_database_if_not_exists()
+            mode = settings.db_startup_mode
+            if mode == "migrate":
+                self.create_database_if_not_exists()
 
             # Create engine for the specific database
-            self.engine = create_engine(settings.database_url)
+            self.engine = create_engine(settings.database_url, **engine_options())
+            install_session_settings(self.engine)
 
-            # Test connection
-            with self.engine.connect() as conn:
-                conn.execute(text("SELECT 1"))
-                logger.info("Database connection successful")
+            if mode == "migrate":
+                applied = migrate.upgrade(self.engine)
+                logger.info(f"Applied {len(applied)} migration(s)")
+                partitions.ensure_partitions(self.engine)
+            elif mode == "check":
+                logger.info(f"Database schema is at version {migrate.check(self.engine)}")
+            elif mode != "skip":
+                raise ValueError(f"Unknown DB_STARTUP_MODE {mode!r}")
 
             # Create session factory
             self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
 
-            # Create all tables
-            self.create_tables()
+            if settings.database_async:
+                self.initialize_async_engine()
+
+            self.initialize_replicas()
 
         except Exception as e:
             logger.error(f"Database initialization failed: {e}")
             raise
 
+    def initialize_async_engine(self):
+        """Create the asyncpg engine and session factory used by the async routes"""
+        self.async_engine = create_async_engine(settings.async_database_url, **engine_options(is_async=True))
+        install_session_settings(self.async_engine)
+        # Attributes must not expire on commit: reloading them lazily is not possible outside run_sync
+        self.AsyncSessionLocal = async_sessionmaker(self.async_engine, autoflush=False, expire_on_commit=False)
+        logger.info("Async database engine created")
+
+    def initialize_replicas(self):
+        """Create an engine per configured read replica"""
+        self.replicas = [Replica(f"replica-{i}", url) for i, url in enumerate(settings.database_replica_urls)]
+        if self.replicas:
+            logger.info(f"Routing reads to {len(self.replicas)} replica(s), {settings.replica_selection}")
+
+    async def dispose_async_engine(self):
+        if self.async_engine is not None:
+            await self.async_engine.dispose()
+        for replica in self.replicas:
+            if replica.async_engine is not None:
+                await replica.async_engine.dispose()
+
     def create_tables(self):
-        """Create all tables defined in models"""
+        """Create all tables defined in models, for throwaway databases; others use migrate.py"""
         try:
             Base.metadata.create_all(bind=self.engine)
             logger.info("All tables created successfully")
@@ -78,6 +180,19 @@ class DatabaseManager:
             logger.error(f"Error creating tables: {e}")
             raise
 
+    def pool_metrics(self):
+        """Pool status of every engine, keyed by name"""
+        metrics = {}
+        if self.engine is not None:
+            metrics["primary"] = pool_status(self.engine)
+        if self.async_engine is not None:
+            metrics["primary_async"] = pool_status(self.async_engine)
+        for replica in self.replicas:
+            metrics[replica.name] = dict(pool_status(replica.engine), available=replica.available)
+            if replica.async_engine is not None:
+                metrics[f"{replica.name}_async"] = pool_status(replica.async_engine)
+        return metrics
+
     def get_db(self):
         """Dependency to get database session"""
         db = self.SessionLocal()
@@ -86,6 +201,73 @@ class DatabaseManager:
         finally:
             db.close()
 
+    def read_session(self, request: Request):
+        """A read-only session on a replica, or a session on the primary when no replica should serve it"""
+        db = None
+        if self.replicas and not wrote_recently(request):
+            db = self._replica_session()
+        return db or self.SessionLocal()
+
+    def get_read_db(self, request: Request):
+        """Dependency to get a read session (see read_session)"""
+        db = self.read_session(request)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def _replica_session(self):
+        for replica in self._replica_order():
+            db = replica.SessionLocal()
+            try:
+                # Check out the connection now so a dead replica is skipped before the route runs
+                db.connection()
+                return db
+            except OperationalError as e:
+                db.close()
+                replica.mark_down()
+                logger.warning(f"{replica.name} unavailable for {settings.replica_retry_seconds}s: {e}")
+        return None
+
+    def _replica_order(self, is_async: bool = False):
+        available = [replica for replica in self.replicas if replica.available]
+        if settings.replica_selection == "least_loaded":
+            return sorted(available, key=lambda replica: (replica.async_engine if is_async else replica.engine)
+                          .pool.checkedout())
+        if not available:
+            return []
+        offset = next(self._next_replica) % len(available)
+        return available[offset:] + available[:offset]
+
+    async def get_async_db(self):
+        """Dependency to get an async database session"""
+        async with self.AsyncSessionLocal() as db:
+            yield db
+
+    async def get_async_read_db(self, request: Request):
+        """Dependency to get an async read session, routed as read_session routes sync ones"""
+        db = None
+        if self.replicas and not wrote_recently(request):
+            db = await self._async_replica_session()
+        db = db or self.AsyncSessionLocal()
+        try:
+            yield db
+        finally:
+            await db.close()
+
+    async def _async_replica_session(self):
+        for replica in self._replica_order(is_async=True):
+            db = replica.AsyncSessionLocal()
+            try:
+                await db.connection()
+                return db
+            except (OperationalError, OSError) as e:
+                # asyncpg raises refused connections as plain OSErrors
+                await db.close()
+                replica.mark_down()
+                logger.warning(f"{replica.name} unavailable for {settings.replica_retry_seconds}s: {e}")
+        return None
+
 
 # Create global database manager instance
 db_manager = DatabaseManager()
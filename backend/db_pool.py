@@ -0,0 +1,171 @@
+"""Connection pool configuration and checkout metrics.
+
+``engine_options`` turns the ``DB_*`` settings into ``create_engine``
+arguments. Session timeouts are sent as startup options by default. With
+``DB_PGBOUNCER=true`` the app sits behind PgBouncer in transaction pooling
+mode: PgBouncer does the pooling (``NullPool`` here), startup options are
+not forwarded, and asyncpg's prepared statement cache is turned off. The
+timeouts are then applied with ``SET LOCAL`` at the start of every
+transaction by ``install_session_settings``.
+
+The pool classes time each checkout. ``pool_status`` reports checked-out,
+idle and overflow connections with checkout wait statistics.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Dict
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Checkout waits kept for percentiles
+RECENT_WAITS = 1024
+
+
+class CheckoutStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.slow_checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._recent = deque(maxlen=RECENT_WAITS)
+
+    def record(self, wait: float) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self._recent.append(wait)
+            if wait * 1000 >= settings.db_slow_checkout_ms:
+                self.slow_checkouts += 1
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            recent = sorted(self._recent)
+            stats = {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "slow_checkouts": self.slow_checkouts,
+                "wait_ms_total": round(self.total_wait * 1000, 3),
+                "wait_ms_max": round(self.max_wait * 1000, 3),
+            }
+        for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+            value = recent[min(int(len(recent) * fraction), len(recent) - 1)] if recent else 0.0
+            stats[f"wait_ms_{name}"] = round(value * 1000, 3)
+        return stats
+
+
+class _TimedCheckout:
+    """Times ``_do_get``: the wait for an idle connection, or to open an overflow one."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkout_stats = CheckoutStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            entry = super()._do_get()
+        except PoolTimeoutError:
+            self.checkout_stats.record_timeout()
+            raise
+        wait = time.perf_counter() - started
+        self.checkout_stats.record(wait)
+        if wait * 1000 >= settings.db_slow_checkout_ms:
+            logger.warning(f"Connection checkout waited {wait * 1000:.0f} ms ({self.status()})")
+        return entry
+
+    def recreate(self):
+        # dispose() swaps in a recreated pool; keep the counters
+        pool = super().recreate()
+        pool.checkout_stats = self.checkout_stats
+        return pool
+
+
+class InstrumentedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+def _timeout_options() -> Dict[str, str]:
+    options = {}
+    if settings.db_statement_timeout_ms:
+        options["statement_timeout"] = str(settings.db_statement_timeout_ms)
+    if settings.db_idle_in_transaction_timeout_ms:
+        options["idle_in_transaction_session_timeout"] = str(settings.db_idle_in_transaction_timeout_ms)
+    return options
+
+
+def engine_options(is_async: bool = False) -> Dict[str, Any]:
+    """Keyword arguments for ``create_engine`` / ``create_async_engine``."""
+    if settings.db_pgbouncer:
+        options: Dict[str, Any] = {"poolclass": NullPool}
+        if is_async:
+            # Transaction pooling may run each statement on a different server connection
+            options["connect_args"] = {"statement_cache_size": 0, "prepared_statement_cache_size": 0}
+        return options
+
+    options = {
+        "poolclass": InstrumentedAsyncQueuePool if is_async else InstrumentedQueuePool,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+    timeouts = _timeout_options()
+    if timeouts:
+        if is_async:
+            options["connect_args"] = {"server_settings": timeouts}
+        else:
+            options["connect_args"] = {"options": " ".join(f"-c {name}={value}" for name, value in timeouts.items())}
+    return options
+
+
+def install_session_settings(engine) -> None:
+    """Apply the session timeouts with SET LOCAL per transaction when behind PgBouncer."""
+    timeouts = _timeout_options()
+    if not settings.db_pgbouncer or not timeouts:
+        return
+    statements = [f"SET LOCAL {name} = {value}" for name, value in timeouts.items()]
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "begin")
+    def _set_local(conn):
+        for statement in statements:
+            conn.exec_driver_sql(statement)
+
+
+def pool_status(engine) -> Dict[str, Any]:
+    """Connection counts and checkout waits for ``engine``'s pool."""
+    pool = getattr(engine, "sync_engine", engine).pool
+    if not isinstance(pool, QueuePool):
+        return {"pool": type(pool).__name__}
+    status = {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": pool._max_overflow,
+    }
+    stats = getattr(pool, "checkout_stats", None)
+    if stats is not None:
+        status.update(stats.snapshot())
+    return status
@@ -0,0 +1,52 @@
+"""Strong ETags from row versions, checked before any row is loaded.
+
+Every collection (``habits`` — including tag links —, ``habit_logs`` and
+``tags``) has a version that goes up with every committed statement that
+writes it, deletes included, and each habit and log has a ``row_version``
+(migrations 0003 and 0006). Writers never wait for each other to move a
+version: it is the sum of a few rows of ``collection_changes`` that each
+write statement folds into a row of its own. A GET route reads the versions
+its response depends on — one small indexed read — and hashes them with the
+request; when the client already holds that ETag it gets a 304 without the
+route querying or serializing anything else.
+"""
+import hashlib
+from typing import Any, Dict, List, Optional
+
+import orjson
+from fastapi import Request, Response
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+
+COLLECTION_VERSIONS_SQL = text(
+    "SELECT collection, SUM(changes)::bigint FROM collection_changes WHERE collection IN :collections "
+    "GROUP BY collection"
+).bindparams(bindparam("collections", expanding=True))
+
+
+def collection_versions(db: Session, collections: List[str]) -> Dict[str, int]:
+    return dict(db.execute(COLLECTION_VERSIONS_SQL, {"collections": collections}).all())
+
+
+def make_etag(request: Request, *versions: Any) -> str:
+    """Strong ETag for the request's path and query at the given versions."""
+    spec = orjson.dumps([request.url.path, sorted(request.query_params.multi_items()), versions], default=str)
+    return f'"{hashlib.blake2b(spec, digest_size=12).hexdigest()}"'
+
+
+def matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches ``etag`` (weak comparison, as RFC 9110 asks)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def headers(etag: str) -> dict:
+    # no-cache: browsers keep the body but revalidate it on every use
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=headers(etag))
@@ -0,0 +1,128 @@
+"""Server-Sent Events change feed (``GET /events``).
+
+Write paths call ``publish`` inside their transaction; it sends the delta
+with ``pg_notify``, which Postgres delivers on commit — never for rolled back
+writes — to every worker's LISTEN connection (see pg_listener.py). Each
+worker's ``Broadcaster`` encodes the SSE frame once and hands the same bytes
+to every connected client's queue on the event loop.
+
+Deltas are small JSON objects:
+
+* ``{"type": "log", "habit_id", "log_date", "completed"}`` from
+  ``mark_completed`` / ``mark_incomplete``
+* ``{"type": "logs_imported", "habit_ids": [...]}`` from bulk imports
+* ``{"type": "habit_created", "id"}`` and ``{"type": "habit_deleted", "id"}``
+* ``{"type": "resync"}`` when this worker may have missed notifications;
+  clients refetch (cheap with ETags, see etags.py)
+
+Idle connections cost one queue and one suspended generator each: no
+database connection, no per-connection timer (one heartbeat is broadcast to
+all). Serving 10k of them per worker needs a file descriptor limit above
+that (``ulimit -n``). Disable with ``EVENTS_ENABLED=false``, e.g. when the
+database is only reachable through PgBouncer in transaction mode, which
+cannot LISTEN.
+"""
+import asyncio
+from typing import AsyncIterator, List, Optional, Set
+
+import orjson
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+import pg_listener
+from config import settings
+
+CHANNEL = "ritualist_events"
+# pg_notify payloads must stay under 8000 bytes
+MAX_HABIT_IDS_PER_EVENT = 500
+HEARTBEAT_SECONDS = 15
+# Frames queued for a client that stops reading; beyond this it gets dropped
+CLIENT_QUEUE_FRAMES = 256
+
+_RETRY_FRAME = b"retry: 5000\n\n"
+_HEARTBEAT_FRAME = b": ping\n\n"
+_CLOSE = None
+
+
+def _frame(payload: bytes) -> bytes:
+    return b"data: " + payload + b"\n\n"
+
+
+def publish(db: Session, event: dict) -> None:
+    """Queue ``event`` for every ``/events`` client; delivered when ``db`` commits."""
+    if not settings.events_enabled:
+        return
+    db.execute(text("SELECT pg_notify(:channel, :payload)"),
+               {"channel": CHANNEL, "payload": orjson.dumps(event, default=str).decode()})
+
+
+def publish_logs_imported(db: Session, habit_ids: List[int]) -> None:
+    for start in range(0, len(habit_ids), MAX_HABIT_IDS_PER_EVENT):
+        publish(db, {"type": "logs_imported", "habit_ids": habit_ids[start:start + MAX_HABIT_IDS_PER_EVENT]})
+
+
+class Broadcaster:
+    """Fans notifications out to this worker's connected clients."""
+
+    def __init__(self):
+        self._clients: Set[asyncio.Queue] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self.frames_sent = 0
+        self.dropped = 0
+
+    def start(self) -> None:
+        """Subscribe to the feed; call from the event loop at startup, before pg_listener starts."""
+        self._loop = asyncio.get_running_loop()
+        pg_listener.subscribe(CHANNEL, self._on_notify, on_reset=self._on_reset)
+        self._heartbeat_task = self._loop.create_task(self._heartbeat())
+
+    @property
+    def clients(self) -> int:
+        return len(self._clients)
+
+    def stats(self) -> dict:
+        return {"clients": self.clients, "frames_sent": self.frames_sent, "dropped": self.dropped}
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        """SSE frames for one client until it disconnects (or falls too far behind)."""
+        queue = asyncio.Queue(CLIENT_QUEUE_FRAMES)
+        self._clients.add(queue)
+        try:
+            yield _RETRY_FRAME
+            while True:
+                frame = await queue.get()
+                if frame is _CLOSE:
+                    return
+                yield frame
+        finally:
+            self._clients.discard(queue)
+
+    # Runs on the listener thread
+    def _on_notify(self, payload: str) -> None:
+        self._loop.call_soon_threadsafe(self._send, _frame(payload.encode()))
+
+    def _on_reset(self) -> None:
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._send, _frame(b'{"type":"resync"}'))
+
+    async def _heartbeat(self) -> None:
+        # Keeps proxies from closing idle streams
+        while True:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            self._send(_HEARTBEAT_FRAME)
+
+    def _send(self, frame: bytes) -> None:
+        for queue in list(self._clients):
+            try:
+                queue.put_nowait(frame)
+                self.frames_sent += 1
+            except asyncio.QueueFull:
+                # Too slow to keep up: close its stream; it reconnects and resyncs
+                self._clients.discard(queue)
+                queue.get_nowait()
+                queue.put_nowait(_CLOSE)
+                self.dropped += 1
+
+
+broadcaster = Broadcaster()
@@ -0,0 +1,70 @@
+"""Fast serialization path for large list responses.
+
+Routes fetch column tuples instead of ORM instances, turn them into dicts,
+validate the whole list against the response schema in one pydantic call
+and encode it with orjson. The JSON is the same as the ``response_model``
+path produces, at a fraction of the cost: no identity map, no per-object
+``from_attributes`` lookups, no ``jsonable_encoder`` walk.
+``stream_ndjson`` streams very large results one JSON object per line,
+from a server-side cursor.
+"""
+from functools import lru_cache
+from typing import Any, Callable, Iterator, List, Sequence
+
+import orjson
+from fastapi import Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, TypeAdapter
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+# Rows per server-side cursor fetch when streaming
+STREAM_BATCH_ROWS = 1000
+
+
+@lru_cache(maxsize=None)
+def _list_adapter(schema: type) -> TypeAdapter:
+    return TypeAdapter(List[schema])
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.__dict__
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def row_dicts(rows: Sequence[Any]) -> List[dict]:
+    """Result rows as dicts keyed by column name."""
+    if not rows:
+        return []
+    keys = rows[0]._fields
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def dump_list(schema: type, items: List[Any]) -> bytes:
+    """Validate ``items`` (dicts or ORM instances) against ``schema`` in one call and encode them as a JSON array."""
+    return orjson.dumps(_list_adapter(schema).validate_python(items, from_attributes=True), default=_default)
+
+
+def json_list_response(schema: type, items: List[Any], headers: dict = None) -> Response:
+    return Response(dump_list(schema, items), media_type="application/json", headers=headers)
+
+
+def json_object_response(schema: type, obj: Any, headers: dict = None) -> Response:
+    """One dict or ORM instance validated against ``schema``, encoded like ``json_list_response``."""
+    body = orjson.dumps(schema.model_validate(obj, from_attributes=True), default=_default)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+def wants_ndjson(accept: str) -> bool:
+    return NDJSON_MEDIA_TYPE in (accept or "")
+
+
+def stream_ndjson(schema: type, batches: Callable[[], Iterator[List[dict]]], headers: dict = None) -> StreamingResponse:
+    """Stream the dicts produced by ``batches()`` as NDJSON, validating batch by batch."""
+    adapter = _list_adapter(schema)
+
+    def lines() -> Iterator[bytes]:
+        for batch in batches():
+            yield b"".join(orjson.dumps(item, default=_default) + b"\n" for item in adapter.validate_python(batch))
+
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE, headers=headers)
@@ -0,0 +1,137 @@
+"""Server-side heatmap aggregation with compact encodings.
+
+Completions are grouped per habit and bucket (day, ISO week or month) in one
+query. Day buckets come back as a base64 bitmap (bit ``i``, least significant
+first, is day ``start + i``); week and month buckets as base64 byte counts,
+one unsigned byte per bucket. A year of daily data is 46 bytes per habit.
+Week and month buckets read the completion rollups (see rollups.py) for the
+buckets the range covers whole.
+"""
+import base64
+from datetime import date
+from typing import Dict, List
+
+import numpy as np
+from sqlalchemy import Date, bindparam, text
+from sqlalchemy.orm import Session
+
+from schemas import HeatmapBucket
+from streaks import period_of, period_start, whole_periods
+
+MAX_BUCKETS = 3700
+
+
+# Bucket -> periodicity whose period numbering it shares
+_PERIODICITY = {
+    HeatmapBucket.day: "daily",
+    HeatmapBucket.week: "weekly",
+    HeatmapBucket.month: "monthly",
+}
+
+_BUCKET_SQL = {
+    HeatmapBucket.day: "l.log_date - DATE '0001-01-01'",
+    HeatmapBucket.week: "(l.log_date - DATE '0001-01-01') / 7",
+    HeatmapBucket.month: "EXTRACT(YEAR FROM l.log_date)::int * 12 + EXTRACT(MONTH FROM l.log_date)::int - 1",
+}
+
+
+def _heatmap_sql(bucket: HeatmapBucket):
+    # LEFT JOIN from habits so unknown ids are told apart from empty ranges in the same query
+    if bucket == HeatmapBucket.day:
+        return text(f"""
+            SELECT h.id AS habit_id,
+                   CASE WHEN h.periodicity = 'daily' THEN 1 ELSE COALESCE(h.frequency, 1) END AS target,
+                   {_BUCKET_SQL[bucket]} AS period,
+                   COUNT(l.log_date) AS completed
+            FROM habits h
+            LEFT JOIN habit_log_history(:start, :end) l
+                   ON l.habit_id = h.id AND l.completed AND l.habit_id IN :habit_ids
+            WHERE h.id IN :habit_ids
+            GROUP BY h.id, h.periodicity, h.frequency, period
+        """).bindparams(
+            bindparam("habit_ids", expanding=True),
+            bindparam("start", type_=Date),
+            bindparam("end", type_=Date),
+        )
+
+    # Whole weeks or months come from the completion rollups; the days of
+    # partial ones at either end of the range are counted from the logs
+    return text(f"""
+        SELECT h.id AS habit_id,
+               CASE WHEN h.periodicity = 'daily' THEN 1 ELSE COALESCE(h.frequency, 1) END AS target,
+               c.period,
+               COALESCE(SUM(c.completed), 0) AS completed
+        FROM habits h
+        LEFT JOIN (
+            SELECT r.habit_id, r.period, r.completed
+            FROM habit_completion_rollups r
+            WHERE r.habit_id IN :habit_ids AND r.periodicity = :periodicity
+              AND r.period BETWEEN :first_whole AND :last_whole
+            UNION ALL
+            SELECT l.habit_id, {_BUCKET_SQL[bucket]}, 1
+            FROM (
+                SELECT * FROM habit_log_history(:start, :head_end)
+                UNION ALL
+                SELECT * FROM habit_log_history(:tail_start, :end)
+            ) l
+            WHERE l.completed AND l.habit_id IN :habit_ids
+        ) c ON c.habit_id = h.id
+        WHERE h.id IN :habit_ids
+        GROUP BY h.id, h.periodicity, h.frequency, c.period
+    """).bindparams(
+        bindparam("habit_ids", expanding=True),
+        bindparam("start", type_=Date),
+        bindparam("end", type_=Date),
+        bindparam("head_end", type_=Date),
+        bindparam("tail_start", type_=Date),
+    )
+
+
+def bucket_count(start: date, end: date, bucket: HeatmapBucket) -> int:
+    periodicity = _PERIODICITY[bucket]
+    return period_of(periodicity, end) - period_of(periodicity, start) + 1
+
+
+def bucket_start(start: date, bucket: HeatmapBucket) -> date:
+    """First day of the bucket containing ``start``."""
+    periodicity = _PERIODICITY[bucket]
+    return period_start(periodicity, period_of(periodicity, start))
+
+
+def _encode(values: np.ndarray, bucket: HeatmapBucket) -> str:
+    if bucket == HeatmapBucket.day:
+        payload = np.packbits(values > 0, bitorder="little")
+    else:
+        payload = np.minimum(values, 255).astype(np.uint8)
+    return base64.b64encode(payload.tobytes()).decode("ascii")
+
+
+def build_heatmaps(db: Session, habit_ids: List[int], start: date, end: date,
+                   bucket: HeatmapBucket) -> Dict[int, dict]:
+    """Encoded heatmap series per existing habit id, from a single grouped query."""
+    size = bucket_count(start, end, bucket)
+    first = period_of(_PERIODICITY[bucket], start)
+
+    counts: Dict[int, np.ndarray] = {}
+    targets: Dict[int, int] = {}
+    params = {"habit_ids": habit_ids, "start": start, "end": end}
+    if bucket != HeatmapBucket.day:
+        whole = whole_periods(_PERIODICITY[bucket], start, end)
+        params.update(periodicity=_PERIODICITY[bucket], first_whole=whole.first, last_whole=whole.last,
+                      head_end=whole.head_end, tail_start=whole.tail_start)
+    rows = db.execute(_heatmap_sql(bucket), params)
+    for row in rows:
+        values = counts.setdefault(row.habit_id, np.zeros(size, dtype=np.int64))
+        targets[row.habit_id] = row.target
+        if row.completed:
+            values[row.period - first] = row.completed
+
+    return {
+        habit_id: {
+            "habit_id": habit_id,
+            "target": targets[habit_id],
+            "completed": int(values.sum()),
+            "data": _encode(values, bucket),
+        }
+        for habit_id, values in counts.items()
+    }
@@ -0,0 +1,70 @@
+"""Idempotency-Key support for write routes.
+
+The first response for a key is stored in ``idempotency_keys`` and replayed
+for retries within ``IDEMPOTENCY_KEY_TTL``, so a retried request costs one
+primary-key lookup and no writes. A key is bound to the request it was first
+used with; reusing it for a different request is an error. Expired keys are
+deleted by ``purge_expired`` (run by ``python partitions.py maintain``).
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from models import IdempotencyKey
+
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+# Keys deleted per transaction by purge_expired, so writers remembering keys never wait long
+PURGE_BATCH_SIZE = 10000
+
+PURGE_SQL = text("""
+    DELETE FROM idempotency_keys
+    WHERE key IN (SELECT key FROM idempotency_keys WHERE created_at < :cutoff LIMIT :batch_size)
+""")
+
+
+class IdempotencyKeyReused(Exception):
+    pass
+
+
+def fingerprint(*parts) -> str:
+    """Identifies a request by the values that determine its response."""
+    return ":".join(str(part) for part in parts)
+
+
+def replay(db: Session, key: str, fingerprint: str) -> Optional[dict]:
+    """The stored response for ``key``, or None if the request has not been seen."""
+    stored = db.get(IdempotencyKey, key)
+    if stored is None or stored.created_at < datetime.utcnow() - IDEMPOTENCY_KEY_TTL:
+        return None
+    if stored.request_fingerprint != fingerprint:
+        raise IdempotencyKeyReused(key)
+    return stored.response
+
+
+def remember(db: Session, key: str, fingerprint: str, response: dict) -> None:
+    """Store the response for ``key`` unless a live entry already exists, and commit."""
+    now = datetime.utcnow()
+    stmt = insert(IdempotencyKey).values(key=key, request_fingerprint=fingerprint, response=response, created_at=now)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[IdempotencyKey.key],
+        set_={"request_fingerprint": fingerprint, "response": response, "created_at": now},
+        where=IdempotencyKey.created_at < now - IDEMPOTENCY_KEY_TTL,
+    )
+    db.execute(stmt)
+    db.commit()
+
+
+def purge_expired(engine: Engine, now: Optional[datetime] = None) -> int:
+    """Delete the keys older than ``IDEMPOTENCY_KEY_TTL``, in batches; returns the number deleted."""
+    cutoff = (now or datetime.utcnow()) - IDEMPOTENCY_KEY_TTL
+    purged = 0
+    while True:
+        with engine.begin() as conn:
+            deleted = conn.execute(PURGE_SQL, {"cutoff": cutoff, "batch_size": PURGE_BATCH_SIZE}).rowcount
+        purged += deleted
+        if deleted < PURGE_BATCH_SIZE:
+            return purged
@@ -1,28 +1,59 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+import json
 import logging
 
 logger = logging.getLogger("uvicorn.error")
 from pydantic import BaseModel
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, func, select
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session, scoped_session, declarative_base
-from typing import List
+from typing import List, Optional, Union
+from datetime import date
+from functools import partial
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 
+import analytics
+import async_routes
+import cache
+import events
 import schemas
 import models
-from database import db_manager
+from bulk_logs import LogImporter, ndjson_chunks
+import completion_index
+import pg_listener
+import reads
+import writes
+from config import settings
+from database import ReadYourWritesMiddleware, db_manager
+from fastjson import json_list_response, json_object_response, row_dicts
+from heatmap import MAX_BUCKETS, bucket_count, bucket_start, build_heatmaps
+from pagination import NEXT_CURSOR_HEADER, TAG_SORT_KEYS, split_page
+from reads import conditional_response, keyset_stmt, next_cursor_headers
+from querycount import QUERY_COUNT_HEADER, QueryCountMiddleware
 app = FastAPI()
 
-# Allow frontend to connect (localhost:3000)
+# Allow the frontend to connect with credentials, so the read-your-writes cookie
+# (see database.ReadYourWritesMiddleware) comes back on its requests
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # For dev only. Restrict this in prod.
+    allow_origins=settings.cors_origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, QUERY_COUNT_HEADER, cache.CACHE_HEADER],
 )
 
+# Plain ASGI middlewares: BaseHTTPMiddleware (@app.middleware) costs a task group and
+# a memory stream per request, too much for thousands of open /events streams
+app.add_middleware(QueryCountMiddleware)
+app.add_middleware(ReadYourWritesMiddleware)
+
+if settings.database_async:
+    # Registered first so these handlers take precedence over the sync routes below
+    app.include_router(async_routes.router)
+
 @app.post("/tags/", response_model=schemas.Tag)
 def create_tag(tag: schemas.TagCreate, db: Session = Depends(db_manager.get_db)):
     db_tag = models.Tag(name=tag.name)
@@ -31,30 +62,177 @@ def create_tag(tag: schemas.TagCreate, db: Session = Depends(db_manager.get_db))
     db.refresh(db_tag)
     return db_tag
 
-@app.get("/tags/", response_model=List[schemas.Tag])
-def read_tags(skip: int = 0, limit: int = 100, db: Session = Depends(db_manager.get_db)):
-    return db.query(models.Tag).offset(skip).limit(limit).all()
+@app.get("/tags/", response_model=List[Union[schemas.TagWithCount, schemas.Tag]])
+def read_tags(
+    request: Request,
+    cursor: Optional[str] = None,
+    sort: schemas.TagSort = schemas.TagSort.id,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    with_counts: bool = False,
+    db: Session = Depends(db_manager.get_read_db),
+):
+    """Tags; with ``with_counts`` each carries its number of habits, from the same grouped query."""
+    collections = ["tags", "habits"] if with_counts else ["tags"]
+    render = partial(_tags_response, db, cursor, sort, skip, limit, with_counts)
+    return conditional_response(request, db, collections, render, cached=True)
+
+def _tags_response(db: Session, cursor: Optional[str], sort: schemas.TagSort, skip: int, limit: int, with_counts: bool):
+    stmt = select(*models.Tag.__table__.c)
+    schema = schemas.Tag
+    if with_counts:
+        # Counted from the (tag_id, habit_id) index alone
+        habit_tags = models.Habit.tags.property.secondary
+        stmt = (
+            select(*models.Tag.__table__.c, func.count(habit_tags.c.habit_id).label("habit_count"))
+            .outerjoin(habit_tags, habit_tags.c.tag_id == models.Tag.id)
+            .group_by(models.Tag.id)
+        )
+        schema = schemas.TagWithCount
+    stmt, columns = keyset_stmt(stmt, sort.value, TAG_SORT_KEYS, cursor, skip, limit)
+    rows, next_cursor = split_page(db.execute(stmt).all(), sort.value, columns, limit)
+    return json_list_response(schema, row_dicts(rows), next_cursor_headers(next_cursor))
 
 @app.post("/habits/", response_model=schemas.Habit)
 def create_habit(habit: schemas.HabitCreate, db: Session = Depends(db_manager.get_db)):
     db_tags = db.query(models.Tag).filter(models.Tag.id.in_(habit.tag_ids)).all()
     db_habit = models.Habit(**habit.dict(exclude={"tag_ids"}))
     db_habit.tags = db_tags
+    db_habit.streak_state = models.HabitStreakState()
     db.add(db_habit)
+    db.flush()
+    events.publish(db, {"type": "habit_created", "id": db_habit.id})
     db.commit()
     db.refresh(db_habit)
     return db_habit
 
-@app.get("/habits/", response_model=List[schemas.Habit])
-def read_habits(skip: int = 0, limit: int = 100, db: Session = Depends(db_manager.get_db)):
-    return db.query(models.Habit).offset(skip).limit(limit).all()
+@app.get("/habits/", response_model=List[schemas.HabitDetail])
+def read_habits(
+    request: Request,
+    cursor: Optional[str] = None,
+    sort: schemas.HabitSort = schemas.HabitSort.id,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    recent_days: int = Query(0, ge=0, le=reads.MAX_RECENT_DAYS),
+    tags: Optional[str] = Query(None, description="Comma-separated tag names"),
+    match: schemas.TagMatch = schemas.TagMatch.any,
+    db: Session = Depends(db_manager.get_read_db),
+):
+    """A page of habits, or with Accept: application/x-ndjson every habit after ``cursor``, streamed.
 
-@app.get("/habits/{habit_id}", response_model=schemas.Habit)
-def read_habit(habit_id: int, db: Session = Depends(db_manager.get_db)):
-    habit = db.query(models.Habit).filter(models.Habit.id == habit_id).first()
-    if habit is None:
+    ``tags`` keeps habits with any (``match=any``) or all (``match=all``) of the named tags.
+    """
+    return reads.habits_response(db, request, cursor, sort, skip, limit, recent_days, tags, match)
+
+@app.get("/habits/with-stats/", response_model=List[schemas.HabitWithStats])
+def read_habits_with_stats(request: Request, skip: int = 0, limit: int = 100, db: Session = Depends(db_manager.get_db)):
+    return reads.habits_with_stats_response(db, request, skip, limit)
+
+BULK_CHUNK_ROWS = 10000
+
+@app.post("/habits/logs/bulk", response_model=schemas.BulkLogResult)
+async def bulk_import_logs(request: Request, db: Session = Depends(db_manager.get_db)):
+    """Import logs from a JSON array, or an NDJSON stream with Content-Type application/x-ndjson."""
+    importer = LogImporter(db)
+    if "ndjson" in request.headers.get("content-type", ""):
+        async for chunk in ndjson_chunks(request.stream(), BULK_CHUNK_ROWS):
+            await run_in_threadpool(importer.stage, chunk)
+    else:
+        try:
+            rows = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be a JSON array of logs")
+        if not isinstance(rows, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON array of logs")
+        for offset in range(0, len(rows), BULK_CHUNK_ROWS):
+            chunk = list(enumerate(rows[offset:offset + BULK_CHUNK_ROWS], start=offset))
+            await run_in_threadpool(importer.stage, chunk)
+    return await run_in_threadpool(importer.finish)
+
+@app.get("/habits/logs", response_model=List[schemas.HabitLogState])
+@app.get("/habits/logs/", response_model=List[schemas.HabitLogState], include_in_schema=False)
+def read_habit_logs(
+    request: Request,
+    day: Optional[date] = Query(None, alias="date"),
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    db: Session = Depends(db_manager.get_db),
+):
+    """Every habit's log state for ``date``, or for each day from ``start`` to ``end``."""
+    return reads.habit_logs_response(db, request, day, start, end)
+
+MAX_HEATMAP_HABITS = 200
+
+def _heatmap_response(db: Session, habit_ids: List[int], start: date, end: date, bucket: schemas.HeatmapBucket):
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    buckets = bucket_count(start, end, bucket)
+    if buckets > MAX_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Range spans more than {MAX_BUCKETS} buckets")
+    series = build_heatmaps(db, habit_ids, start, end, bucket)
+    return {
+        "start": start,
+        "end": end,
+        "bucket": bucket,
+        "bucket_start": bucket_start(start, bucket),
+        "buckets": buckets,
+        "series": [series[habit_id] for habit_id in dict.fromkeys(habit_ids) if habit_id in series],
+    }
+
+@app.get("/habits/heatmap", response_model=schemas.Heatmap)
+def read_heatmaps(
+    start: date,
+    end: date,
+    habit_ids: List[int] = Query(...),
+    bucket: schemas.HeatmapBucket = schemas.HeatmapBucket.day,
+    db: Session = Depends(db_manager.get_db),
+):
+    if len(habit_ids) > MAX_HEATMAP_HABITS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_HEATMAP_HABITS} habits per request")
+    return _heatmap_response(db, habit_ids, start, end, bucket)
+
+@app.get("/habits/{habit_id}/heatmap", response_model=schemas.Heatmap)
+def read_habit_heatmap(
+    habit_id: int,
+    start: date,
+    end: date,
+    bucket: schemas.HeatmapBucket = schemas.HeatmapBucket.day,
+    db: Session = Depends(db_manager.get_db),
+):
+    heatmap = _heatmap_response(db, [habit_id], start, end, bucket)
+    if not heatmap["series"]:
         raise HTTPException(status_code=404, detail="Habit not found")
-    return habit
+    return heatmap
+
+@app.get("/analytics/completion", response_model=schemas.CompletionAnalytics)
+def read_completion_analytics(
+    request: Request,
+    start: date,
+    end: date,
+    group_by: List[schemas.CompletionGroupBy] = Query([schemas.CompletionGroupBy.habit]),
+    db: Session = Depends(db_manager.get_read_db),
+):
+    """Expected vs. completed occurrences of every habit from ``start`` to ``end``, in one grouped query."""
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    if (end - start).days >= analytics.MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range spans more than {analytics.MAX_DAYS} days")
+
+    def render():
+        return json_object_response(schemas.CompletionAnalytics, analytics.completion_rates(db, start, end, group_by))
+
+    collections = ["habits", "habit_logs", "tags"] if schemas.CompletionGroupBy.tag in group_by else ["habits", "habit_logs"]
+    # Days up to today are expected, so the date is part of what the response depends on
+    return conditional_response(request, db, collections, render, date.today())
+
+@app.get("/habits/{habit_id}", response_model=schemas.HabitDetail)
+def read_habit(
+    request: Request,
+    habit_id: int,
+    recent_days: int = Query(0, ge=0, le=reads.MAX_RECENT_DAYS),
+    db: Session = Depends(db_manager.get_read_db),
+):
+    return reads.habit_response(db, request, habit_id, recent_days)
 
 @app.delete("/habits/{habit_id}", response_model=schemas.Habit)
 def delete_habit(habit_id: int, db: Session = Depends(db_manager.get_db)):
@@ -62,15 +240,64 @@ def delete_habit(habit_id: int, db: Session = Depends(db_manager.get_db)):
     if habit is None:
         raise HTTPException(status_code=404, detail="Habit not found")
     db.delete(habit)
+    events.publish(db, {"type": "habit_deleted", "id": habit_id})
     db.commit()
     return habit
 
+@app.post("/habits/{habit_id}/complete", response_model=schemas.HabitLog)
+def complete_habit(
+    habit_id: int,
+    completion: Optional[schemas.HabitCompletion] = None,
+    idempotency_key: Optional[str] = Header(None),
+    db: Session = Depends(db_manager.get_db),
+):
+    return writes.write_completion(db, habit_id, completion, True, idempotency_key)
+
+@app.delete("/habits/{habit_id}/complete", response_model=schemas.HabitLog)
+def uncomplete_habit(
+    habit_id: int,
+    completion: Optional[schemas.HabitCompletion] = None,
+    idempotency_key: Optional[str] = Header(None),
+    db: Session = Depends(db_manager.get_db),
+):
+    return writes.write_completion(db, habit_id, completion, False, idempotency_key)
+
+@app.get("/events")
+async def stream_events():
+    """Server-Sent Events: one JSON delta per committed habit or log change (see events.py)"""
+    if not settings.events_enabled:
+        raise HTTPException(status_code=404, detail="Change feed is disabled")
+    return StreamingResponse(events.broadcaster.stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/metrics/db-pool")
+def read_pool_metrics():
+    return db_manager.pool_metrics()
+
+@app.get("/metrics/cache")
+def read_cache_metrics():
+    """Response cache hits, misses and evictions, for sizing CACHE_MAX_ENTRIES and CACHE_TTL_SECONDS"""
+    return cache.response_cache.stats()
+
+@app.get("/metrics/events")
+def read_event_metrics():
+    return events.broadcaster.stats()
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize database on startup"""
     try:
         db_manager.initialize_database()
+        if settings.completion_index_enabled:
+            completion_index.listen_for_invalidations()
+        if settings.events_enabled:
+            events.broadcaster.start()
+        pg_listener.start(db_manager.engine)
         logger.info("Application started successfully")
     except Exception as e:
         logger.error(f"Failed to initialize database: {e}")
-        raise
\ No newline at end of file
+        raise
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await db_manager.dispose_async_engine()
@@ -0,0 +1,148 @@
+"""Versioned schema migrations.
+
+Migrations are the numbered SQL files in ``migrations/`` (``0001_baseline.sql``,
+``0002_...``), applied in order, each in its own transaction, and recorded in
+``schema_version``. ``upgrade`` holds an exclusive advisory lock while it
+runs, so concurrent deploy steps apply each migration once; ``check`` takes
+the same lock in shared mode, waiting out a running upgrade without blocking
+other checkers.
+
+Run ``python migrate.py upgrade`` as a deploy step (``--create-database``
+creates the database first), ``python migrate.py status`` to list versions.
+Workers pick what they do at boot with ``DB_STARTUP_MODE`` (see
+``DatabaseManager.initialize_database``). In production they should start
+with ``DB_STARTUP_MODE=check`` (or ``skip``) after the deploy step has run,
+as docker-compose.prod.yml does with its one-off ``migrate`` service; the
+default, ``migrate``, suits a single development worker.
+"""
+import argparse
+import logging
+import os
+import re
+import sys
+from typing import List, NamedTuple
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Connection, Engine
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+# Arbitrary application-wide key for pg_advisory_lock
+MIGRATION_LOCK_ID = 7_245_061_904
+
+CREATE_VERSION_TABLE_SQL = text("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name VARCHAR NOT NULL,
+        applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+    )
+""")
+
+_FILENAME = re.compile(r"^(\d+)_(\w+)\.sql$")
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    path: str
+
+
+class SchemaOutOfDate(RuntimeError):
+    pass
+
+
+def available_migrations() -> List[Migration]:
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = _FILENAME.match(filename)
+        if match:
+            migrations.append(Migration(int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+    return migrations
+
+
+def latest_version() -> int:
+    migrations = available_migrations()
+    return migrations[-1].version if migrations else 0
+
+
+def current_version(conn: Connection) -> int:
+    """Highest applied version; 0 for a database that was never migrated."""
+    if conn.execute(text("SELECT to_regclass('schema_version')")).scalar() is None:
+        return 0
+    return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version")).scalar()
+
+
+def upgrade(engine: Engine) -> List[Migration]:
+    """Apply pending migrations under the exclusive migration lock; returns those applied."""
+    applied = []
+    with engine.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        conn.commit()
+        try:
+            conn.execute(CREATE_VERSION_TABLE_SQL)
+            conn.commit()
+            version = current_version(conn)
+            for migration in available_migrations():
+                if migration.version <= version:
+                    continue
+                with open(migration.path) as f:
+                    sql = f.read()
+                logger.info(f"Applying migration {migration.version:04d}_{migration.name}")
+                conn.execute(text("INSERT INTO schema_version (version, name) VALUES (:version, :name)"),
+                             {"version": migration.version, "name": migration.name})
+                # Through the DBAPI cursor: files hold several statements and literal % signs
+                conn.connection.cursor().execute(sql)
+                conn.commit()
+                applied.append(migration)
+        finally:
+            conn.rollback()
+            conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+            conn.commit()
+    return applied
+
+
+def check(engine: Engine) -> int:
+    """Raise SchemaOutOfDate unless every migration has been applied; returns the version."""
+    expected = latest_version()
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock_shared(:id)"), {"id": MIGRATION_LOCK_ID})
+        version = current_version(conn)
+    if version < expected:
+        raise SchemaOutOfDate(f"Database schema is at version {version}, code expects {expected}; "
+                              f"run `python migrate.py upgrade`")
+    return version
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply or inspect versioned schema migrations.")
+    parser.add_argument("command", choices=["upgrade", "check", "status"])
+    parser.add_argument("--create-database", action="store_true", help="create the database first if it is missing")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.create_database:
+        from database import db_manager
+
+        db_manager.create_database_if_not_exists()
+
+    engine = create_engine(settings.database_url)
+    try:
+        if args.command == "upgrade":
+            applied = upgrade(engine)
+            print(f"Applied {len(applied)} migration(s); schema is at version {latest_version()}.")
+        elif args.command == "check":
+            try:
+                print(f"Schema is up to date at version {check(engine)}.")
+            except SchemaOutOfDate as e:
+                print(e)
+                sys.exit(1)
+        else:
+            with engine.connect() as conn:
+                version = current_version(conn)
+            for migration in available_migrations():
+                print(f"{'applied' if migration.version <= version else 'pending'}  {migration.version:04d}_{migration.name}")
+    finally:
+        engine.dispose()
@@ -0,0 +1,81 @@
+-- Baseline: the schema as Base.metadata.create_all produced it, plus the
+-- constraints and indexes later changes relied on. Everything is guarded so
+-- databases bootstrapped by create_all adopt it without changes.
+
+DO $$ BEGIN
+    CREATE TYPE periodicityenum AS ENUM ('daily', 'weekly', 'monthly');
+EXCEPTION WHEN duplicate_object THEN NULL;
+END $$;
+
+CREATE TABLE IF NOT EXISTS habits (
+    id SERIAL PRIMARY KEY,
+    title VARCHAR NOT NULL,
+    description VARCHAR,
+    periodicity periodicityenum NOT NULL,
+    frequency INTEGER,
+    select_days VARCHAR,
+    start_date DATE NOT NULL,
+    end_date DATE,
+    reminder BOOLEAN,
+    icon VARCHAR
+);
+CREATE INDEX IF NOT EXISTS ix_habits_id ON habits (id);
+CREATE INDEX IF NOT EXISTS ix_habits_start_date_id ON habits (start_date, id);
+CREATE INDEX IF NOT EXISTS ix_habits_title_id ON habits (title, id);
+
+CREATE TABLE IF NOT EXISTS tags (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR NOT NULL UNIQUE
+);
+CREATE INDEX IF NOT EXISTS ix_tags_id ON tags (id);
+
+CREATE TABLE IF NOT EXISTS habit_tags (
+    habit_id INTEGER NOT NULL REFERENCES habits (id),
+    tag_id INTEGER NOT NULL REFERENCES tags (id),
+    PRIMARY KEY (habit_id, tag_id)
+);
+
+CREATE TABLE IF NOT EXISTS habit_logs (
+    id SERIAL PRIMARY KEY,
+    habit_id INTEGER NOT NULL REFERENCES habits (id),
+    log_date DATE NOT NULL,
+    completed BOOLEAN NOT NULL,
+    notes VARCHAR,
+    completed_at TIMESTAMP WITHOUT TIME ZONE,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    CONSTRAINT uq_habit_logs_habit_id_log_date UNIQUE (habit_id, log_date)
+);
+CREATE INDEX IF NOT EXISTS ix_habit_logs_id ON habit_logs (id);
+-- Superseded by the (habit_id, log_date) unique index
+DROP INDEX IF EXISTS ix_habit_logs_log_date;
+
+-- Tables created before the unique constraint existed may hold duplicate days;
+-- keep the newest row of each before adding it
+DO $$ BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'uq_habit_logs_habit_id_log_date') THEN
+        DELETE FROM habit_logs l
+        USING habit_logs newer
+        WHERE newer.habit_id = l.habit_id AND newer.log_date = l.log_date AND newer.id > l.id;
+        ALTER TABLE habit_logs ADD CONSTRAINT uq_habit_logs_habit_id_log_date UNIQUE (habit_id, log_date);
+    END IF;
+END $$;
+
+CREATE TABLE IF NOT EXISTS habit_streak_states (
+    habit_id INTEGER PRIMARY KEY REFERENCES habits (id) ON DELETE CASCADE,
+    current_run INTEGER NOT NULL,
+    current_run_start DATE,
+    current_run_end DATE,
+    last_completed_period DATE,
+    longest_run INTEGER NOT NULL,
+    longest_run_start DATE,
+    longest_run_end DATE,
+    updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key VARCHAR(255) PRIMARY KEY,
+    request_fingerprint VARCHAR NOT NULL,
+    response JSON NOT NULL,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_idempotency_keys_created_at ON idempotency_keys (created_at);
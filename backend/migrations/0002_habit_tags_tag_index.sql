@@ -0,0 +1,2 @@
+-- Reverse (tag_id, habit_id) index for tag filters and per-tag habit counts
+CREATE INDEX IF NOT EXISTS ix_habit_tags_tag_id_habit_id ON habit_tags (tag_id, habit_id);
@@ -0,0 +1,68 @@
+-- Row versions and per-collection high-water marks for conditional GETs (see etags.py).
+--
+-- Inserts and updates of habits and habit_logs take a fresh row_version from
+-- one sequence. Every statement that writes a collection's tables, deletes
+-- included, also moves that collection's row in collection_versions to a fresh
+-- value. The row lock taken by that update is held to commit, so writers of a
+-- collection commit in version order and a reader never sees a mark that an
+-- open transaction will later commit under.
+
+CREATE SEQUENCE IF NOT EXISTS row_version_seq;
+
+CREATE TABLE IF NOT EXISTS collection_versions (
+    collection VARCHAR PRIMARY KEY,
+    version BIGINT NOT NULL
+);
+INSERT INTO collection_versions (collection, version)
+SELECT collection, nextval('row_version_seq')
+FROM unnest(ARRAY['habits', 'habit_logs', 'tags']) AS collection
+ON CONFLICT (collection) DO NOTHING;
+
+-- habits is small: existing rows get versions now. habit_logs can be large, so
+-- its default only applies to new rows (no table rewrite); old rows stay NULL
+-- until they are next written.
+ALTER TABLE habits ADD COLUMN IF NOT EXISTS row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq');
+ALTER TABLE habit_logs ADD COLUMN IF NOT EXISTS row_version BIGINT;
+ALTER TABLE habit_logs ALTER COLUMN row_version SET DEFAULT nextval('row_version_seq');
+
+CREATE OR REPLACE FUNCTION bump_row_version() RETURNS trigger AS $$
+BEGIN
+    NEW.row_version := nextval('row_version_seq');
+    RETURN NEW;
+END $$ LANGUAGE plpgsql;
+
+-- A habit's version also covers its tag links
+CREATE OR REPLACE FUNCTION bump_habit_row_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE habits SET row_version = nextval('row_version_seq')
+    WHERE id = CASE WHEN TG_OP = 'DELETE' THEN OLD.habit_id ELSE NEW.habit_id END;
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION bump_collection_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE collection_versions SET version = nextval('row_version_seq') WHERE collection = TG_ARGV[0];
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER habits_row_version
+    BEFORE UPDATE ON habits FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+CREATE OR REPLACE TRIGGER habit_logs_row_version
+    BEFORE UPDATE ON habit_logs FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+CREATE OR REPLACE TRIGGER habit_tags_habit_row_version
+    AFTER INSERT OR UPDATE OR DELETE ON habit_tags FOR EACH ROW EXECUTE FUNCTION bump_habit_row_version();
+
+-- habit_tags counts as part of habits, so creating or deleting a habit locks one
+-- collection row and cannot deadlock against the other
+CREATE OR REPLACE TRIGGER habits_collection_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON habits
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_collection_version('habits');
+CREATE OR REPLACE TRIGGER habit_tags_collection_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON habit_tags
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_collection_version('habits');
+CREATE OR REPLACE TRIGGER habit_logs_collection_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON habit_logs
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_collection_version('habit_logs');
+CREATE OR REPLACE TRIGGER tags_collection_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON tags
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_collection_version('tags');
@@ -0,0 +1,204 @@
+-- habit_logs range-partitioned by month of log_date, and the archive cold
+-- months are compacted into (see partitions.py).
+--
+-- Existing rows are copied into the new table: on a large database, run this
+-- migration in a maintenance window.
+
+-- The old table steps aside; its sequence is taken over by the new one
+ALTER TABLE habit_logs RENAME TO habit_logs_unpartitioned;
+ALTER INDEX habit_logs_pkey RENAME TO habit_logs_unpartitioned_pkey;
+ALTER INDEX uq_habit_logs_habit_id_log_date RENAME TO uq_habit_logs_unpartitioned_habit_id_log_date;
+DROP INDEX IF EXISTS ix_habit_logs_id;
+DROP TRIGGER habit_logs_row_version ON habit_logs_unpartitioned;
+DROP TRIGGER habit_logs_collection_version ON habit_logs_unpartitioned;
+-- Billions of rows do not fit an integer id
+ALTER SEQUENCE habit_logs_id_seq AS BIGINT;
+
+-- Unique constraints of a partitioned table must include log_date. The
+-- sequence keeps ids unique on its own.
+CREATE TABLE habit_logs (
+    id BIGINT NOT NULL DEFAULT nextval('habit_logs_id_seq'),
+    habit_id INTEGER NOT NULL REFERENCES habits (id) ON DELETE CASCADE,
+    log_date DATE NOT NULL,
+    completed BOOLEAN NOT NULL,
+    notes VARCHAR,
+    completed_at TIMESTAMP WITHOUT TIME ZONE,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    row_version BIGINT DEFAULT nextval('row_version_seq'),
+    PRIMARY KEY (id, log_date),
+    CONSTRAINT uq_habit_logs_habit_id_log_date UNIQUE (habit_id, log_date)
+) PARTITION BY RANGE (log_date);
+ALTER SEQUENCE habit_logs_id_seq OWNED BY habit_logs.id;
+
+-- Dates without a monthly partition land here until maintenance moves them
+CREATE TABLE habit_logs_default PARTITION OF habit_logs DEFAULT;
+
+-- Creates the partition for the month containing first_day, moving that
+-- month's rows out of the default partition; false if it already exists.
+CREATE OR REPLACE FUNCTION create_habit_log_partition(first_day DATE) RETURNS BOOLEAN AS $$
+DECLARE
+    month_start DATE := date_trunc('month', first_day);
+    month_end DATE := month_start + interval '1 month';
+    partition_name TEXT := 'habit_logs_' || to_char(month_start, 'YYYY_MM');
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN false;
+    END IF;
+    -- Writes routed to the default partition wait; others go on
+    LOCK TABLE habit_logs_default IN EXCLUSIVE MODE;
+    EXECUTE format('CREATE TABLE %I (LIKE habit_logs INCLUDING DEFAULTS)', partition_name);
+    EXECUTE format('WITH moved AS (DELETE FROM habit_logs_default WHERE log_date >= %L AND log_date < %L RETURNING *) '
+                   'INSERT INTO %I SELECT * FROM moved', month_start, month_end, partition_name);
+    EXECUTE format('ALTER TABLE habit_logs ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                   partition_name, month_start, month_end);
+    RETURN true;
+END $$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    month_start DATE;
+BEGIN
+    FOR month_start IN
+        SELECT DISTINCT date_trunc('month', log_date)::date FROM habit_logs_unpartitioned
+        UNION
+        SELECT generate_series(date_trunc('month', current_date), date_trunc('month', current_date) + interval '3 months',
+                               interval '1 month')::date
+    LOOP
+        PERFORM create_habit_log_partition(month_start);
+    END LOOP;
+END $$;
+
+INSERT INTO habit_logs (id, habit_id, log_date, completed, notes, completed_at, created_at, row_version)
+SELECT id, habit_id, log_date, completed, notes, completed_at, created_at, row_version
+FROM habit_logs_unpartitioned;
+DROP TABLE habit_logs_unpartitioned;
+
+-- The row trigger is cloned onto every partition, present and future; the
+-- statement trigger only fires for statements on habit_logs itself
+CREATE TRIGGER habit_logs_row_version
+    BEFORE UPDATE ON habit_logs FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+CREATE TRIGGER habit_logs_collection_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON habit_logs
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_collection_version('habit_logs');
+
+-- One row per habit and archived month. Bit d - 1 of the bitmaps stands for
+-- day d; ids and timestamps are not kept.
+CREATE TABLE habit_log_archive (
+    habit_id INTEGER NOT NULL REFERENCES habits (id) ON DELETE CASCADE,
+    month DATE NOT NULL,
+    logged_days INTEGER NOT NULL,
+    completed_days INTEGER NOT NULL,
+    -- Day of month -> note, for the days that had one
+    notes JSONB,
+    PRIMARY KEY (habit_id, month)
+);
+-- Date-bounded reads over all habits skip the archive through this one
+CREATE INDEX ix_habit_log_archive_month ON habit_log_archive (month);
+
+-- Compacts one month of habit_logs into habit_log_archive and empties its
+-- partition; returns the number of habit-months archived. Writes to the
+-- month wait until it commits; reads go on.
+CREATE OR REPLACE FUNCTION archive_habit_log_month(first_day DATE) RETURNS INTEGER AS $$
+DECLARE
+    month_start DATE := date_trunc('month', first_day);
+    month_end DATE := month_start + interval '1 month';
+    partition regclass := to_regclass('habit_logs_' || to_char(month_start, 'YYYY_MM'));
+    archived INTEGER;
+BEGIN
+    IF partition IS NOT NULL THEN
+        EXECUTE format('LOCK TABLE %s IN EXCLUSIVE MODE', partition);
+    END IF;
+    LOCK TABLE habit_logs_default IN EXCLUSIVE MODE;
+
+    INSERT INTO habit_log_archive (habit_id, month, logged_days, completed_days, notes)
+    SELECT habit_id, month_start,
+           bit_or(1 << (EXTRACT(DAY FROM log_date)::int - 1)),
+           COALESCE(bit_or(1 << (EXTRACT(DAY FROM log_date)::int - 1)) FILTER (WHERE completed), 0),
+           jsonb_object_agg(EXTRACT(DAY FROM log_date)::int, notes) FILTER (WHERE notes IS NOT NULL)
+    FROM habit_logs
+    WHERE log_date >= month_start AND log_date < month_end
+    GROUP BY habit_id
+    -- Live days win over archived ones
+    ON CONFLICT (habit_id, month) DO UPDATE
+    SET logged_days = habit_log_archive.logged_days | EXCLUDED.logged_days,
+        completed_days = habit_log_archive.completed_days & ~EXCLUDED.logged_days | EXCLUDED.completed_days,
+        notes = COALESCE(habit_log_archive.notes || EXCLUDED.notes, EXCLUDED.notes, habit_log_archive.notes);
+    GET DIAGNOSTICS archived = ROW_COUNT;
+
+    IF partition IS NOT NULL THEN
+        EXECUTE format('TRUNCATE %s', partition);
+    END IF;
+    DELETE FROM habit_logs_default WHERE log_date >= month_start AND log_date < month_end;
+    -- Archived days lose their ids; written through the partitions, so no trigger does this
+    UPDATE collection_versions SET version = nextval('row_version_seq') WHERE collection = 'habit_logs';
+    RETURN archived;
+END $$ LANGUAGE plpgsql;
+
+-- Turns a habit's archived month back into live rows, leaving out skip_day;
+-- returns the archive row (all NULL if there was none).
+CREATE OR REPLACE FUNCTION restore_archived_habit_log_month(habit INTEGER, first_day DATE, skip_day DATE DEFAULT NULL)
+RETURNS habit_log_archive AS $$
+DECLARE
+    archived habit_log_archive%ROWTYPE;
+BEGIN
+    DELETE FROM habit_log_archive
+    WHERE habit_id = habit AND month = date_trunc('month', first_day)::date
+    RETURNING * INTO archived;
+    IF FOUND THEN
+        INSERT INTO habit_logs (habit_id, log_date, completed, notes, created_at)
+        SELECT archived.habit_id, archived.month + d.day, archived.completed_days & (1 << d.day) <> 0,
+               archived.notes ->> (d.day + 1)::text, now()
+        FROM generate_series(0, 30) AS d(day)
+        WHERE archived.logged_days & (1 << d.day) <> 0
+          AND archived.month + d.day IS DISTINCT FROM skip_day;
+    END IF;
+    RETURN archived;
+END $$ LANGUAGE plpgsql;
+
+-- A write to an archived month first turns that habit's month back into
+-- live rows, so a day is never both live and archived. The written day is
+-- not restored as a row, which would collide with the statement's own ON
+-- CONFLICT handling; its note carries over unless the write sets one.
+-- Multi-row writes restore their months beforehand (see bulk_logs.py).
+CREATE OR REPLACE FUNCTION restore_archived_habit_logs() RETURNS trigger AS $$
+DECLARE
+    archived habit_log_archive%ROWTYPE;
+BEGIN
+    archived := restore_archived_habit_log_month(NEW.habit_id, NEW.log_date, NEW.log_date);
+    NEW.notes := COALESCE(NEW.notes, archived.notes ->> EXTRACT(DAY FROM NEW.log_date)::int::text);
+    RETURN NEW;
+END $$ LANGUAGE plpgsql;
+
+-- (Re)creates the restore trigger for every archived month and the months
+-- before archived_before. Its WHEN clause keeps inserts of recent days from
+-- calling it at all. Run it in its own transaction before archiving.
+CREATE OR REPLACE FUNCTION cover_archived_habit_logs(archived_before DATE) RETURNS DATE AS $$
+BEGIN
+    archived_before := GREATEST(archived_before,
+                                (SELECT MAX(month) + interval '1 month' FROM habit_log_archive)::date);
+    DROP TRIGGER IF EXISTS habit_logs_restore_archived ON habit_logs;
+    EXECUTE format('CREATE TRIGGER habit_logs_restore_archived BEFORE INSERT ON habit_logs FOR EACH ROW '
+                   'WHEN (NEW.log_date < %L) EXECUTE FUNCTION restore_archived_habit_logs()', archived_before);
+    RETURN archived_before;
+END $$ LANGUAGE plpgsql;
+
+-- Live and archived logs between two days, for readers that may cross the
+-- archive boundary. Inlined by the planner, so the date range prunes
+-- partitions and outer conditions reach both halves. Archived days have no
+-- id or completed_at.
+CREATE OR REPLACE FUNCTION habit_log_history(first_day DATE DEFAULT '-infinity', last_day DATE DEFAULT 'infinity')
+RETURNS TABLE (id BIGINT, habit_id INTEGER, log_date DATE, completed BOOLEAN, notes VARCHAR,
+               completed_at TIMESTAMP WITHOUT TIME ZONE)
+AS $$
+    SELECT l.id, l.habit_id, l.log_date, l.completed, l.notes, l.completed_at
+    FROM habit_logs l
+    WHERE l.log_date BETWEEN first_day AND last_day
+    UNION ALL
+    SELECT NULL::bigint, a.habit_id, (a.month + d.day)::date, a.completed_days & (1 << d.day) <> 0,
+           (a.notes ->> (d.day + 1)::text)::varchar, NULL::timestamp
+    FROM habit_log_archive a
+    CROSS JOIN generate_series(0, 30) AS d(day)
+    WHERE a.month BETWEEN date_trunc('month', first_day)::date AND last_day
+      AND a.logged_days & (1 << d.day) <> 0
+      AND a.month + d.day BETWEEN first_day AND last_day
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,123 @@
+-- Completed days per habit and ISO week, and per habit and month, for
+-- period-based reads (streaks, completion rates, week and month heatmaps).
+-- See rollups.py.
+--
+-- Kept up to date by statement triggers on habit_logs, so every write path
+-- (single-day upserts, bulk imports, deletes) adjusts the counts of the
+-- periods it touched in one set-based statement. Archiving leaves the counts
+-- alone: archived days still count.
+
+CREATE TABLE habit_completion_rollups (
+    habit_id INTEGER NOT NULL REFERENCES habits (id) ON DELETE CASCADE,
+    -- 'weekly' or 'monthly'
+    periodicity periodicityenum NOT NULL,
+    -- Numbered as in streaks.py: ISO weeks and months counted from 0001-01-01
+    period INTEGER NOT NULL,
+    completed INTEGER NOT NULL,
+    PRIMARY KEY (habit_id, periodicity, period)
+);
+
+-- The week and the month a day counts towards
+CREATE OR REPLACE FUNCTION habit_log_rollup_periods(day DATE)
+RETURNS TABLE (periodicity periodicityenum, period INTEGER) AS $$
+    VALUES ('weekly'::periodicityenum, (day - DATE '0001-01-01') / 7),
+           ('monthly'::periodicityenum, EXTRACT(YEAR FROM day)::int * 12 + EXTRACT(MONTH FROM day)::int - 1)
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Transition tables cannot be shared between events, hence one branch per
+-- operation. Rows are written in key order so concurrent writers cannot
+-- deadlock on them.
+CREATE OR REPLACE FUNCTION roll_up_habit_logs() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO habit_completion_rollups (habit_id, periodicity, period, completed)
+        SELECT n.habit_id, p.periodicity, p.period, COUNT(*)
+        FROM new_rows n
+        CROSS JOIN LATERAL habit_log_rollup_periods(n.log_date) p
+        WHERE n.completed
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT (habit_id, periodicity, period) DO UPDATE
+        SET completed = habit_completion_rollups.completed + EXCLUDED.completed;
+    ELSIF TG_OP = 'UPDATE' THEN
+        -- Rows whose completion did not change cancel out
+        INSERT INTO habit_completion_rollups (habit_id, periodicity, period, completed)
+        SELECT c.habit_id, p.periodicity, p.period, SUM(c.delta)
+        FROM (
+            SELECT habit_id, log_date, 1 AS delta FROM new_rows WHERE completed
+            UNION ALL
+            SELECT habit_id, log_date, -1 FROM old_rows WHERE completed
+        ) c
+        CROSS JOIN LATERAL habit_log_rollup_periods(c.log_date) p
+        GROUP BY 1, 2, 3
+        HAVING SUM(c.delta) <> 0
+        ORDER BY 1, 2, 3
+        ON CONFLICT (habit_id, periodicity, period) DO UPDATE
+        SET completed = habit_completion_rollups.completed + EXCLUDED.completed;
+    ELSE
+        -- No inserts: the habit itself may be going away
+        UPDATE habit_completion_rollups r
+        SET completed = r.completed - c.completed
+        FROM (
+            SELECT o.habit_id, p.periodicity, p.period, COUNT(*) AS completed
+            FROM old_rows o
+            CROSS JOIN LATERAL habit_log_rollup_periods(o.log_date) p
+            WHERE o.completed
+            GROUP BY 1, 2, 3
+            ORDER BY 1, 2, 3
+        ) c
+        WHERE r.habit_id = c.habit_id AND r.periodicity = c.periodicity AND r.period = c.period;
+    END IF;
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+
+CREATE TRIGGER habit_logs_rollup_insert
+    AFTER INSERT ON habit_logs REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION roll_up_habit_logs();
+CREATE TRIGGER habit_logs_rollup_update
+    AFTER UPDATE ON habit_logs REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION roll_up_habit_logs();
+CREATE TRIGGER habit_logs_rollup_delete
+    AFTER DELETE ON habit_logs REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION roll_up_habit_logs();
+
+-- As in 0004, except that the restored month's completed days leave the
+-- rollups first: the inserts below count them again, and the write that
+-- triggered the restore counts skip_day.
+CREATE OR REPLACE FUNCTION restore_archived_habit_log_month(habit INTEGER, first_day DATE, skip_day DATE DEFAULT NULL)
+RETURNS habit_log_archive AS $$
+DECLARE
+    archived habit_log_archive%ROWTYPE;
+BEGIN
+    DELETE FROM habit_log_archive
+    WHERE habit_id = habit AND month = date_trunc('month', first_day)::date
+    RETURNING * INTO archived;
+    IF FOUND THEN
+        UPDATE habit_completion_rollups r
+        SET completed = r.completed - c.completed
+        FROM (
+            SELECT p.periodicity, p.period, COUNT(*) AS completed
+            FROM generate_series(0, 30) AS d(day)
+            CROSS JOIN LATERAL habit_log_rollup_periods(archived.month + d.day) p
+            WHERE archived.completed_days & (1 << d.day) <> 0
+            GROUP BY 1, 2
+        ) c
+        WHERE r.habit_id = habit AND r.periodicity = c.periodicity AND r.period = c.period;
+
+        INSERT INTO habit_logs (habit_id, log_date, completed, notes, created_at)
+        SELECT archived.habit_id, archived.month + d.day, archived.completed_days & (1 << d.day) <> 0,
+               archived.notes ->> (d.day + 1)::text, now()
+        FROM generate_series(0, 30) AS d(day)
+        WHERE archived.logged_days & (1 << d.day) <> 0
+          AND archived.month + d.day IS DISTINCT FROM skip_day;
+    END IF;
+    RETURN archived;
+END $$ LANGUAGE plpgsql;
+
+-- Backfill from live and archived logs
+INSERT INTO habit_completion_rollups (habit_id, periodicity, period, completed)
+SELECT l.habit_id, p.periodicity, p.period, COUNT(*)
+FROM habit_log_history() l
+CROSS JOIN LATERAL habit_log_rollup_periods(l.log_date) p
+WHERE l.completed
+GROUP BY 1, 2, 3;
@@ -0,0 +1,86 @@
+-- Collection versions without a hot row (see etags.py).
+--
+-- Migration 0003 moved one row of collection_versions per collection on every
+-- write statement, and that row's lock was held until commit: every writer of
+-- a collection, bulk imports included, queued behind the one before it.
+--
+-- Writers now only insert. Each write statement adds a row to
+-- collection_changes that stands for itself plus the older rows of the
+-- collection it deletes; rows another open transaction has locked are
+-- skipped, never waited for. A collection's version is the sum of its
+-- visible rows: every commit adds exactly one per write statement, whatever
+-- order transactions commit in, so a reader never sees a version that a
+-- later commit would leave unchanged, and the table stays about as small as
+-- the number of concurrent writers.
+
+CREATE TABLE collection_changes (
+    id BIGSERIAL PRIMARY KEY,
+    collection VARCHAR NOT NULL,
+    -- Write statements this row stands for
+    changes BIGINT NOT NULL
+);
+CREATE INDEX ix_collection_changes_collection ON collection_changes (collection, id);
+
+-- Versions carry on from the old marks, so no ETag handed out before comes back
+INSERT INTO collection_changes (collection, changes)
+SELECT collection, version FROM collection_versions;
+
+CREATE OR REPLACE FUNCTION note_collection_change(changed VARCHAR) RETURNS void AS $$
+    WITH folded AS (
+        DELETE FROM collection_changes
+        WHERE id IN (SELECT id FROM collection_changes WHERE collection = changed
+                     ORDER BY id LIMIT 64 FOR UPDATE SKIP LOCKED)
+        RETURNING changes
+    )
+    INSERT INTO collection_changes (collection, changes)
+    SELECT changed, 1 + COALESCE(SUM(changes), 0) FROM folded
+$$ LANGUAGE sql;
+
+-- The statement triggers of 0003 and 0004 keep calling this one
+CREATE OR REPLACE FUNCTION bump_collection_version() RETURNS trigger AS $$
+BEGIN
+    PERFORM note_collection_change(TG_ARGV[0]);
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;
+
+-- As in 0004, except for how the change to habit_logs is noted.
+-- Compacts one month of habit_logs into habit_log_archive and empties its
+-- partition; returns the number of habit-months archived. Writes to the
+-- month wait until it commits; reads go on.
+CREATE OR REPLACE FUNCTION archive_habit_log_month(first_day DATE) RETURNS INTEGER AS $$
+DECLARE
+    month_start DATE := date_trunc('month', first_day);
+    month_end DATE := month_start + interval '1 month';
+    partition regclass := to_regclass('habit_logs_' || to_char(month_start, 'YYYY_MM'));
+    archived INTEGER;
+BEGIN
+    IF partition IS NOT NULL THEN
+        EXECUTE format('LOCK TABLE %s IN EXCLUSIVE MODE', partition);
+    END IF;
+    LOCK TABLE habit_logs_default IN EXCLUSIVE MODE;
+
+    INSERT INTO habit_log_archive (habit_id, month, logged_days, completed_days, notes)
+    SELECT habit_id, month_start,
+           bit_or(1 << (EXTRACT(DAY FROM log_date)::int - 1)),
+           COALESCE(bit_or(1 << (EXTRACT(DAY FROM log_date)::int - 1)) FILTER (WHERE completed), 0),
+           jsonb_object_agg(EXTRACT(DAY FROM log_date)::int, notes) FILTER (WHERE notes IS NOT NULL)
+    FROM habit_logs
+    WHERE log_date >= month_start AND log_date < month_end
+    GROUP BY habit_id
+    -- Live days win over archived ones
+    ON CONFLICT (habit_id, month) DO UPDATE
+    SET logged_days = habit_log_archive.logged_days | EXCLUDED.logged_days,
+        completed_days = habit_log_archive.completed_days & ~EXCLUDED.logged_days | EXCLUDED.completed_days,
+        notes = COALESCE(habit_log_archive.notes || EXCLUDED.notes, EXCLUDED.notes, habit_log_archive.notes);
+    GET DIAGNOSTICS archived = ROW_COUNT;
+
+    IF partition IS NOT NULL THEN
+        EXECUTE format('TRUNCATE %s', partition);
+    END IF;
+    DELETE FROM habit_logs_default WHERE log_date >= month_start AND log_date < month_end;
+    -- Archived days lose their ids; written through the partitions, so no trigger does this
+    PERFORM note_collection_change('habit_logs');
+    RETURN archived;
+END $$ LANGUAGE plpgsql;
+
+DROP TABLE collection_versions;
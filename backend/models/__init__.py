@@ -1,3 +1,4 @@
-from .habit import Habit, Tag, PeriodicityEnum, HabitLog
+from .habit import Habit, Tag, PeriodicityEnum, HabitLog, HabitStreakState, HabitCompletionRollup
+from .idempotency import IdempotencyKey
 
-__all__ = ["Habit", "Tag", "PeriodicityEnum", "HabitLog"]
\ No newline at end of file
+__all__ = ["Habit", "Tag", "PeriodicityEnum", "HabitLog", "HabitStreakState", "HabitCompletionRollup", "IdempotencyKey"]
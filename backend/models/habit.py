@@ -1,9 +1,13 @@
-from sqlalchemy import Column, String, Boolean, Date, Integer, Enum, ForeignKey, Table, DateTime
+from sqlalchemy import Column, String, Boolean, Date, Integer, BigInteger, Enum, FetchedValue, ForeignKey, Table, DateTime, Index, UniqueConstraint, func, select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import relationship, declarative_base, Session
 from datetime import datetime, date, timedelta
 import enum
 
+import events
 from database import Base  # Assuming you have a database.py that defines Base
+from completion_index import completion_index, record_log_write
+from streaks import StreakStats, day_period
 
 
 class PeriodicityEnum(str, enum.Enum):
@@ -18,6 +22,8 @@ habit_tags = Table(
     Base.metadata,
     Column('habit_id', Integer, ForeignKey('habits.id'), primary_key=True),
     Column('tag_id', Integer, ForeignKey('tags.id'), primary_key=True),
+    # Reverse of the primary key, for tag -> habits lookups
+    Index('ix_habit_tags_tag_id_habit_id', 'tag_id', 'habit_id'),
 )
 
 
@@ -34,161 +40,75 @@ class Habit(Base):
     end_date = Column(Date, nullable=True)
     reminder = Column(Boolean, default=False)
     icon = Column(String, nullable=True)
+    # Set from row_version_seq on every write, including tag link changes (migration 0003)
+    row_version = Column(BigInteger, server_default=FetchedValue(), server_onupdate=FetchedValue())
 
     tags = relationship("Tag", secondary=habit_tags, back_populates="habits")
-    habit_logs = relationship("HabitLog", back_populates="habit", cascade="all, delete-orphan")
+    # Logs (live and archived) go with the habit through ON DELETE CASCADE
+    habit_logs = relationship("HabitLog", back_populates="habit", cascade="all, delete-orphan", passive_deletes=True)
+    streak_state = relationship("HabitStreakState", uselist=False, cascade="all, delete-orphan", passive_deletes=True)
 
-    def get_current_streak(self, db: Session) -> int:
-        """Calculate the current streak for this habit."""
-        today = date.today()
+    # Keyset pagination orders (see pagination.py); id is the tie-breaker
+    __table_args__ = (
+        Index('ix_habits_start_date_id', 'start_date', 'id'),
+        Index('ix_habits_title_id', 'title', 'id'),
+    )
 
-        if self.periodicity == PeriodicityEnum.daily:
-            return self._calculate_daily_streak(db, today)
-        elif self.periodicity == PeriodicityEnum.weekly:
-            return self._calculate_weekly_streak(db, today)
-        elif self.periodicity == PeriodicityEnum.monthly:
-            return self._calculate_monthly_streak(db, today)
-
-        return 0
-
-    def _calculate_daily_streak(self, db: Session, today: date) -> int:
-        """Calculate streak for daily habits."""
-        streak = 0
-        current_date = today
-
-        while current_date >= self.start_date:
-            log = db.query(HabitLog).filter(
-                HabitLog.habit_id == self.id,
-                HabitLog.log_date == current_date
-            ).first()
-
-            if log and log.completed:
-                streak += 1
-                current_date -= timedelta(days=1)
-            else:
-                break
-
-        return streak
-
-    def _calculate_weekly_streak(self, db: Session, today: date) -> int:
-        """Calculate streak for weekly habits."""
-        streak = 0
-        current_week_start = today - timedelta(days=today.weekday())  # Monday of current week
-
-        while current_week_start >= self.start_date:
-            week_end = current_week_start + timedelta(days=6)  # Sunday of the week
-
-            # Count completed logs in this week
-            completed_logs = db.query(HabitLog).filter(
-                HabitLog.habit_id == self.id,
-                HabitLog.log_date >= current_week_start,
-                HabitLog.log_date <= week_end,
-                HabitLog.completed == True
-            ).count()
-
-            # Check if the weekly target was met
-            target_frequency = self.frequency or 1
-            if completed_logs >= target_frequency:
-                streak += 1
-                current_week_start -= timedelta(days=7)  # Previous week
-            else:
-                break
-
-        return streak
-
-    def _calculate_monthly_streak(self, db: Session, today: date) -> int:
-        """Calculate streak for monthly habits."""
-        streak = 0
-        current_month_start = today.replace(day=1)
-
-        while current_month_start >= self.start_date:
-            # Get the last day of the current month
-            if current_month_start.month == 12:
-                next_month = current_month_start.replace(year=current_month_start.year + 1, month=1)
-            else:
-                next_month = current_month_start.replace(month=current_month_start.month + 1)
-
-            month_end = next_month - timedelta(days=1)
-
-            # Count completed logs in this month
-            completed_logs = db.query(HabitLog).filter(
-                HabitLog.habit_id == self.id,
-                HabitLog.log_date >= current_month_start,
-                HabitLog.log_date <= month_end,
-                HabitLog.completed == True
-            ).count()
-
-            # Check if the monthly target was met
-            target_frequency = self.frequency or 1
-            if completed_logs >= target_frequency:
-                streak += 1
-                # Move to previous month
-                if current_month_start.month == 1:
-                    current_month_start = current_month_start.replace(year=current_month_start.year - 1, month=12)
-                else:
-                    current_month_start = current_month_start.replace(month=current_month_start.month - 1)
-            else:
-                break
-
-        return streak
+    def get_current_streak(self, db: Session) -> int:
+        """Current streak, read from the persisted streak state."""
+        return self.get_streaks(db).current
 
     def get_longest_streak(self, db: Session) -> int:
-        """Calculate the longest streak ever achieved for this habit."""
-        if self.periodicity == PeriodicityEnum.daily:
-            return self._get_longest_daily_streak(db)
-        elif self.periodicity == PeriodicityEnum.weekly:
-            return self._get_longest_weekly_streak(db)
-        elif self.periodicity == PeriodicityEnum.monthly:
-            return self._get_longest_monthly_streak(db)
-
-        return 0
-
-    def _get_longest_daily_streak(self, db: Session) -> int:
-        """Get longest streak for daily habits."""
-        logs = db.query(HabitLog).filter(
-            HabitLog.habit_id == self.id,
-            HabitLog.completed == True
-        ).order_by(HabitLog.log_date).all()
-
-        if not logs:
-            return 0
-
-        longest_streak = 1
-        current_streak = 1
-
-        for i in range(1, len(logs)):
-            expected_date = logs[i - 1].log_date + timedelta(days=1)
-            if logs[i].log_date == expected_date:
-                current_streak += 1
-                longest_streak = max(longest_streak, current_streak)
-            else:
-                current_streak = 1
-
-        return longest_streak
-
-    def _get_longest_weekly_streak(self, db: Session) -> int:
-        """Get longest streak for weekly habits (simplified version)."""
-        # This is a simplified version - could be enhanced with more complex logic
-        weeks_with_completion = db.query(HabitLog).filter(
-            HabitLog.habit_id == self.id,
-            HabitLog.completed == True
-        ).distinct().count()
-
-        return min(weeks_with_completion, self.get_current_streak(db))
-
-    def _get_longest_monthly_streak(self, db: Session) -> int:
-        """Get longest streak for monthly habits (simplified version)."""
-        # This is a simplified version - could be enhanced with more complex logic
-        months_with_completion = db.query(HabitLog).filter(
-            HabitLog.habit_id == self.id,
-            HabitLog.completed == True
-        ).distinct().count()
-
-        return min(months_with_completion, self.get_current_streak(db))
+        """Longest streak, read from the persisted streak state."""
+        return self.get_streaks(db).longest
+
+    def get_streaks(self, db: Session) -> StreakStats:
+        """Current and longest streak from the completion index or the streak state row (one primary-key lookup)."""
+        if completion_index.enabled:
+            return completion_index.history(db, self.id).streaks(self.periodicity.value, self._period_target(), self.start_date)
+
+        # Imported here: streak_state imports this module for HabitStreakState
+        from streak_state import streaks_for
+
+        return streaks_for(db, self)
+
+    @staticmethod
+    def tag_filter(tag_names: list, match_all: bool = False):
+        """WHERE clause keeping habits tagged with any (or all) of ``tag_names``."""
+        tagged = (
+            select(habit_tags.c.habit_id)
+            .join(Tag, Tag.id == habit_tags.c.tag_id)
+            .where(Tag.name.in_(tag_names))
+        )
+        if match_all:
+            tagged = tagged.group_by(habit_tags.c.habit_id).having(func.count() == len(set(tag_names)))
+        return Habit.id.in_(tagged)
+
+    @staticmethod
+    def load_recent_logs(db: Session, habits: list, days: int) -> None:
+        """Set ``recent_logs`` on each habit to its logs of the last ``days`` days, using one query."""
+        by_habit = {habit.id: [] for habit in habits}
+        if by_habit:
+            since = date.today() - timedelta(days=days - 1)
+            logs = db.query(HabitLog).filter(
+                HabitLog.habit_id.in_(by_habit),
+                HabitLog.log_date >= since
+            ).order_by(HabitLog.habit_id, HabitLog.log_date)
+            for log in logs:
+                by_habit[log.habit_id].append(log)
+        for habit in habits:
+            habit.recent_logs = by_habit[habit.id]
+
+    def _period_target(self) -> int:
+        """Completed logs a period needs to count towards a streak."""
+        return 1 if self.periodicity == PeriodicityEnum.daily else (self.frequency or 1)
 
     def is_completed_today(self, db: Session) -> bool:
         """Check if the habit was completed today."""
         today = date.today()
+        if completion_index.enabled:
+            return completion_index.history(db, self.id).is_completed(day_period(today))
+
         log = db.query(HabitLog).filter(
             HabitLog.habit_id == self.id,
             HabitLog.log_date == today
@@ -201,27 +121,8 @@ class Habit(Base):
         if log_date is None:
             log_date = date.today()
 
-        # Check if log already exists
-        existing_log = db.query(HabitLog).filter(
-            HabitLog.habit_id == self.id,
-            HabitLog.log_date == log_date
-        ).first()
-
-        if existing_log:
-            existing_log.completed = True
-            existing_log.notes = notes
-            existing_log.completed_at = datetime.now()
-            log = existing_log
-        else:
-            log = HabitLog(
-                habit_id=self.id,
-                log_date=log_date,
-                completed=True,
-                notes=notes,
-                completed_at=datetime.now()
-            )
-            db.add(log)
-
+        log = self._upsert_log(db, log_date, completed=True, notes=notes, completed_at=datetime.now())
+        self._record_log_change(db, log_date, True)
         db.commit()
         return log
 
@@ -230,45 +131,91 @@ class Habit(Base):
         if log_date is None:
             log_date = date.today()
 
-        # Check if log already exists
-        existing_log = db.query(HabitLog).filter(
-            HabitLog.habit_id == self.id,
-            HabitLog.log_date == log_date
-        ).first()
-
-        if existing_log:
-            existing_log.completed = False
-            existing_log.completed_at = None
-            log = existing_log
-        else:
-            log = HabitLog(
-                habit_id=self.id,
-                log_date=log_date,
-                completed=False
-            )
-            db.add(log)
-
+        log = self._upsert_log(db, log_date, completed=False, completed_at=None)
+        self._record_log_change(db, log_date, False)
         db.commit()
         return log
 
+    def _upsert_log(self, db: Session, log_date: date, **values) -> 'HabitLog':
+        """Insert or update the log for ``log_date`` in a single statement.
+
+        Concurrent writes for the same day (double taps, retries) meet on the
+        (habit_id, log_date) unique constraint instead of creating duplicates.
+        Columns not in ``values`` keep their stored value on update.
+        """
+        stmt = insert(HabitLog).values(habit_id=self.id, log_date=log_date, **values)
+        stmt = stmt.on_conflict_do_update(
+            constraint='uq_habit_logs_habit_id_log_date',
+            set_={name: stmt.excluded[name] for name in values},
+        ).returning(HabitLog)
+        return db.scalars(stmt, execution_options={"populate_existing": True}).one()
+
+    def _record_log_change(self, db: Session, log_date: date, completed: bool) -> None:
+        """Bring derived state in line with a log write, inside the caller's transaction."""
+        from streak_state import record_log_change
+
+        db.flush()
+        record_log_change(db, self, log_date)
+        record_log_write(db, self.id, log_date, completed)
+        events.publish(db, {"type": "log", "habit_id": self.id, "log_date": log_date, "completed": completed})
+
 
 class HabitLog(Base):
     __tablename__ = 'habit_logs'
 
-    id = Column(Integer, primary_key=True, index=True)
-    habit_id = Column(Integer, ForeignKey('habits.id'), nullable=False)
-    log_date = Column(Date, nullable=False, index=True)
+    # Partitioned by month of log_date (migration 0004, see partitions.py), which every unique key must include
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    habit_id = Column(Integer, ForeignKey('habits.id', ondelete='CASCADE'), nullable=False)
+    log_date = Column(Date, primary_key=True)
     completed = Column(Boolean, default=False, nullable=False)
     notes = Column(String, nullable=True)  # Optional notes for the log entry
     completed_at = Column(DateTime, nullable=True)  # Timestamp when marked as completed
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # Set from row_version_seq on every write (migration 0003); NULL on rows untouched since it ran
+    row_version = Column(BigInteger, server_default=FetchedValue(), server_onupdate=FetchedValue())
 
     habit = relationship("Habit", back_populates="habit_logs")
 
+    __table_args__ = (
+        # One log per habit and day; its index serves (habit, day) lookups and per-habit range scans
+        UniqueConstraint('habit_id', 'log_date', name='uq_habit_logs_habit_id_log_date'),
+        {'postgresql_partition_by': 'RANGE (log_date)'},
+    )
+
     def __repr__(self):
         return f"<HabitLog(habit_id={self.habit_id}, date={self.log_date}, completed={self.completed})>"
 
 
+class HabitStreakState(Base):
+    __tablename__ = 'habit_streak_states'
+
+    habit_id = Column(Integer, ForeignKey('habits.id', ondelete='CASCADE'), primary_key=True)
+    current_run = Column(Integer, default=0, nullable=False)  # Length in periods of the most recent run
+    current_run_start = Column(Date, nullable=True)  # First day of the run's first period
+    current_run_end = Column(Date, nullable=True)  # Last day of the run's last period
+    last_completed_period = Column(Date, nullable=True)  # First day of the latest period that met its target
+    longest_run = Column(Integer, default=0, nullable=False)
+    longest_run_start = Column(Date, nullable=True)
+    longest_run_end = Column(Date, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<HabitStreakState(habit_id={self.habit_id}, current_run={self.current_run}, longest_run={self.longest_run})>"
+
+
+class HabitCompletionRollup(Base):
+    __tablename__ = 'habit_completion_rollups'
+
+    # Maintained by triggers on habit_logs (migration 0005, see rollups.py)
+    habit_id = Column(Integer, ForeignKey('habits.id', ondelete='CASCADE'), primary_key=True)
+    periodicity = Column(Enum(PeriodicityEnum), primary_key=True)  # weekly or monthly
+    period = Column(Integer, primary_key=True)  # Numbered as in streaks.py
+    completed = Column(Integer, nullable=False)  # Completed days in the period
+
+    def __repr__(self):
+        return f"<HabitCompletionRollup(habit_id={self.habit_id}, periodicity={self.periodicity}, period={self.period}, completed={self.completed})>"
+
+
 class Tag(Base):
     __tablename__ = 'tags'
 
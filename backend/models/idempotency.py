@@ -0,0 +1,16 @@
+from sqlalchemy import Column, String, DateTime, JSON
+from datetime import datetime
+
+from database import Base
+
+
+class IdempotencyKey(Base):
+    __tablename__ = 'idempotency_keys'
+
+    key = Column(String(255), primary_key=True)  # Client-supplied Idempotency-Key header
+    request_fingerprint = Column(String, nullable=False)  # What the key was first used for
+    response = Column(JSON, nullable=False)  # Response body replayed on retries
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<IdempotencyKey(key={self.key}, created_at={self.created_at})>"
@@ -0,0 +1,78 @@
+"""Keyset (cursor) pagination.
+
+A page is fetched with ``WHERE (sort columns) > (last row's values)`` on an
+index that matches the sort, so page 1000 costs the same as page 1 and rows
+inserted meanwhile do not shift later pages. Cursors are opaque to clients:
+URL-safe base64 of the sort name and the last row's sort values.
+"""
+import base64
+import json
+from datetime import date
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Column, Date, tuple_
+from sqlalchemy.sql import Select
+
+import models
+
+# Header carrying the cursor of the next page; absent on the last page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+# Sort name -> columns, matching an index; the last column makes the order total
+HABIT_SORT_KEYS = {
+    "id": (models.Habit.id,),
+    "start_date": (models.Habit.start_date, models.Habit.id),
+    "title": (models.Habit.title, models.Habit.id),
+}
+TAG_SORT_KEYS = {
+    "id": (models.Tag.id,),
+    "name": (models.Tag.name,),
+}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(sort: str, values: Sequence[Any]) -> str:
+    payload = [sort] + [value.isoformat() if isinstance(value, date) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, columns: Sequence[Column]) -> Tuple[Any, ...]:
+    """The sort values stored in ``cursor``; it must have been issued for ``sort``."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        name, values = payload[0], payload[1:]
+        if name != sort or len(values) != len(columns):
+            raise InvalidCursor(cursor)
+        return tuple(
+            date.fromisoformat(value) if isinstance(column.type, Date) else value
+            for column, value in zip(columns, values)
+        )
+    except (ValueError, TypeError, IndexError):
+        raise InvalidCursor(cursor)
+
+
+def keyset_page(stmt: Select, sort: str, sort_keys: Dict[str, Sequence[Column]],
+                cursor: Optional[str], limit: Optional[int]) -> Tuple[Select, Sequence[Column]]:
+    """``stmt`` ordered by ``sort_keys[sort]``, starting after ``cursor``, with one look-ahead row.
+
+    With ``limit`` None everything after the cursor is selected.
+    """
+    columns = sort_keys[sort]
+    if cursor:
+        stmt = stmt.where(tuple_(*columns) > tuple_(*decode_cursor(cursor, sort, columns)))
+    stmt = stmt.order_by(*columns)
+    if limit is not None:
+        stmt = stmt.limit(limit + 1)
+    return stmt, columns
+
+
+def split_page(rows: List[Any], sort: str, columns: Sequence[Column], limit: int) -> Tuple[List[Any], Optional[str]]:
+    """Drop the look-ahead row and build the next cursor from the last row kept."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(sort, [getattr(rows[-1], column.key) for column in columns])
@@ -0,0 +1,206 @@
+"""Monthly partitions of ``habit_logs`` and archival of cold months.
+
+``habit_logs`` is range-partitioned on ``log_date`` (migration 0004), with
+one partition per calendar month (``habit_logs_2025_10``) and
+``habit_logs_default`` for dates that have none, so reads bounded by date
+only touch the months they cover and recent-window queries keep their cost
+as history grows.
+
+``maintain`` creates the partitions of the current and the next
+``LOG_PARTITION_MONTHS_AHEAD`` months, gives rows that landed in the default
+partition a month of their own, and compacts months older than
+``LOG_ARCHIVE_AFTER_MONTHS`` into ``habit_log_archive``: one row per habit
+and month with bitmaps of logged and completed days and the notes (ids and
+timestamps are dropped). The emptied partitions are then detached and
+dropped.
+
+Readers that may cross the archive boundary (streaks, heatmaps, the agenda,
+the completion index) go through the ``habit_log_history(first, last)`` SQL
+function, which returns live and archived days alike. Writing a day of an
+archived month turns that habit's month back into live rows first (trigger
+``habit_logs_restore_archived``), so a day is never both; the next run
+archives it again.
+
+Run ``python partitions.py maintain`` daily, e.g. from cron (it also deletes
+expired idempotency keys, see idempotency.py), and
+``python partitions.py status`` to list partitions. Workers started with
+``DB_STARTUP_MODE=migrate`` also create the coming months' partitions.
+"""
+import argparse
+import logging
+import re
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary application-wide key for pg_advisory_xact_lock; one maintenance run at a time
+MAINTENANCE_LOCK_ID = 7_245_061_905
+# Partition DDL that waits for a lock holds up the queries queued behind it: give up and
+# leave the month to the next run instead
+LOCK_TIMEOUT = "5s"
+
+_PARTITION_NAME = re.compile(r"^habit_logs_(\d{4})_(\d{2})$")
+
+PARTITIONS_SQL = text("""
+    SELECT c.relname, c.reltuples::bigint AS estimated_rows, pg_total_relation_size(c.oid) AS bytes
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'habit_logs'::regclass
+    ORDER BY c.relname
+""")
+
+DEFAULT_MONTHS_SQL = text("SELECT DISTINCT date_trunc('month', log_date)::date FROM habit_logs_default ORDER BY 1")
+
+ARCHIVE_SUMMARY_SQL = text("""
+    SELECT COUNT(*) AS habit_months, MIN(month) AS first_month, MAX(month) AS last_month,
+           pg_total_relation_size('habit_log_archive') AS bytes
+    FROM habit_log_archive
+""")
+
+
+class Partition(NamedTuple):
+    name: str
+    month: Optional[date]  # None for the default partition
+    estimated_rows: int
+    bytes: int
+
+
+class MaintenanceResult(NamedTuple):
+    created: List[date]
+    archived: Dict[date, int]  # month -> habit-months archived
+    dropped: List[date]
+    purged_keys: int = 0  # Expired idempotency keys deleted
+
+
+def add_months(month: date, months: int) -> date:
+    """First day of the month ``months`` after the one containing ``month``."""
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def archive_boundary(today: Optional[date] = None) -> Optional[date]:
+    """First day that stays live; months before it get archived. None when archiving is off."""
+    if settings.log_archive_after_months <= 0:
+        return None
+    return add_months(today or date.today(), -settings.log_archive_after_months)
+
+
+def list_partitions(conn: Connection) -> List[Partition]:
+    partitions = []
+    for row in conn.execute(PARTITIONS_SQL):
+        match = _PARTITION_NAME.match(row.relname)
+        month = date(int(match.group(1)), int(match.group(2)), 1) if match else None
+        partitions.append(Partition(row.relname, month, max(row.estimated_rows, 0), row.bytes))
+    return partitions
+
+
+def _begin(conn: Connection) -> None:
+    conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MAINTENANCE_LOCK_ID})
+    # Archiving a large month can outlast the request timeout
+    conn.execute(text("SET LOCAL statement_timeout = 0"))
+    conn.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+
+
+def ensure_partitions(engine: Engine, today: Optional[date] = None) -> List[date]:
+    """Create the partitions of the coming months and of live months found in the default partition.
+
+    Each partition is created in its own short transaction; returns the months created.
+    """
+    this_month = add_months(today or date.today(), 0)
+    boundary = archive_boundary(today)
+    with engine.connect() as conn:
+        months = {add_months(this_month, ahead) for ahead in range(settings.log_partition_months_ahead + 1)}
+        months.update(conn.execute(DEFAULT_MONTHS_SQL).scalars())
+    created = []
+    for month in sorted(months):
+        if boundary is not None and month < boundary:
+            continue  # archived by archive_cold_months instead
+        try:
+            with engine.begin() as conn:
+                _begin(conn)
+                if conn.execute(text("SELECT create_habit_log_partition(:month)"), {"month": month}).scalar():
+                    created.append(month)
+                    logger.info(f"Created partition habit_logs_{month:%Y_%m}")
+        except OperationalError as e:
+            logger.warning(f"Could not create partition habit_logs_{month:%Y_%m}: {e.orig}")
+    return created
+
+
+def archive_cold_months(engine: Engine, today: Optional[date] = None) -> MaintenanceResult:
+    """Compact every month before the archive boundary into ``habit_log_archive`` and drop its partition."""
+    boundary = archive_boundary(today)
+    if boundary is None:
+        return MaintenanceResult([], {}, [])
+    with engine.connect() as conn:
+        partitions = {p.month: p.name for p in list_partitions(conn) if p.month is not None and p.month < boundary}
+        months = sorted(set(partitions) | {m for m in conn.execute(DEFAULT_MONTHS_SQL).scalars() if m < boundary})
+    if not months:
+        return MaintenanceResult([], {}, [])
+
+    # The restore trigger has to cover a month before its rows leave; changing it
+    # takes a lock on habit_logs that must not wait behind the month's writers
+    with engine.begin() as conn:
+        _begin(conn)
+        conn.execute(text("SELECT cover_archived_habit_logs(:boundary)"), {"boundary": boundary})
+
+    archived, dropped = {}, []
+    for month in months:
+        try:
+            with engine.begin() as conn:
+                _begin(conn)
+                archived[month] = conn.execute(text("SELECT archive_habit_log_month(:month)"),
+                                               {"month": month}).scalar()
+            logger.info(f"Archived {archived[month]} habit-months of {month:%Y-%m}")
+            if month in partitions:
+                # Empty by now; if this fails it stays attached until the next run
+                with engine.begin() as conn:
+                    _begin(conn)
+                    conn.execute(text(f'ALTER TABLE habit_logs DETACH PARTITION "{partitions[month]}"'))
+                    conn.execute(text(f'DROP TABLE "{partitions[month]}"'))
+                dropped.append(month)
+        except OperationalError as e:
+            logger.warning(f"Could not archive {month:%Y-%m}: {e.orig}")
+    return MaintenanceResult([], archived, dropped)
+
+
+def maintain(engine: Engine, today: Optional[date] = None) -> MaintenanceResult:
+    """Create upcoming partitions, archive cold months, then delete expired idempotency keys."""
+    # Imported here: idempotency imports the models, which import database, which imports this module
+    import idempotency
+
+    created = ensure_partitions(engine, today)
+    result = archive_cold_months(engine, today)
+    return result._replace(created=created, purged_keys=idempotency.purge_expired(engine))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the monthly partitions of habit_logs.")
+    parser.add_argument("command", choices=["maintain", "status"])
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    engine = create_engine(settings.database_url)
+    try:
+        if args.command == "maintain":
+            result = maintain(engine)
+            print(f"Created {len(result.created)} partition(s), archived {len(result.archived)} month(s) "
+                  f"({sum(result.archived.values())} habit-months), dropped {len(result.dropped)} partition(s), "
+                  f"purged {result.purged_keys} expired idempotency key(s).")
+        else:
+            with engine.connect() as conn:
+                for partition in list_partitions(conn):
+                    print(f"{partition.name:<24} ~{partition.estimated_rows:>12} rows {partition.bytes // 1024:>10} KiB")
+                summary = conn.execute(ARCHIVE_SUMMARY_SQL).one()
+            print(f"habit_log_archive: {summary.habit_months} habit-months "
+                  f"({summary.first_month} to {summary.last_month}), {summary.bytes // 1024} KiB")
+            boundary = archive_boundary()
+            print(f"Months before {boundary} are archived." if boundary else "Archiving is off.")
+    finally:
+        engine.dispose()
@@ -0,0 +1,76 @@
+"""One Postgres LISTEN connection per worker, shared by in-process caches.
+
+Modules ``subscribe`` a handler per channel at startup; ``start`` then runs
+a daemon thread that listens on every subscribed channel and calls the
+handler with each notification's payload. After a connection failure notifications may have
+been missed, so every subscriber's ``on_reset`` runs once listening
+(re)starts.
+"""
+import logging
+import os
+import select
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Lets subscribers tell this process's notifications from other workers'
+WORKER_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+_subscriptions: Dict[str, Tuple[Callable[[str], None], Optional[Callable[[], None]]]] = {}
+_thread: Optional[threading.Thread] = None
+_lock = threading.Lock()
+
+
+def subscribe(channel: str, handler: Callable[[str], None], on_reset: Optional[Callable[[], None]] = None) -> None:
+    """Call ``handler(payload)`` for notifications on ``channel``; subscribe before ``start``."""
+    _subscriptions[channel] = (handler, on_reset)
+
+
+def _reset_all() -> None:
+    for _, on_reset in _subscriptions.values():
+        if on_reset is not None:
+            on_reset()
+
+
+def _listen(engine) -> None:
+    while True:
+        conn = None
+        try:
+            pooled = engine.raw_connection()
+            pooled.detach()
+            conn = pooled.dbapi_connection
+            conn.autocommit = True
+            cursor = conn.cursor()
+            for channel in _subscriptions:
+                cursor.execute(f"LISTEN {channel}")
+            # Writes made while nobody was listening are unknown; start clean
+            _reset_all()
+            logger.info(f"Listening for notifications on {', '.join(_subscriptions)}")
+
+            while True:
+                if select.select([conn], [], [], 30) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    handler, _ = _subscriptions[notify.channel]
+                    handler(notify.payload)
+        except Exception as e:
+            logger.warning(f"Notification listener failed, retrying: {e}")
+            _reset_all()
+            if conn is not None:
+                conn.close()
+            time.sleep(5)
+
+
+def start(engine) -> Optional[threading.Thread]:
+    """Start the listener thread once per process, if anything subscribed."""
+    global _thread
+    with _lock:
+        if _thread is None and _subscriptions:
+            _thread = threading.Thread(target=_listen, args=(engine,), name="pg-listener", daemon=True)
+            _thread.start()
+    return _thread
@@ -0,0 +1,75 @@
+"""Per-request SQL statement counting.
+
+Every statement sent by any engine (sync, async, replicas) is counted
+against the counter active in the current context. ``count_queries`` opens
+one; ``QueryCountMiddleware`` opens one per request. That middleware logs
+requests above ``QUERY_COUNT_WARN`` statements and, with
+``QUERY_COUNT_HEADER=true``, reports the count in ``X-Query-Count``. Tests
+can read that header to check that an endpoint's query count stays flat as
+the result grows.
+"""
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+QUERY_COUNT_HEADER = "X-Query-Count"
+
+
+class QueryCounter:
+    def __init__(self, keep_statements: bool = False):
+        self.count = 0
+        self.statements: Optional[List[str]] = [] if keep_statements else None
+
+
+_current: ContextVar[Optional[QueryCounter]] = ContextVar("query_counter", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count(conn, cursor, statement, parameters, context, executemany):
+    counter = _current.get()
+    if counter is not None:
+        counter.count += 1
+        if counter.statements is not None:
+            counter.statements.append(statement)
+
+
+@contextmanager
+def count_queries(keep_statements: bool = False) -> Iterator[QueryCounter]:
+    """Count the statements executed in this context (and in tasks and threads it starts)."""
+    counter = QueryCounter(keep_statements)
+    token = _current.set(counter)
+    try:
+        yield counter
+    finally:
+        _current.reset(token)
+
+
+class QueryCountMiddleware:
+    """Plain ASGI middleware, so long-lived streams (``/events``) pass through without extra tasks."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with count_queries() as counter:
+            async def send_with_count(message):
+                if message["type"] == "http.response.start" and settings.query_count_header:
+                    MutableHeaders(scope=message).append(QUERY_COUNT_HEADER, str(counter.count))
+                await send(message)
+
+            await self.app(scope, receive, send_with_count)
+        if counter.count > settings.query_count_warn:
+            logger.warning(f"{scope['method']} {scope['path']} ran {counter.count} queries")
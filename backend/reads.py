@@ -0,0 +1,201 @@
+"""Habit read responses, shared by the sync routes (main.py) and the async ones (async_routes.py).
+
+Each ``*_response`` function takes a sync ``Session`` first: main.py calls it
+with the route's session, async_routes.py through ``AsyncSession.run_sync``,
+so both serve the same ETags, cache entries and JSON from the same queries.
+"""
+from datetime import date, timedelta
+from typing import Callable, List, Optional
+
+from fastapi import HTTPException, Request, Response
+from sqlalchemy import select
+from sqlalchemy.orm import Session, selectinload
+
+import agenda
+import cache
+import etags
+import models
+import schemas
+from database import db_manager
+from fastjson import STREAM_BATCH_ROWS, json_list_response, json_object_response, row_dicts, stream_ndjson, wants_ndjson
+from pagination import HABIT_SORT_KEYS, NEXT_CURSOR_HEADER, InvalidCursor, keyset_page, split_page
+from streaks import compute_habit_stats
+
+MAX_RECENT_DAYS = 31
+
+
+def cached_response(etag: str, render: Callable[[], Response]) -> Response:
+    """``render()``'s response, served from the response cache while ``etag`` is current."""
+    if not cache.response_cache.enabled:
+        return render()
+    cached = cache.response_cache.lookup(etag)
+    if cached is not None:
+        return Response(cached.body, media_type="application/json", headers={**cached.headers, cache.CACHE_HEADER: "hit"})
+    response = render()
+    if response.status_code == 200:
+        headers = {name: value for name, value in response.headers.items() if name.lower().startswith("x-")}
+        cache.response_cache.store(etag, response.body, headers)
+    response.headers[cache.CACHE_HEADER] = "miss"
+    return response
+
+
+def conditional_response(request: Request, db: Session, collections: List[str], render: Callable[[], Response],
+                         *versions, cached: bool = False) -> Response:
+    """``render()``'s response with an ETag from the collections' versions, or a 304 when the client has it.
+
+    Versions are read before ``render`` queries anything: a write committing in between
+    costs the client one needless refetch, never a stale 304. With ``cached`` the response
+    cache is keyed on the same ETag, so a cached body always matches the ETag it goes out with.
+    """
+    etag = etags.make_etag(request, etags.collection_versions(db, collections), *versions)
+    if etags.matches(request.headers.get("if-none-match"), etag):
+        return etags.not_modified(etag)
+    response = cached_response(etag, render) if cached else render()
+    response.headers.update(etags.headers(etag))
+    return response
+
+
+def keyset_stmt(stmt, sort: str, sort_keys, cursor: Optional[str], skip: int, limit: Optional[int]):
+    try:
+        stmt, columns = keyset_page(stmt, sort, sort_keys, cursor, limit)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if skip:
+        # Offset paging is kept for existing clients; cursors do not slow down on deep pages
+        stmt = stmt.offset(skip)
+    return stmt, columns
+
+
+def next_cursor_headers(next_cursor: Optional[str]) -> dict:
+    return {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+
+
+def tag_names(tags: Optional[str]) -> List[str]:
+    return [name.strip() for name in (tags or "").split(",") if name.strip()]
+
+
+def habit_dicts(db: Session, rows, recent_days: int) -> List[dict]:
+    """Habit rows as response dicts; tags in one query, recent logs in another when asked for."""
+    habits = row_dicts(rows)
+    by_id = {}
+    for habit in habits:
+        habit["tags"] = []
+        if recent_days:
+            habit["recent_logs"] = []
+        by_id[habit["id"]] = habit
+    if not by_id:
+        return habits
+
+    habit_tags = models.Habit.tags.property.secondary
+    tag_rows = db.execute(
+        select(habit_tags.c.habit_id, models.Tag.id, models.Tag.name)
+        .join(models.Tag, models.Tag.id == habit_tags.c.tag_id)
+        .where(habit_tags.c.habit_id.in_(by_id))
+        .order_by(models.Tag.id)
+    )
+    for habit_id, tag_id, name in tag_rows:
+        by_id[habit_id]["tags"].append({"id": tag_id, "name": name})
+
+    if recent_days:
+        since = date.today() - timedelta(days=recent_days - 1)
+        log_rows = db.execute(
+            select(*models.HabitLog.__table__.c)
+            .where(models.HabitLog.habit_id.in_(by_id), models.HabitLog.log_date >= since)
+            .order_by(models.HabitLog.habit_id, models.HabitLog.log_date)
+        ).all()
+        for log in row_dicts(log_rows):
+            by_id[log["habit_id"]]["recent_logs"].append(log)
+    return habits
+
+
+def habits_response(db: Session, request: Request, cursor: Optional[str], sort: schemas.HabitSort, skip: int,
+                    limit: int, recent_days: int, tags: Optional[str], match: schemas.TagMatch) -> Response:
+    """A page of habits, or with Accept: application/x-ndjson every habit after ``cursor``, streamed.
+
+    ``tags`` keeps habits with any (``match=any``) or all (``match=all``) of the named tags.
+    """
+    stmt = select(*models.Habit.__table__.c)
+    names = tag_names(tags)
+    if names:
+        stmt = stmt.where(models.Habit.tag_filter(names, match_all=match == schemas.TagMatch.all))
+    if wants_ndjson(request.headers.get("accept")):
+        stmt, _ = keyset_stmt(stmt, sort.value, HABIT_SORT_KEYS, cursor, skip, None)
+
+        def batches():
+            # The route's session is closed once the handler returns; the stream needs its own
+            stream_db = db_manager.read_session(request)
+            try:
+                result = stream_db.execute(stmt.execution_options(yield_per=STREAM_BATCH_ROWS))
+                for rows in result.partitions():
+                    yield habit_dicts(stream_db, rows, recent_days)
+            finally:
+                stream_db.close()
+
+        return stream_ndjson(schemas.HabitDetail, batches)
+
+    def render():
+        page_stmt, columns = keyset_stmt(stmt, sort.value, HABIT_SORT_KEYS, cursor, skip, limit)
+        rows, next_cursor = split_page(db.execute(page_stmt).all(), sort.value, columns, limit)
+        habits = habit_dicts(db, rows, recent_days)
+        return json_list_response(schemas.HabitDetail, habits, next_cursor_headers(next_cursor))
+
+    collections = ["habits", "tags"] if names else ["habits"]
+    if recent_days:
+        collections.append("habit_logs")
+    # Recent logs are counted back from today, so the date is part of what the response depends on
+    return conditional_response(request, db, collections, render, date.today() if recent_days else None, cached=True)
+
+
+def habits_with_stats_response(db: Session, request: Request, skip: int, limit: int) -> Response:
+    def render():
+        # Three queries regardless of page size: habits, their tags, and one set-based stats query
+        habits = (
+            db.query(models.Habit)
+            .options(selectinload(models.Habit.tags))
+            .order_by(models.Habit.id)
+            .offset(skip)
+            .limit(limit)
+            .all()
+        )
+        stats = compute_habit_stats(db, [habit.id for habit in habits])
+        for habit in habits:
+            # Plain attributes on the instance; the response model reads them like columns
+            for field, value in stats[habit.id]._asdict().items():
+                setattr(habit, field, value)
+        return json_list_response(schemas.HabitWithStats, habits)
+
+    # Streaks and "completed today" move with the date as well as with the logs
+    return conditional_response(request, db, ["habits", "habit_logs"], render, date.today())
+
+
+def habit_logs_response(db: Session, request: Request, day: Optional[date], start: Optional[date],
+                        end: Optional[date]) -> Response:
+    """Every habit's log state for ``day``, or for each day from ``start`` to ``end``."""
+    try:
+        start, end = agenda.window(day, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def render():
+        return json_list_response(schemas.HabitLogState, row_dicts(agenda.load_agenda(db, start, end)))
+
+    return conditional_response(request, db, ["habits", "habit_logs"], render)
+
+
+def habit_response(db: Session, request: Request, habit_id: int, recent_days: int) -> Response:
+    row_version = db.execute(select(models.Habit.row_version).where(models.Habit.id == habit_id)).first()
+    if row_version is None:
+        raise HTTPException(status_code=404, detail="Habit not found")
+
+    def render():
+        habit = db.get(models.Habit, habit_id, options=[selectinload(models.Habit.tags)])
+        if habit is None:
+            raise HTTPException(status_code=404, detail="Habit not found")
+        if recent_days:
+            models.Habit.load_recent_logs(db, [habit], recent_days)
+        return json_object_response(schemas.HabitDetail, habit)
+
+    # The habit's own version covers its tag links; logs are only versioned as a collection
+    collections = ["tags", "habit_logs"] if recent_days else ["tags"]
+    return conditional_response(request, db, collections, render, row_version[0],
+                                date.today() if recent_days else None, cached=True)
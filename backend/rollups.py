@@ -0,0 +1,105 @@
+"""Weekly and monthly completion rollups.
+
+``habit_completion_rollups`` holds the number of completed days of every
+habit per ISO week and per calendar month (migration 0005), numbered like
+the periods in streaks.py. Completion rates, week/month heatmaps and the
+streak state's check of whether a written week or month met its target
+(see streak_state.py) read it instead of counting ``habit_logs``: five years
+of a weekly habit are some 260 rows.
+
+Statement triggers on ``habit_logs`` keep it current for every write path,
+``Habit.mark_completed``/``mark_incomplete`` and bulk imports alike, with
+one set-based update per statement. Writes that bypass them (statements on
+a single partition, ``session_replication_role = replica``) leave it stale.
+
+Run ``python rollups.py check`` to compare it with the logs (archived days
+included) and ``python rollups.py rebuild`` to regenerate it.
+"""
+import argparse
+import sys
+from typing import List, NamedTuple
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+
+from database import db_manager
+from streak_state import habit_id_batches
+
+_EXPECTED_SQL = """
+    SELECT l.habit_id, p.periodicity, p.period, COUNT(*) AS completed
+    FROM habit_log_history() l
+    CROSS JOIN LATERAL habit_log_rollup_periods(l.log_date) p
+    WHERE l.completed AND l.habit_id IN :habit_ids
+    GROUP BY 1, 2, 3
+"""
+
+# Missing rows and rows at zero are the same thing
+CHECK_SQL = text(f"""
+    WITH expected AS ({_EXPECTED_SQL})
+    SELECT COALESCE(e.habit_id, r.habit_id) AS habit_id,
+           COALESCE(e.periodicity, r.periodicity)::text AS periodicity,
+           COALESCE(e.period, r.period) AS period,
+           COALESCE(e.completed, 0) AS expected,
+           COALESCE(r.completed, 0) AS stored
+    FROM expected e
+    FULL JOIN (SELECT * FROM habit_completion_rollups WHERE habit_id IN :habit_ids) r
+           ON r.habit_id = e.habit_id AND r.periodicity = e.periodicity AND r.period = e.period
+    WHERE COALESCE(e.completed, 0) <> COALESCE(r.completed, 0)
+    ORDER BY 1, 2, 3
+""").bindparams(bindparam("habit_ids", expanding=True))
+
+DELETE_SQL = text("DELETE FROM habit_completion_rollups WHERE habit_id IN :habit_ids").bindparams(
+    bindparam("habit_ids", expanding=True))
+
+REBUILD_SQL = text(f"""
+    INSERT INTO habit_completion_rollups (habit_id, periodicity, period, completed)
+    {_EXPECTED_SQL}
+""").bindparams(bindparam("habit_ids", expanding=True))
+
+
+class RollupMismatch(NamedTuple):
+    habit_id: int
+    periodicity: str
+    period: int
+    expected: int
+    stored: int
+
+
+def rebuild_rollups(db: Session) -> int:
+    """Regenerate every rollup row from the logs; returns the number of rows written."""
+    written = 0
+    for batch in habit_id_batches(db):
+        # Log writes wait for the batch, so none lands between the delete and the count
+        db.execute(text("LOCK TABLE habit_logs IN SHARE MODE"))
+        db.execute(DELETE_SQL, {"habit_ids": batch})
+        written += db.execute(REBUILD_SQL, {"habit_ids": batch}).rowcount
+        db.commit()
+    return written
+
+
+def check_rollups(db: Session) -> List[RollupMismatch]:
+    """Compare stored rollups with the logs; returns the periods that differ."""
+    mismatches = []
+    for batch in habit_id_batches(db):
+        mismatches.extend(RollupMismatch(*row) for row in db.execute(CHECK_SQL, {"habit_ids": batch}))
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check or rebuild habit_completion_rollups from habit_logs.")
+    parser.add_argument("command", choices=["check", "rebuild"])
+    args = parser.parse_args()
+
+    db_manager.initialize_database()
+    db = db_manager.SessionLocal()
+    try:
+        if args.command == "rebuild":
+            print(f"Rebuilt {rebuild_rollups(db)} rollup rows.")
+        mismatches = check_rollups(db)
+        for mismatch in mismatches:
+            print(f"Habit {mismatch.habit_id} {mismatch.periodicity} period {mismatch.period}: "
+                  f"{mismatch.stored} completed days stored, {mismatch.expected} logged")
+        print(f"{len(mismatches)} rollup rows out of date.")
+        sys.exit(1 if mismatches else 0)
+    finally:
+        db.close()
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from typing import List, Optional
-from datetime import date
+from datetime import date, datetime
 from enum import Enum
 
 class PeriodicityEnum(str, Enum):
@@ -8,6 +8,19 @@ class PeriodicityEnum(str, Enum):
     weekly = "weekly"
     monthly = "monthly"
 
+class TagSort(str, Enum):
+    id = "id"
+    name = "name"
+
+class HabitSort(str, Enum):
+    id = "id"
+    start_date = "start_date"
+    title = "title"
+
+class TagMatch(str, Enum):
+    any = "any"
+    all = "all"
+
 class TagBase(BaseModel):
     name: str
 
@@ -20,6 +33,9 @@ class Tag(TagBase):
     class Config:
         orm_mode = True
 
+class TagWithCount(Tag):
+    habit_count: int
+
 class HabitBase(BaseModel):
     title: str
     description: Optional[str] = None
@@ -40,4 +56,95 @@ class Habit(HabitBase):
     tags: List[Tag]
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+class HabitWithStats(Habit):
+    current_streak: int
+    longest_streak: int
+    completed_today: bool
+    completion_rate: float
+
+
+class HeatmapBucket(str, Enum):
+    day = "day"
+    week = "week"
+    month = "month"
+
+class HeatmapSeries(BaseModel):
+    habit_id: int
+    target: int
+    completed: int
+    data: str  # base64: day bitmap, or one count byte per week/month bucket
+
+class Heatmap(BaseModel):
+    start: date
+    end: date
+    bucket: HeatmapBucket
+    bucket_start: date  # First day of the first bucket
+    buckets: int
+    series: List[HeatmapSeries]
+
+class CompletionGroupBy(str, Enum):
+    habit = "habit"
+    tag = "tag"
+    periodicity = "periodicity"
+    week = "week"
+
+class CompletionRate(BaseModel):
+    expected: int
+    completed: int
+    rate: float  # completed / expected, 0 when nothing was expected
+
+class CompletionGroup(CompletionRate):
+    group_by: CompletionGroupBy
+    habit_id: Optional[int] = None
+    tag: Optional[str] = None  # None in a tag group: untagged habits
+    periodicity: Optional[PeriodicityEnum] = None
+    week: Optional[date] = None  # Monday of the ISO week
+
+class CompletionAnalytics(BaseModel):
+    start: date
+    end: date
+    total: CompletionRate
+    groups: List[CompletionGroup]
+
+class BulkLogReject(BaseModel):
+    row: int  # Zero-based position in the array or NDJSON stream
+    reason: str
+
+class BulkLogResult(BaseModel):
+    received: int
+    inserted: int
+    updated: int
+    rejected: int
+    rejects: List[BulkLogReject]
+
+class HabitCompletion(BaseModel):
+    log_date: Optional[date] = None  # Defaults to today
+    notes: Optional[str] = None
+
+class HabitLog(BaseModel):
+    id: int
+    habit_id: int
+    log_date: date
+    completed: bool
+    notes: Optional[str] = None
+    completed_at: Optional[datetime] = None
+    created_at: datetime
+
+    class Config:
+        orm_mode = True
+
+class HabitLogState(BaseModel):
+    habit_id: int
+    log_date: date
+    log_id: Optional[int] = None  # None when nothing was logged for the day
+    completed: bool
+    notes: Optional[str] = None
+    completed_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
+
+class HabitDetail(Habit):
+    recent_logs: Optional[List[HabitLog]] = None  # Only filled in when recent_days is requested
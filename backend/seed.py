@@ -4,6 +4,124 @@ from sqlalchemy.exc import IntegrityError
 from datetime import datetime, date, timedelta
 import random
 
+import numpy as np
+
+TAG_NAMES = ["Health", "Productivity", "Wellness", "Fitness", "Mindfulness", "Learning", "Social", "Finance"]
+
+# Sample habits without their start date; benchmarks.generate_data draws its habits from these too
+SAMPLE_HABITS = [
+    {
+        "title": "Drink 8 glasses of water",
+        "description": "Stay hydrated by drinking at least 8 glasses of water daily",
+        "periodicity": models.PeriodicityEnum.daily,
+        "frequency": 1,
+        "reminder": True,
+        "icon": "💧",
+        "tag_names": ["Health"]
+    },
+    {
+        "title": "Morning meditation",
+        "description": "Practice mindfulness meditation for 10 minutes each morning",
+        "periodicity": models.PeriodicityEnum.daily,
+        "frequency": 1,
+        "reminder": True,
+        "icon": "🧘",
+        "tag_names": ["Mindfulness", "Wellness"]
+    },
+    {
+        "title": "Exercise workout",
+        "description": "Complete a 30-minute workout session",
+        "periodicity": models.PeriodicityEnum.daily,
+        "frequency": 1,
+        "reminder": True,
+        "icon": "💪",
+        "tag_names": ["Fitness", "Health"]
+    },
+    {
+        "title": "Read for 30 minutes",
+        "description": "Read books or educational material for personal growth",
+        "periodicity": models.PeriodicityEnum.daily,
+        "frequency": 1,
+        "reminder": False,
+        "icon": "📚",
+        "tag_names": ["Learning", "Productivity"]
+    },
+    {
+        "title": "Weekly meal prep",
+        "description": "Prepare healthy meals for the upcoming week",
+        "periodicity": models.PeriodicityEnum.weekly,
+        "frequency": 1,
+        "select_days": "Sun",
+        "reminder": True,
+        "icon": "🍽️",
+        "tag_names": ["Health", "Productivity"]
+    },
+    {
+        "title": "Call family/friends",
+        "description": "Stay connected with loved ones through regular calls",
+        "periodicity": models.PeriodicityEnum.weekly,
+        "frequency": 2,
+        "select_days": "Wed,Sun",
+        "reminder": True,
+        "icon": "📞",
+        "tag_names": ["Social"]
+    },
+    {
+        "title": "Review monthly budget",
+        "description": "Review and analyze monthly expenses and savings",
+        "periodicity": models.PeriodicityEnum.monthly,
+        "frequency": 1,
+        "reminder": True,
+        "icon": "💰",
+        "tag_names": ["Finance"]
+    },
+    {
+        "title": "Learn something new",
+        "description": "Spend time learning a new skill or taking an online course",
+        "periodicity": models.PeriodicityEnum.weekly,
+        "frequency": 3,
+        "select_days": "Mon,Wed,Fri",
+        "reminder": False,
+        "icon": "🎓",
+        "tag_names": ["Learning", "Productivity"]
+    }
+]
+
+DAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+# Share of the days completion_days allows that get completed
+COMPLETION_RATES = {
+    models.PeriodicityEnum.daily: 0.7,
+    models.PeriodicityEnum.weekly: 0.8,
+    models.PeriodicityEnum.monthly: 0.9,
+}
+
+
+def completion_rate(title, periodicity, select_days=None):
+    """The sample completion rate of a habit"""
+    if periodicity == models.PeriodicityEnum.daily and title in ["Drink 8 glasses of water", "Morning meditation"]:
+        return 0.8
+    if periodicity == models.PeriodicityEnum.weekly and not select_days:
+        return 0.75
+    return COMPLETION_RATES[periodicity]
+
+
+def completion_days(periodicity, select_days, days):
+    """Mask of the days (a datetime64[D] array) a habit may be completed on.
+
+    Daily habits any day, weekly habits on their select days (Sundays when
+    they have none), monthly habits in the last week of the month.
+    """
+    if periodicity == models.PeriodicityEnum.daily:
+        return np.ones(len(days), dtype=bool)
+    if periodicity == models.PeriodicityEnum.weekly:
+        # 1970-01-01 was a Thursday
+        weekdays = (days.astype(np.int64) + 3) % 7
+        if not select_days:
+            return weekdays == 6
+        return np.isin(weekdays, [i for i, name in enumerate(DAY_NAMES) if name in select_days])
+    return (days - days.astype("datetime64[M]")).astype(np.int64) + 1 >= 25
+
 
 def run():
     """Seed the database with initial data."""
@@ -18,10 +136,9 @@ def run():
         print(f"Found {existing_tags} tags, {existing_habits} habits, and {existing_logs} logs in database.")
 
         # Get or create tags
-        tag_names = ["Health", "Productivity", "Wellness", "Fitness", "Mindfulness", "Learning", "Social", "Finance"]
         tags = []
 
-        for tag_name in tag_names:
+        for tag_name in TAG_NAMES:
             existing_tag = db.query(models.Tag).filter(models.Tag.name == tag_name).first()
             if existing_tag:
                 tags.append(existing_tag)
@@ -42,91 +159,7 @@ def run():
         today = date.today()
         start_date = today - timedelta(days=30)  # Start habits 30 days ago for better demo
 
-        sample_habits_data = [
-            {
-                "title": "Drink 8 glasses of water",
-                "description": "Stay hydrated by drinking at least 8 glasses of water daily",
-                "periodicity": models.PeriodicityEnum.daily,
-                "frequency": 1,
-                "start_date": start_date,
-                "reminder": True,
-                "icon": "💧",
-                "tag_names": ["Health"]
-            },
-            {
-                "title": "Morning meditation",
-                "description": "Practice mindfulness meditation for 10 minutes each morning",
-                "periodicity": models.PeriodicityEnum.daily,
-                "frequency": 1,
-                "start_date": start_date,
-                "reminder": True,
-                "icon": "🧘",
-                "tag_names": ["Mindfulness", "Wellness"]
-            },
-            {
-                "title": "Exercise workout",
-                "description": "Complete a 30-minute workout session",
-                "periodicity": models.PeriodicityEnum.daily,
-                "frequency": 1,
-                "start_date": start_date,
-                "reminder": True,
-                "icon": "💪",
-                "tag_names": ["Fitness", "Health"]
-            },
-            {
-                "title": "Read for 30 minutes",
-                "description": "Read books or educational material for personal growth",
-                "periodicity": models.PeriodicityEnum.daily,
-                "frequency": 1,
-                "start_date": start_date,
-                "reminder": False,
-                "icon": "📚",
-                "tag_names": ["Learning", "Productivity"]
-            },
-            {
-                "title": "Weekly meal prep",
-                "description": "Prepare healthy meals for the upcoming week",
-                "periodicity": models.PeriodicityEnum.weekly,
-                "frequency": 1,
-                "select_days": "Sun",
-                "start_date": start_date,
-                "reminder": True,
-                "icon": "🍽️",
-                "tag_names": ["Health", "Productivity"]
-            },
-            {
-                "title": "Call family/friends",
-                "description": "Stay connected with loved ones through regular calls",
-                "periodicity": models.PeriodicityEnum.weekly,
-                "frequency": 2,
-                "select_days": "Wed,Sun",
-                "start_date": start_date,
-                "reminder": True,
-                "icon": "📞",
-                "tag_names": ["Social"]
-            },
-            {
-                "title": "Review monthly budget",
-                "description": "Review and analyze monthly expenses and savings",
-                "periodicity": models.PeriodicityEnum.monthly,
-                "frequency": 1,
-                "start_date": start_date,
-                "reminder": True,
-                "icon": "💰",
-                "tag_names": ["Finance"]
-            },
-            {
-                "title": "Learn something new",
-                "description": "Spend time learning a new skill or taking an online course",
-                "periodicity": models.PeriodicityEnum.weekly,
-                "frequency": 3,
-                "select_days": "Mon,Wed,Fri",
-                "start_date": start_date,
-                "reminder": False,
-                "icon": "🎓",
-                "tag_names": ["Learning", "Productivity"]
-            }
-        ]
+        sample_habits_data = [dict(habit, start_date=start_date) for habit in SAMPLE_HABITS]
 
         # Get or create habits
         habits = []
@@ -182,46 +215,21 @@ def run():
                 continue
 
             print(f"Generating sample logs for habit: {habit.title}")
-            current_date = habit.start_date
-
-            while current_date <= today:
-                # Create realistic completion patterns
-                should_complete = False
-
-                if habit.periodicity == models.PeriodicityEnum.daily:
-                    # Daily habits: 70-90% completion rate with some realistic gaps
-                    completion_rate = 0.8 if habit.title in ["Drink 8 glasses of water", "Morning meditation"] else 0.7
-                    should_complete = random.random() < completion_rate
-
-                elif habit.periodicity == models.PeriodicityEnum.weekly:
-                    # Weekly habits: Complete on specific days of the week
-                    if habit.select_days:
-                        day_names = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
-                        current_day = day_names[current_date.weekday()]
-                        if current_day in habit.select_days:
-                            should_complete = random.random() < 0.8  # 80% completion on target days
-                    else:
-                        # Complete once per week randomly
-                        should_complete = current_date.weekday() == 6 and random.random() < 0.75  # Sunday, 75% chance
-
-                elif habit.periodicity == models.PeriodicityEnum.monthly:
-                    # Monthly habits: Complete once per month, usually at the end
-                    if current_date.day >= 25:  # Last week of month
-                        should_complete = random.random() < 0.9  # 90% completion rate for monthly habits
-
-                if should_complete:
+            days = np.arange(habit.start_date, today + timedelta(days=1), dtype="datetime64[D]")
+            rate = completion_rate(habit.title, habit.periodicity, habit.select_days)
+
+            # Create realistic completion patterns
+            for day in days[completion_days(habit.periodicity, habit.select_days, days)].tolist():
+                if random.random() < rate:
                     log = models.HabitLog(
                         habit_id=habit.id,
-                        log_date=current_date,
+                        log_date=day,
                         completed=True,
                         notes=f"Completed {habit.title}",
-                        completed_at=datetime.combine(current_date,
-                                                      datetime.min.time().replace(hour=random.randint(6, 22)))
+                        completed_at=datetime.combine(day, datetime.min.time().replace(hour=random.randint(6, 22)))
                     )
                     habit_logs.append(log)
 
-                current_date += timedelta(days=1)
-
         # Add all new habit logs
         if habit_logs:
             db.add_all(habit_logs)
@@ -0,0 +1,231 @@
+"""Persisted per-habit streak state.
+
+``habit_streak_states`` keeps the most recent and the longest run of every
+habit so streak reads are a primary-key lookup instead of a walk over
+``habit_logs``. ``Habit.mark_completed``/``mark_incomplete`` call
+``record_log_change`` inside their transaction: writes to the latest period
+extend or shrink the current run in place, anything that can merge or split
+older runs recomputes that habit's runs with the set-based query.
+
+Run ``python streak_state.py check`` to compare the table with ``habit_logs``
+and ``python streak_state.py rebuild`` to regenerate it.
+"""
+import argparse
+import sys
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from database import db_manager
+from models.habit import Habit, HabitStreakState
+from streaks import (HabitRuns, StreakStats, compute_runs, count_completed_days, count_period_completions, first_period,
+                     period_end, period_of, period_start)
+
+REBUILD_BATCH_SIZE = 1000
+
+
+def _period_met(db: Session, habit: Habit, period: int) -> bool:
+    """Whether the completed logs in ``period`` reach the habit's target."""
+    periodicity = habit.periodicity.value
+    if periodicity == "daily":
+        return count_completed_days(db, habit.id, period_start(periodicity, period), period_end(periodicity, period)) > 0
+    return count_period_completions(db, habit.id, periodicity, period) >= (habit.frequency or 1)
+
+
+def _apply_runs(state: HabitStreakState, periodicity: str, runs: HabitRuns) -> HabitStreakState:
+    """Copy period-numbered run boundaries onto a state row."""
+    if runs.latest_end is None:
+        state.current_run = 0
+        state.current_run_start = state.current_run_end = state.last_completed_period = None
+        state.longest_run = 0
+        state.longest_run_start = state.longest_run_end = None
+        return state
+
+    state.current_run = runs.latest_end - runs.latest_start + 1
+    state.current_run_start = period_start(periodicity, runs.latest_start)
+    state.current_run_end = period_end(periodicity, runs.latest_end)
+    state.last_completed_period = period_start(periodicity, runs.latest_end)
+    state.longest_run = runs.longest_end - runs.longest_start + 1
+    state.longest_run_start = period_start(periodicity, runs.longest_start)
+    state.longest_run_end = period_end(periodicity, runs.longest_end)
+    return state
+
+
+def _state_runs(state: HabitStreakState, periodicity: str) -> HabitRuns:
+    """Period-numbered run boundaries of a state row."""
+    if state.last_completed_period is None:
+        return HabitRuns(None, None, None, None)
+    return HabitRuns(
+        period_of(periodicity, state.current_run_start),
+        period_of(periodicity, state.last_completed_period),
+        period_of(periodicity, state.longest_run_start),
+        period_of(periodicity, state.longest_run_end),
+    )
+
+
+def _lock_states(db: Session, habit_ids: List[int]) -> Dict[int, HabitStreakState]:
+    """The state rows of ``habit_ids``, reloaded and locked until commit.
+
+    Concurrent writers of a habit (a dashboard tap and a bulk import) queue here, so
+    each reads its logs and state only after the previous one has committed both.
+    """
+    states = (db.query(HabitStreakState).filter(HabitStreakState.habit_id.in_(habit_ids))
+              .order_by(HabitStreakState.habit_id).with_for_update().populate_existing())
+    return {state.habit_id: state for state in states}
+
+
+def recompute_streak_states(db: Session, habit_ids: Iterable[int]) -> List[HabitStreakState]:
+    """Recompute and stage the state rows of ``habit_ids`` from ``habit_logs``."""
+    habit_ids = list(habit_ids)
+    existing = _lock_states(db, habit_ids)
+    runs = compute_runs(db, habit_ids)
+    periodicities = dict(db.query(Habit.id, Habit.periodicity).filter(Habit.id.in_(habit_ids)))
+
+    states = []
+    for habit_id, habit_runs in runs.items():
+        state = existing.get(habit_id)
+        if state is None:
+            state = HabitStreakState(habit_id=habit_id)
+            db.add(state)
+        states.append(_apply_runs(state, periodicities[habit_id].value, habit_runs))
+    db.flush()
+    return states
+
+
+def _recompute(db: Session, habit: Habit) -> HabitStreakState:
+    habit.streak_state = recompute_streak_states(db, [habit.id])[0]
+    return habit.streak_state
+
+
+def record_log_change(db: Session, habit: Habit, log_date: date) -> HabitStreakState:
+    """Update the habit's streak state after its log for ``log_date`` changed.
+
+    Must run after the log write is flushed and before the commit.
+    """
+    periodicity = habit.periodicity.value
+    state = _lock_states(db, [habit.id]).get(habit.id)
+    if state is None or state.last_completed_period is None:
+        return _recompute(db, habit)
+
+    period = period_of(periodicity, log_date)
+    runs = _state_runs(state, periodicity)
+    met = _period_met(db, habit, period)
+
+    if period < runs.latest_end:
+        # Backdated edit: it may merge or split older runs
+        return _recompute(db, habit)
+
+    if period == runs.latest_end:
+        if met:
+            return state
+        if runs.latest_start == runs.latest_end or runs.longest_end == runs.latest_end:
+            # The run disappears or the longest run shrinks; find the new ones
+            return _recompute(db, habit)
+        state.current_run -= 1
+        state.current_run_end = period_end(periodicity, period - 1)
+        state.last_completed_period = period_start(periodicity, period - 1)
+        return state
+
+    if not met:
+        return state
+
+    if period == runs.latest_end + 1:
+        state.current_run += 1
+    else:
+        state.current_run = 1
+        state.current_run_start = period_start(periodicity, period)
+    state.current_run_end = period_end(periodicity, period)
+    state.last_completed_period = period_start(periodicity, period)
+    if state.current_run >= state.longest_run:
+        state.longest_run = state.current_run
+        state.longest_run_start = state.current_run_start
+        state.longest_run_end = state.current_run_end
+    return state
+
+
+def streaks_for(db: Session, habit: Habit, today: Optional[date] = None) -> StreakStats:
+    """Current and longest streak of ``habit`` from its state row.
+
+    Habits without a state row yet (created before the table existed) are
+    computed on the fly without being persisted; ``rebuild`` fills them in.
+    """
+    if today is None:
+        today = date.today()
+    periodicity = habit.periodicity.value
+
+    state = habit.streak_state
+    if state is None:
+        runs = compute_runs(db, [habit.id]).get(habit.id, HabitRuns(None, None, None, None))
+        state = _apply_runs(HabitStreakState(habit_id=habit.id), periodicity, runs)
+    if state.last_completed_period is None:
+        return StreakStats(0, 0)
+
+    runs = _state_runs(state, periodicity)
+    first = first_period(periodicity, habit.start_date)
+    today_period = period_of(periodicity, today)
+    current = 0
+    if runs.latest_end == today_period and today_period >= first:
+        current = runs.latest_end - max(runs.latest_start, first) + 1
+    return StreakStats(current, state.longest_run)
+
+
+def habit_id_batches(db: Session) -> Iterable[List[int]]:
+    """Every habit id, in ascending batches of ``REBUILD_BATCH_SIZE``"""
+    habit_ids = [habit_id for habit_id, in db.query(Habit.id).order_by(Habit.id)]
+    for i in range(0, len(habit_ids), REBUILD_BATCH_SIZE):
+        yield habit_ids[i:i + REBUILD_BATCH_SIZE]
+
+
+def rebuild_streak_states(db: Session) -> int:
+    """Regenerate every state row from ``habit_logs``; returns the number of habits."""
+    rebuilt = 0
+    for batch in habit_id_batches(db):
+        rebuilt += len(recompute_streak_states(db, batch))
+        db.commit()
+    return rebuilt
+
+
+def check_streak_states(db: Session) -> List[Tuple[int, str]]:
+    """Compare stored state rows with ``habit_logs``; returns (habit_id, problem) pairs."""
+    problems = []
+    for batch in habit_id_batches(db):
+        expected = compute_runs(db, batch)
+        stored = {
+            state.habit_id: state
+            for state in db.query(HabitStreakState).filter(HabitStreakState.habit_id.in_(batch))
+        }
+        periodicities = dict(db.query(Habit.id, Habit.periodicity).filter(Habit.id.in_(batch)))
+        for habit_id, runs in expected.items():
+            state = stored.get(habit_id)
+            if state is None:
+                problems.append((habit_id, "missing"))
+                continue
+            periodicity = periodicities[habit_id].value
+            actual = _state_runs(state, periodicity)
+            if actual.latest_end is not None and state.current_run != actual.latest_end - actual.latest_start + 1:
+                problems.append((habit_id, "current_run does not match its boundaries"))
+            elif actual[:2] != runs[:2]:
+                problems.append((habit_id, f"latest run {actual[:2]} != {runs[:2]}"))
+            elif state.longest_run != (0 if runs.longest_end is None else runs.longest_end - runs.longest_start + 1):
+                problems.append((habit_id, f"longest run {state.longest_run} is stale"))
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check or rebuild habit_streak_states from habit_logs.")
+    parser.add_argument("command", choices=["check", "rebuild"])
+    args = parser.parse_args()
+
+    db_manager.initialize_database()
+    db = db_manager.SessionLocal()
+    try:
+        if args.command == "rebuild":
+            print(f"Rebuilt streak state for {rebuild_streak_states(db)} habits.")
+        problems = check_streak_states(db)
+        for habit_id, problem in problems:
+            print(f"Habit {habit_id}: {problem}")
+        print(f"{len(problems)} habits with inconsistent streak state.")
+        sys.exit(1 if problems else 0)
+    finally:
+        db.close()
@@ -0,0 +1,288 @@
+from datetime import date, timedelta
+from typing import Dict, Iterable, NamedTuple, Optional
+
+import numpy as np
+from sqlalchemy import Date, bindparam, text
+from sqlalchemy.orm import Session
+
+
+# Periods are numbered from 0001-01-01 (a Monday), so consecutive days, ISO
+# weeks and calendar months map to consecutive integers and a streak is just
+# an island of consecutive period numbers.
+def _period_sql(column: str) -> str:
+    """SQL expression numbering the period of ``column`` for habit row ``h``."""
+    return f"""CASE h.periodicity
+               WHEN 'daily' THEN {column} - DATE '0001-01-01'
+               WHEN 'weekly' THEN ({column} - DATE '0001-01-01') / 7
+               ELSE EXTRACT(YEAR FROM {column})::int * 12 + EXTRACT(MONTH FROM {column})::int - 1
+           END"""
+
+
+# Completed periods per habit and the islands (runs) they form.
+_RUNS_CTES = """
+WITH h AS (
+    SELECT id AS habit_id,
+           periodicity,
+           CASE WHEN periodicity = 'daily' THEN 1 ELSE COALESCE(frequency, 1) END AS target,
+           CASE periodicity
+               WHEN 'daily' THEN start_date - DATE '0001-01-01'
+               WHEN 'weekly' THEN (start_date - DATE '0001-01-01' + 6) / 7
+               ELSE EXTRACT(YEAR FROM start_date)::int * 12 + EXTRACT(MONTH FROM start_date)::int
+                    - CASE WHEN EXTRACT(DAY FROM start_date) = 1 THEN 1 ELSE 0 END
+           END AS first_period,
+           end_date
+    FROM habits
+    WHERE id IN :habit_ids
+),
+periods AS (
+    -- A completed day meets a daily target on its own
+    SELECT h.habit_id, l.log_date - DATE '0001-01-01' AS period
+    FROM h
+    -- The repeated id list reaches both halves of habit_log_history (live and archived)
+    JOIN habit_log_history() l ON l.habit_id = h.habit_id AND l.completed AND l.habit_id IN :habit_ids
+    WHERE h.periodicity = 'daily'
+    UNION ALL
+    -- Weeks and months are counted in habit_completion_rollups (see rollups.py)
+    SELECT h.habit_id, r.period
+    FROM h
+    JOIN habit_completion_rollups r ON r.habit_id = h.habit_id AND r.periodicity = h.periodicity
+    WHERE r.completed >= h.target
+),
+runs AS (
+    SELECT habit_id, MIN(period) AS run_start, MAX(period) AS run_end
+    FROM (
+        SELECT habit_id, period,
+               period - ROW_NUMBER() OVER (PARTITION BY habit_id ORDER BY period) AS island
+        FROM periods
+    ) islands
+    GROUP BY habit_id, island
+)"""
+
+STATS_SQL = text(_RUNS_CTES + f""",
+bounds AS (
+    SELECT h.habit_id, h.first_period,
+           {_period_sql("CAST(:today AS date)")} AS today_period,
+           {_period_sql("LEAST(CAST(:today AS date), COALESCE(h.end_date, :today))")} AS last_period
+    FROM h
+)
+SELECT b.habit_id,
+       COALESCE(MAX(CASE WHEN r.run_end = b.today_period AND b.today_period >= b.first_period
+                         THEN r.run_end - GREATEST(r.run_start, b.first_period) + 1 END), 0) AS current,
+       COALESCE(MAX(r.run_end - r.run_start + 1), 0) AS longest,
+       -- GREATEST and LEAST skip NULLs, so a habit without runs is filtered out rather than counted whole
+       COALESCE(SUM(GREATEST(LEAST(r.run_end, b.last_period) - GREATEST(r.run_start, b.first_period) + 1, 0))
+                    FILTER (WHERE r.habit_id IS NOT NULL), 0) AS completed_periods,
+       GREATEST(b.last_period - b.first_period + 1, 0) AS elapsed_periods,
+       COALESCE((SELECT bool_or(t.completed) FROM habit_logs t
+                 WHERE t.habit_id = b.habit_id AND t.log_date = :today), false) AS completed_today
+FROM bounds b
+LEFT JOIN runs r ON r.habit_id = b.habit_id
+GROUP BY b.habit_id, b.today_period, b.first_period, b.last_period
+""").bindparams(bindparam("habit_ids", expanding=True), bindparam("today", type_=Date))
+
+# The most recent run and the longest run (latest wins ties) of each habit.
+RUNS_SQL = text(_RUNS_CTES + """
+SELECT h.habit_id, h.periodicity,
+       latest.run_start AS latest_start, latest.run_end AS latest_end,
+       longest.run_start AS longest_start, longest.run_end AS longest_end
+FROM h
+-- One sort of all runs each; a LATERAL ... LIMIT 1 would rescan the runs CTE once per habit
+LEFT JOIN (
+    SELECT DISTINCT ON (habit_id) habit_id, run_start, run_end FROM runs
+    ORDER BY habit_id, run_end DESC
+) latest ON latest.habit_id = h.habit_id
+LEFT JOIN (
+    SELECT DISTINCT ON (habit_id) habit_id, run_start, run_end FROM runs
+    ORDER BY habit_id, run_end - run_start DESC, run_end DESC
+) longest ON longest.habit_id = h.habit_id
+""").bindparams(bindparam("habit_ids", expanding=True))
+
+COMPLETED_DAYS_SQL = text("""
+SELECT COUNT(*) FROM habit_log_history(:start, :end)
+WHERE habit_id = :habit_id AND completed
+""").bindparams(bindparam("start", type_=Date), bindparam("end", type_=Date))
+
+PERIOD_COMPLETED_SQL = text("""
+SELECT completed FROM habit_completion_rollups
+WHERE habit_id = :habit_id AND periodicity = :periodicity AND period = :period
+""")
+
+class WholePeriods(NamedTuple):
+    """The periods lying wholly inside a date range, and the partial days around them."""
+    first: int
+    last: int  # Below ``first`` when no period fits
+    head_end: date  # Days from the range start to here come before ``first``
+    tail_start: date  # Days from here to the range end come after ``last``
+
+
+class StreakStats(NamedTuple):
+    current: int
+    longest: int
+
+
+class HabitRuns(NamedTuple):
+    """Run boundaries as period numbers; ``None`` when nothing was completed."""
+    latest_start: Optional[int]
+    latest_end: Optional[int]
+    longest_start: Optional[int]
+    longest_end: Optional[int]
+
+
+class HabitStats(NamedTuple):
+    current_streak: int
+    longest_streak: int
+    completed_today: bool
+    completion_rate: float
+
+
+def day_period(d: date) -> int:
+    """Day number counted from 0001-01-01."""
+    return d.toordinal() - 1
+
+
+def week_period(d: date) -> int:
+    """ISO week number counted from the week of 0001-01-01."""
+    return day_period(d) // 7
+
+
+def month_period(d: date) -> int:
+    """Calendar month number counted from January 0001."""
+    return d.year * 12 + d.month - 1
+
+
+def period_of(periodicity: str, d: date) -> int:
+    """Number of the day, ISO week or month containing ``d``."""
+    if periodicity == "daily":
+        return day_period(d)
+    if periodicity == "weekly":
+        return week_period(d)
+    return month_period(d)
+
+
+def period_start(periodicity: str, period: int) -> date:
+    """First day of a numbered period."""
+    if periodicity == "daily":
+        return date.fromordinal(period + 1)
+    if periodicity == "weekly":
+        return date.fromordinal(period * 7 + 1)
+    return date(period // 12, period % 12 + 1, 1)
+
+
+def period_end(periodicity: str, period: int) -> date:
+    """Last day of a numbered period."""
+    return period_start(periodicity, period + 1) - timedelta(days=1)
+
+
+def first_period(periodicity: str, start_date: date) -> int:
+    """First period that starts on or after ``start_date``, as the per-period walks count them."""
+    period = period_of(periodicity, start_date)
+    return period if period_start(periodicity, period) >= start_date else period + 1
+
+
+def whole_periods(periodicity: str, start: date, end: date) -> WholePeriods:
+    """Which periods of ``start``..``end`` are covered whole, and which days are left at either end."""
+    first = period_of(periodicity, start)
+    if period_start(periodicity, first) < start:
+        first += 1
+    last = period_of(periodicity, end)
+    if period_end(periodicity, last) > end:
+        last -= 1
+    if first > last:
+        return WholePeriods(first, last, end, end + timedelta(days=1))
+    return WholePeriods(first, last, period_start(periodicity, first) - timedelta(days=1),
+                        period_end(periodicity, last) + timedelta(days=1))
+
+
+_EPOCH_DAY = date(1970, 1, 1).toordinal() - 1
+_EPOCH_MONTH = 1970 * 12
+
+
+def met_periods(days: np.ndarray, periodicity: str, target: int = 1) -> np.ndarray:
+    """Sorted period numbers with at least ``target`` completed logs.
+
+    ``days`` holds the ``day_period`` of every completed log. Days are bucketed
+    with NumPy ordinal arithmetic into the same numbers ``period_of`` uses.
+    """
+    if periodicity == "daily":
+        buckets = days
+    elif periodicity == "weekly":
+        buckets = days // 7
+    else:
+        months = (days - _EPOCH_DAY).astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+        buckets = months + _EPOCH_MONTH
+
+    periods, counts = np.unique(buckets, return_counts=True)
+    return periods[counts >= target]
+
+
+def _run_breaks(met: np.ndarray) -> np.ndarray:
+    """Indexes of ``met`` after which a run ends because the next period is not the following one."""
+    return np.flatnonzero(np.diff(met) != 1)
+
+
+def _longest_run(met: np.ndarray, breaks: np.ndarray) -> int:
+    run_ends = np.concatenate((breaks, [met.size - 1]))
+    return int(np.diff(run_ends, prepend=-1).max())
+
+
+def streaks_from_days(days: np.ndarray, periodicity: str, target: int, start_date: date,
+                      today: Optional[date] = None) -> StreakStats:
+    """Current and longest streak from completed-log day numbers, with the semantics of ``compute_habit_stats``."""
+    met = met_periods(days, periodicity, target)
+    if met.size == 0:
+        return StreakStats(0, 0)
+
+    breaks = _run_breaks(met)
+    longest = _longest_run(met, breaks)
+    today_period = period_of(periodicity, today or date.today())
+    first = first_period(periodicity, start_date)
+    current = 0
+    if met[-1] == today_period and today_period >= first:
+        latest_start = int(met[breaks[-1] + 1]) if breaks.size else int(met[0])
+        current = today_period - max(latest_start, first) + 1
+    return StreakStats(current, longest)
+
+
+def count_completed_days(db: Session, habit_id: int, start: date, end: date) -> int:
+    """Completed days of a habit between ``start`` and ``end``, inclusive, archived months included."""
+    return db.execute(COMPLETED_DAYS_SQL, {"habit_id": habit_id, "start": start, "end": end}).scalar()
+
+
+def count_period_completions(db: Session, habit_id: int, periodicity: str, period: int) -> int:
+    """Completed days of a habit in a numbered ISO week or month, from its rollup row."""
+    completed = db.execute(PERIOD_COMPLETED_SQL,
+                           {"habit_id": habit_id, "periodicity": periodicity, "period": period}).scalar()
+    return completed or 0
+
+
+def compute_habit_stats(db: Session, habit_ids: Iterable[int], today: Optional[date] = None) -> Dict[int, HabitStats]:
+    """Streaks, completed-today flag and completion rate in a single round-trip.
+
+    A period (day, ISO week or calendar month) counts when its completed logs
+    reach the habit's target (``frequency`` for weekly/monthly habits, one log
+    for daily habits). The current streak follows ``get_current_streak``: it
+    ends in today's period and only counts periods starting on or after
+    ``start_date``. The completion rate is the share of periods between
+    ``start_date`` and today (or ``end_date`` if earlier) whose target was
+    met. Unknown habit ids are left out of the result.
+    """
+    habit_ids = list(habit_ids)
+    if not habit_ids:
+        return {}
+    stats = {}
+    for row in db.execute(STATS_SQL, {"habit_ids": habit_ids, "today": today or date.today()}):
+        rate = row.completed_periods / row.elapsed_periods if row.elapsed_periods else 0.0
+        stats[row.habit_id] = HabitStats(row.current, row.longest, row.completed_today, round(rate, 4))
+    return stats
+
+
+def compute_runs(db: Session, habit_ids: Iterable[int]) -> Dict[int, HabitRuns]:
+    """Latest and longest run of each habit in a single round-trip."""
+    habit_ids = list(habit_ids)
+    if not habit_ids:
+        return {}
+    rows = db.execute(RUNS_SQL, {"habit_ids": habit_ids})
+    return {
+        row.habit_id: HabitRuns(row.latest_start, row.latest_end, row.longest_start, row.longest_end)
+        for row in rows
+    }
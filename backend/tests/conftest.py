@@ -0,0 +1,73 @@
+"""Fixtures for tests against PostgreSQL.
+
+Set ``TEST_DATABASE_URL`` to a database the tests may drop and recreate (its
+name must end in ``test``); without it, tests that need the database are
+skipped. The schema is built once per run through the migrations, and every
+test starts from empty tables:
+
+    TEST_DATABASE_URL=postgresql://postgres@localhost/ritualist_test python -m pytest
+"""
+import os
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+if TEST_DATABASE_URL:
+    if not make_url(TEST_DATABASE_URL).database.endswith("test"):
+        raise pytest.UsageError("TEST_DATABASE_URL must name a throwaway database ending in 'test'")
+    # config.py reads these when first imported, which is after this module
+    os.environ.update({
+        "DATABASE_URL": TEST_DATABASE_URL,
+        "DB_STARTUP_MODE": "check",
+        "DATABASE_ASYNC": "false",
+        "DATABASE_REPLICA_URLS": "",
+        "QUERY_COUNT_HEADER": "true",
+        "CACHE_BACKEND": "none",
+        "COMPLETION_INDEX_ENABLED": "false",
+        "EVENTS_ENABLED": "false",
+    })
+
+
+@pytest.fixture(scope="session")
+def engine():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    import migrate
+
+    url = make_url(TEST_DATABASE_URL)
+    admin = create_engine(url.set(database="postgres"), isolation_level="AUTOCOMMIT")
+    with admin.connect() as conn:
+        conn.execute(text(f'DROP DATABASE IF EXISTS "{url.database}" WITH (FORCE)'))
+        conn.execute(text(f'CREATE DATABASE "{url.database}"'))
+    admin.dispose()
+
+    engine = create_engine(url)
+    migrate.upgrade(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    session = Session(engine)
+    try:
+        yield session
+    finally:
+        session.close()
+        with engine.begin() as conn:
+            conn.execute(text("TRUNCATE habits, tags, habit_logs, habit_log_archive, idempotency_keys CASCADE"))
+
+
+@pytest.fixture
+def client(db):
+    """The app in-process, started as under a server, on the tables ``db`` empties afterwards"""
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as client:
+        yield client
@@ -0,0 +1,214 @@
+"""``completion_rates`` against a day-by-day count per habit.
+
+``reference_rates`` walks every day of every habit in Python, with the rules
+analytics.py documents; the single statement must give the same expected
+and completed counts for every group, over varied schedules, partial weeks
+at either end of a range, runs of months, archived months and an end past
+today.
+"""
+import random
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from analytics import completion_rates
+from models import Habit, HabitStreakState, PeriodicityEnum, Tag
+from schemas import CompletionGroupBy
+
+# A Wednesday
+TODAY = date(2026, 3, 18)
+FIRST_DAY = date(2024, 9, 1)
+DAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+SELECT_DAYS = [None, "", "Mon,Wed,Fri", " tue , thursday", "Sat,Sun", "Sun", "Bogus", "Fri,Bogus"]
+FREQUENCIES = [None, 1, 2, 3, 5, 12]
+TAG_NAMES = ["health", "work", "home"]
+ARCHIVED_MONTHS = [date(2024, 10, 1), date(2024, 11, 1)]
+
+# (group_by, key) -> [expected, completed]; the total is keyed ("total", None)
+Counts = Dict[Tuple[str, object], List[int]]
+
+
+def _monday(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+def _month_end(day: date) -> date:
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+
+
+def _days(first: date, last: date):
+    for offset in range((last - first).days + 1):
+        yield first + timedelta(days=offset)
+
+
+def _scheduled(select_days: Optional[str]) -> Set[int]:
+    named = {i for i, name in enumerate(DAY_NAMES) if name in (select_days or "").title()}
+    return named or set(range(7))
+
+
+def _periods(habit: Habit, start: date, end: date):
+    """(first day, last day) of the weeks or months that end by ``end`` and count for the range."""
+    if habit.periodicity == PeriodicityEnum.weekly:
+        first, last_of = _monday(start), lambda day: day + timedelta(days=6)
+    else:
+        first, last_of = start.replace(day=1), _month_end
+    while last_of(first) <= end:
+        if first >= habit.start_date and (habit.end_date is None or first <= habit.end_date):
+            yield first, last_of(first)
+        first = last_of(first) + timedelta(days=1)
+
+
+def habit_weeks(habit: Habit, completed: Set[date], start: date, end: date) -> Dict[date, List[int]]:
+    """Expected and completed occurrences of a habit per week (Monday), with ``end`` no later than today."""
+    scheduled = _scheduled(habit.select_days)
+    weeks = defaultdict(lambda: [0, 0])
+    if habit.periodicity == PeriodicityEnum.daily:
+        first, last = max(start, habit.start_date), min(end, habit.end_date or end)
+        for day in _days(first, last):
+            if day.weekday() in scheduled:
+                weeks[_monday(day)][0] += 1
+        for monday, counts in weeks.items():
+            done = sum(day in completed for day in _days(max(monday, start), min(monday + timedelta(days=6), end)))
+            counts[1] = min(done, counts[0])
+        return weeks
+    for first, last in _periods(habit, start, end):
+        expected = min(habit.frequency or 1, sum(day.weekday() in scheduled for day in _days(first, last)))
+        done = sum(day in completed for day in _days(first, last))
+        weeks[_monday(last)][0] += expected
+        weeks[_monday(last)][1] += min(done, expected)
+    return weeks
+
+
+def reference_rates(habits: List[Tuple[Habit, Set[date]]], start: date, end: date, today: date) -> Counts:
+    counts: Counts = defaultdict(lambda: [0, 0])
+    counts["total", None] = [0, 0]
+    end = min(end, today)
+    if end < start:
+        return counts
+    for habit, completed in habits:
+        if habit.start_date > end or (habit.end_date is not None and habit.end_date < start):
+            continue
+        keys = [("habit", habit.id), ("periodicity", habit.periodicity.value), ("total", None)]
+        keys += [("tag", tag.name) for tag in habit.tags] or [("tag", None)]
+        for monday, (expected, done) in habit_weeks(habit, completed, start, end).items():
+            for key in keys + [("week", monday)]:
+                counts[key][0] += expected
+                counts[key][1] += done
+    return counts
+
+
+def _result_counts(result: dict) -> Counts:
+    counts = {("total", None): [result["total"]["expected"], result["total"]["completed"]]}
+    for group in result["groups"]:
+        name = group["group_by"]
+        key = {"habit": "habit_id", "tag": "tag", "periodicity": "periodicity", "week": "week"}[name]
+        assert (name, group[key]) not in counts
+        counts[name, group[key]] = [group["expected"], group["completed"]]
+    return counts
+
+
+def _selected(counts: Counts, group_by: List[str]) -> Counts:
+    """The requested groups, without the ones nothing was expected or completed in"""
+    return {key: value for key, value in counts.items()
+            if key[0] == "total" or (key[0] in group_by and value != [0, 0])}
+
+
+@pytest.fixture(scope="module")
+def db(engine):
+    """One session for the module: the habits are seeded once and only read"""
+    session = Session(engine)
+    try:
+        yield session
+    finally:
+        session.close()
+        with engine.begin() as conn:
+            conn.execute(text("TRUNCATE habits, tags, habit_logs, habit_log_archive CASCADE"))
+
+
+@pytest.fixture(scope="module")
+def habits(db) -> List[Tuple[Habit, Set[date]]]:
+    """Thirty habits with varied schedules, targets, dates and tags, and their completed days."""
+    rng = random.Random(23)
+    tags = [Tag(name=name) for name in TAG_NAMES]
+    created, rows = [], []
+    for number in range(30):
+        periodicity = [PeriodicityEnum.daily, PeriodicityEnum.weekly, PeriodicityEnum.monthly][number % 3]
+        start_date = FIRST_DAY + timedelta(days=rng.randrange(400))
+        end_date = start_date + timedelta(days=rng.randrange(30, 300)) if rng.random() < 0.3 else None
+        habit = Habit(title=f"Habit {number}", periodicity=periodicity, frequency=rng.choice(FREQUENCIES),
+                      select_days=rng.choice(SELECT_DAYS), start_date=start_date, end_date=end_date,
+                      reminder=False, tags=rng.sample(tags, rng.choice([0, 1, 1, 2])))
+        habit.streak_state = HabitStreakState()
+        db.add(habit)
+        created.append(habit)
+    db.flush()
+
+    result = []
+    for habit in created:
+        rate = rng.random()
+        completed = set()
+        # Some logs fall before start_date or on unscheduled days, and some are incomplete
+        for day in _days(habit.start_date - timedelta(days=10), TODAY):
+            if rng.random() < rate:
+                completed.add(day)
+                rows.append({"habit_id": habit.id, "log_date": day, "completed": True})
+            elif rng.random() < 0.1:
+                rows.append({"habit_id": habit.id, "log_date": day, "completed": False})
+        result.append((habit, completed))
+    db.execute(text("INSERT INTO habit_logs (habit_id, log_date, completed, created_at) "
+                    "VALUES (:habit_id, :log_date, :completed, now())"), rows)
+    for month in ARCHIVED_MONTHS:
+        db.execute(text("SELECT archive_habit_log_month(:month)"), {"month": month})
+    db.commit()
+    return result
+
+
+RANGES = {
+    "one whole week": (date(2025, 6, 2), date(2025, 6, 8)),
+    "partial weeks at both ends": (date(2025, 6, 4), date(2025, 7, 15)),
+    "one day": (date(2025, 6, 4), date(2025, 6, 4)),
+    "within one week": (date(2025, 6, 3), date(2025, 6, 6)),
+    "whole months": (date(2025, 1, 1), date(2025, 6, 30)),
+    "months with partial edges": (date(2024, 12, 31), date(2025, 5, 1)),
+    "archived months": (date(2024, 9, 15), date(2024, 12, 20)),
+    "past today": (date(2025, 12, 10), date(2026, 5, 31)),
+    "after today": (TODAY + timedelta(days=1), TODAY + timedelta(days=30)),
+    "a year": (TODAY - timedelta(days=364), TODAY),
+}
+
+
+def _random_ranges(count: int) -> Dict[str, Tuple[date, date]]:
+    rng = random.Random(230)
+    ranges = {}
+    for number in range(count):
+        start = FIRST_DAY + timedelta(days=rng.randrange(600))
+        ranges[f"random {number}"] = (start, start + timedelta(days=rng.randrange(200)))
+    return ranges
+
+
+ALL_RANGES = {**RANGES, **_random_ranges(15)}
+
+
+@pytest.mark.parametrize("start, end", list(ALL_RANGES.values()), ids=list(ALL_RANGES))
+def test_matches_daily_count(db, habits, start, end):
+    expected = reference_rates(habits, start, end, TODAY)
+    every_group = [group.value for group in CompletionGroupBy]
+    result = completion_rates(db, start, end, every_group, TODAY)
+    assert (result["start"], result["end"]) == (start, end)
+    assert _selected(_result_counts(result), every_group) == _selected(expected, every_group)
+    # Each grouping on its own builds a different statement
+    for group in every_group:
+        assert _selected(_result_counts(completion_rates(db, start, end, [group], TODAY)), [group]) \
+            == _selected(expected, [group])
+
+
+def test_earlier_today_cuts_the_range(db, habits):
+    start, end = date(2025, 3, 1), date(2025, 5, 31)
+    today = date(2025, 4, 16)
+    result = completion_rates(db, start, end, ["week"], today)
+    assert _selected(_result_counts(result), ["week"]) == _selected(reference_rates(habits, start, end, today), ["week"])
+    assert max(group["week"] for group in result["groups"]) == _monday(today)
@@ -0,0 +1,52 @@
+"""POST /habits/logs/bulk: rows that would break the batch are rejected one by one."""
+from datetime import date, datetime, timezone
+
+import pytest
+from sqlalchemy import text
+
+from bulk_logs import RowError, parse_row
+
+
+@pytest.mark.parametrize("row, reason", [
+    ({"habit_id": 2 ** 31, "log_date": "2025-06-01"}, "habit 2147483648 does not exist"),
+    ({"habit_id": -2 ** 31 - 1, "log_date": "2025-06-01"}, "habit -2147483649 does not exist"),
+    ({"habit_id": True, "log_date": "2025-06-01"}, "habit_id must be an integer"),
+    ({"habit_id": 1, "log_date": "2025-06-01", "notes": "a\x00b"}, "notes must not contain NUL characters"),
+    ({"habit_id": 1, "log_date": "2025-06-01", "notes": "\ud800"}, "notes must be valid Unicode text"),
+    ({"habit_id": 1, "log_date": "2025-06-01", "completed_at": "yesterday"}, "completed_at must be an ISO timestamp"),
+    ({"habit_id": 1, "log_date": "2025-06-01", "completed_at": 5}, "completed_at must be an ISO timestamp"),
+])
+def test_parse_row_rejects(row, reason):
+    with pytest.raises(RowError, match=f"^{reason}$"):
+        parse_row(row)
+
+
+def test_parse_row_reads_utc_designator():
+    *_, completed_at = parse_row({"habit_id": 1, "log_date": "2025-06-01", "completed_at": "2025-06-01T07:30:00Z"})
+    expected = datetime(2025, 6, 1, 7, 30, tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+    assert completed_at == expected
+    assert parse_row({"habit_id": 1, "log_date": "2025-06-01", "completed_at": "2025-06-01T07:30:00"})[4] \
+        == datetime(2025, 6, 1, 7, 30)
+
+
+def test_bad_rows_are_rejected_and_the_rest_merged(client, db):
+    habit_id = client.post("/habits/", json={"title": "Read", "periodicity": "daily",
+                                             "start_date": "2024-01-01"}).json()["id"]
+    client.post("/habits/logs/bulk", json=[{"habit_id": habit_id, "log_date": "2024-02-10"},
+                                           {"habit_id": habit_id, "log_date": "2025-06-01"}]).raise_for_status()
+    # Archived days become live rows again before the merge; they are updates, not inserts
+    db.execute(text("SELECT archive_habit_log_month(:month)"), {"month": date(2024, 2, 1)})
+    db.commit()
+
+    response = client.post("/habits/logs/bulk", json=[
+        {"habit_id": habit_id, "log_date": "2024-02-10", "completed": False},
+        {"habit_id": habit_id, "log_date": "2025-06-01", "notes": "again"},
+        {"habit_id": habit_id, "log_date": "2025-06-02", "completed_at": "2025-06-02T07:30:00Z"},
+        {"habit_id": 2 ** 31, "log_date": "2025-06-03"},
+        {"habit_id": habit_id, "log_date": "2025-06-04", "notes": "nul\x00"},
+        {"habit_id": habit_id + 1, "log_date": "2025-06-05"},
+    ])
+    assert response.status_code == 200
+    result = response.json()
+    assert (result["received"], result["inserted"], result["updated"], result["rejected"]) == (6, 1, 2, 3)
+    assert [reject["row"] for reject in result["rejects"]] == [3, 4, 5]
@@ -0,0 +1,27 @@
+"""The frontend's credentialed requests get through CORS, so the read-your-writes cookie comes back."""
+from config import settings
+
+FRONTEND = "http://localhost:3000"
+
+
+def test_preflight_allows_credentials_from_the_frontend(client):
+    assert FRONTEND in settings.cors_origins
+    response = client.options("/habits/1/complete", headers={
+        "Origin": FRONTEND, "Access-Control-Request-Method": "POST",
+        "Access-Control-Request-Headers": "content-type"})
+    assert response.status_code == 200
+    assert response.headers["access-control-allow-origin"] == FRONTEND
+    assert response.headers["access-control-allow-credentials"] == "true"
+
+
+def test_credentialed_read_names_the_origin(client):
+    response = client.get("/tags/", headers={"Origin": FRONTEND, "Cookie": "ritualist_last_write=0"})
+    assert response.headers["access-control-allow-origin"] == FRONTEND
+    assert response.headers["access-control-allow-credentials"] == "true"
+
+
+def test_other_origins_are_refused(client):
+    response = client.options("/tags/", headers={"Origin": "http://evil.example",
+                                                "Access-Control-Request-Method": "GET"})
+    assert response.status_code == 400
+    assert "access-control-allow-origin" not in response.headers
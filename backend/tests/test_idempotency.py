@@ -0,0 +1,28 @@
+"""Expired idempotency keys are purged in batches, and live ones kept."""
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+import idempotency
+from models import IdempotencyKey
+
+NOW = datetime(2026, 3, 18, 12, 0)
+
+
+def _store(db, key: str, age: timedelta) -> None:
+    db.add(IdempotencyKey(key=key, request_fingerprint=f"complete:{key}", response={"key": key},
+                          created_at=NOW - age))
+
+
+def test_purge_deletes_only_expired_keys(db, monkeypatch):
+    monkeypatch.setattr(idempotency, "PURGE_BATCH_SIZE", 3)
+    for number in range(7):
+        _store(db, f"old-{number}", idempotency.IDEMPOTENCY_KEY_TTL + timedelta(minutes=number + 1))
+    for number in range(2):
+        _store(db, f"live-{number}", idempotency.IDEMPOTENCY_KEY_TTL - timedelta(minutes=number + 1))
+    db.commit()
+
+    assert idempotency.purge_expired(db.get_bind(), NOW) == 7
+    remaining = db.execute(text("SELECT key FROM idempotency_keys ORDER BY key")).scalars().all()
+    assert remaining == ["live-0", "live-1"]
+    assert idempotency.purge_expired(db.get_bind(), NOW) == 0
@@ -0,0 +1,65 @@
+"""Reads must not issue more statements as pages, tags and logs grow.
+
+Each route is requested once over a small dataset and once over ten times as
+many habits, each with more tags and logs, and ``X-Query-Count`` must stay the
+same (see querycount.py).
+"""
+from datetime import date, timedelta
+
+from querycount import QUERY_COUNT_HEADER
+
+HABITS = 3
+
+ROUTES = {
+    "list": "/habits/",
+    "list with recent logs": "/habits/?recent_days=7",
+    "list by tag": "/habits/?tags=tag-0",
+    "list with stats": "/habits/with-stats/",
+    "detail": "/habits/{habit_id}",
+    "detail with recent logs": "/habits/{habit_id}?recent_days=7",
+    "tags": "/tags/",
+    "tags with counts": "/tags/?with_counts=true",
+}
+
+
+def _seed(client, all_tag_ids: list, habits: int, tags_per_habit: int, days: int) -> int:
+    """Create ``habits`` habits with tags and a completed log on each of the last ``days`` days; returns the last id.
+
+    Every habit also gets the first tag ever created, which the "list by tag" route filters on.
+    """
+    tag_ids = []
+    for _ in range(tags_per_habit):
+        response = client.post("/tags/", json={"name": f"tag-{len(all_tag_ids)}"})
+        response.raise_for_status()
+        all_tag_ids.append(response.json()["id"])
+        tag_ids.append(all_tag_ids[-1])
+
+    today = date.today()
+    for number in range(habits):
+        response = client.post("/habits/", json={
+            "title": f"Habit {number}", "periodicity": "daily" if number % 2 else "weekly", "frequency": 2,
+            "start_date": (today - timedelta(days=60)).isoformat(), "tag_ids": sorted(set(tag_ids + all_tag_ids[:1])),
+        })
+        response.raise_for_status()
+        habit_id = response.json()["id"]
+        rows = [{"habit_id": habit_id, "log_date": (today - timedelta(days=ago)).isoformat(), "completed": True}
+                for ago in range(days)]
+        client.post("/habits/logs/bulk", json=rows).raise_for_status()
+    return habit_id
+
+
+def _query_counts(client, habit_id: int) -> dict:
+    counts = {}
+    for name, url in ROUTES.items():
+        response = client.get(url.format(habit_id=habit_id))
+        assert response.status_code == 200, (name, response.text)
+        counts[name] = int(response.headers[QUERY_COUNT_HEADER])
+    return counts
+
+
+def test_query_counts_stay_flat(client):
+    tag_ids = []
+    small = _query_counts(client, _seed(client, tag_ids, HABITS, tags_per_habit=1, days=3))
+    # Nine times as many again, each with more tags and logs: ten times the habits in all
+    large = _query_counts(client, _seed(client, tag_ids, 9 * HABITS, tags_per_habit=4, days=30))
+    assert large == small
@@ -0,0 +1,224 @@
+"""The set-based streak engines against a walk over every period.
+
+``compute_habit_stats`` (STATS_SQL), the persisted streak state (kept by
+``recompute_streak_states`` and ``record_log_change``) and the completion
+index's ``streaks_from_days`` must all agree with ``reference_stats``, which
+walks a habit's periods one by one. It stands in for the per-period
+``Habit._calculate_*`` methods the engines replaced, with their semantics.
+"""
+import random
+from collections import Counter
+from datetime import date, timedelta
+from typing import NamedTuple, Optional, Set
+
+import numpy as np
+import pytest
+from sqlalchemy import text
+
+from models import Habit, HabitStreakState, PeriodicityEnum
+from streak_state import check_streak_states, recompute_streak_states, streaks_for
+from streaks import HabitStats, compute_habit_stats, day_period, streaks_from_days
+
+# A Wednesday
+TODAY = date(2026, 3, 18)
+YESTERDAY = TODAY - timedelta(days=1)
+DAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+
+def _period_start(periodicity: str, day: date) -> date:
+    if periodicity == "daily":
+        return day
+    if periodicity == "weekly":
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def _next_period(periodicity: str, start: date) -> date:
+    if periodicity == "daily":
+        return start + timedelta(days=1)
+    if periodicity == "weekly":
+        return start + timedelta(days=7)
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+def _previous_period(periodicity: str, start: date) -> date:
+    if periodicity == "monthly":
+        return (start - timedelta(days=1)).replace(day=1)
+    return start - timedelta(days=1 if periodicity == "daily" else 7)
+
+
+def reference_stats(periodicity: str, frequency: int, start_date: date, end_date: Optional[date],
+                    completed: Set[date], today: date) -> HabitStats:
+    """Streaks and completion rate by walking periods, identified by their first day."""
+    target = 1 if periodicity == "daily" else frequency
+    counts = Counter(_period_start(periodicity, day) for day in completed)
+    met = {period for period, count in counts.items() if count >= target}
+
+    # Back from today's period, over periods that start on or after start_date
+    current, period = 0, _period_start(periodicity, today)
+    while period >= start_date and period in met:
+        current += 1
+        period = _previous_period(periodicity, period)
+
+    longest = run = 0
+    previous = None
+    for period in sorted(met):
+        run = run + 1 if previous is not None and _next_period(periodicity, previous) == period else 1
+        longest = max(longest, run)
+        previous = period
+
+    period = _period_start(periodicity, start_date)
+    if period < start_date:
+        period = _next_period(periodicity, period)
+    last = _period_start(periodicity, min(today, end_date or today))
+    elapsed = met_elapsed = 0
+    while period <= last:
+        elapsed += 1
+        met_elapsed += period in met
+        period = _next_period(periodicity, period)
+    rate = round(met_elapsed / elapsed, 4) if elapsed else 0.0
+    return HabitStats(current, longest, today in completed, rate)
+
+
+class Case(NamedTuple):
+    periodicity: str
+    frequency: int = 1
+    select_days: Optional[str] = None
+    # Days before TODAY
+    starts_ago: int = 200
+    history_days: int = 200
+    rate: float = 0.8
+    ends_ago: Optional[int] = None
+    # Forced state of today and yesterday; None leaves them to chance
+    today: Optional[bool] = None
+    yesterday: Optional[bool] = None
+
+
+CASES = {
+    "daily-gaps": Case("daily", rate=0.7),
+    "daily-done-today": Case("daily", rate=0.9, today=True, yesterday=True),
+    "daily-done-yesterday-only": Case("daily", rate=0.9, today=False, yesterday=True),
+    "daily-today-after-gap": Case("daily", rate=0.9, today=True, yesterday=False),
+    "daily-select-days": Case("daily", select_days="Mon,Wed,Fri", rate=0.9, today=True),
+    "daily-logs-before-start": Case("daily", starts_ago=20, history_days=60, rate=0.95, today=True),
+    "daily-ended": Case("daily", ends_ago=30, rate=0.8),
+    "daily-started-today": Case("daily", starts_ago=0, history_days=10, rate=1.0, today=True),
+    "weekly-once": Case("weekly", rate=0.3, today=True),
+    "weekly-target-3": Case("weekly", frequency=3, rate=0.55),
+    "weekly-select-days-target-2": Case("weekly", frequency=2, select_days="Wed,Sun", rate=0.8, today=True),
+    "weekly-mid-week-start": Case("weekly", starts_ago=23, history_days=40, rate=0.6, today=True),
+    "monthly-once": Case("monthly", starts_ago=500, history_days=500, rate=0.1),
+    "monthly-target-4": Case("monthly", frequency=4, starts_ago=400, history_days=420, rate=0.2, today=True),
+    "monthly-mid-month-start": Case("monthly", frequency=2, starts_ago=75, history_days=120, rate=0.15, today=True),
+    "never-completed": Case("weekly", rate=0.0, today=False),
+}
+
+
+def _history(case: Case, rng: random.Random) -> Set[date]:
+    """Completed days: scheduled days at ``case.rate``, then today and yesterday as forced."""
+    scheduled = {i for i, name in enumerate(DAY_NAMES) if name in (case.select_days or "")} or set(range(7))
+    completed = set()
+    for ago in range(case.history_days, -1, -1):
+        day = TODAY - timedelta(days=ago)
+        if day.weekday() in scheduled and rng.random() < case.rate:
+            completed.add(day)
+    for day, forced in ((TODAY, case.today), (YESTERDAY, case.yesterday)):
+        if forced is True:
+            completed.add(day)
+        elif forced is False:
+            completed.discard(day)
+    return completed
+
+
+def _create_habit(db, case: Case) -> Habit:
+    habit = Habit(
+        title="Streak test", periodicity=PeriodicityEnum(case.periodicity), frequency=case.frequency,
+        select_days=case.select_days, start_date=TODAY - timedelta(days=case.starts_ago),
+        end_date=None if case.ends_ago is None else TODAY - timedelta(days=case.ends_ago), reminder=False,
+    )
+    habit.streak_state = HabitStreakState()
+    db.add(habit)
+    db.commit()
+    return habit
+
+
+def _assert_engines_agree(db, habit: Habit, completed: Set[date]) -> None:
+    expected = reference_stats(habit.periodicity.value, habit.frequency, habit.start_date, habit.end_date,
+                               completed, TODAY)
+
+    assert compute_habit_stats(db, [habit.id], TODAY)[habit.id] == expected
+
+    db.expire_all()
+    state = streaks_for(db, habit, TODAY)
+    assert (state.current, state.longest) == (expected.current_streak, expected.longest_streak)
+    assert check_streak_states(db) == []
+
+    days = np.array(sorted(day_period(day) for day in completed), dtype=np.int64)
+    target = 1 if habit.periodicity == PeriodicityEnum.daily else habit.frequency
+    index = streaks_from_days(days, habit.periodicity.value, target, habit.start_date, TODAY)
+    assert (index.current, index.longest) == (expected.current_streak, expected.longest_streak)
+
+
+@pytest.mark.parametrize("name", CASES)
+def test_engines_match_period_walk(db, name):
+    case = CASES[name]
+    rng = random.Random(name)
+    completed = _history(case, rng)
+    habit = _create_habit(db, case)
+
+    # Most of the history in one statement, with a few logs left incomplete
+    rows = [{"habit_id": habit.id, "log_date": day, "completed": True} for day in sorted(completed)]
+    rows += [{"habit_id": habit.id, "log_date": TODAY - timedelta(days=ago), "completed": False}
+             for ago in range(case.history_days) if TODAY - timedelta(days=ago) not in completed and rng.random() < 0.1]
+    if rows:
+        db.execute(text("INSERT INTO habit_logs (habit_id, log_date, completed, created_at) "
+                        "VALUES (:habit_id, :log_date, :completed, now())"), rows)
+    recompute_streak_states(db, [habit.id])
+    db.commit()
+    _assert_engines_agree(db, habit, completed)
+
+
+@pytest.mark.parametrize("name", ["daily-gaps", "daily-select-days", "weekly-target-3", "monthly-target-4"])
+def test_incremental_state_matches_period_walk(db, name):
+    """Single-day writes in any order, backdated ones included, keep the state exact."""
+    case = CASES[name]
+    rng = random.Random(name)
+    history = _history(case, rng)
+    habit = _create_habit(db, case)
+
+    completed: Set[date] = set()
+    days = sorted(history)
+    # Oldest first for most of it, then the rest shuffled, then edits of recent and older days
+    split = len(days) * 2 // 3
+    for day in days[:split] + rng.sample(days[split:], len(days) - split):
+        habit.mark_completed(db, day)
+        completed.add(day)
+    _assert_engines_agree(db, habit, completed)
+
+    for _ in range(40):
+        day = TODAY - timedelta(days=rng.choice([0, 1, 2, 3, 7, 8, rng.randrange(case.history_days + 1)]))
+        if day in completed:
+            habit.mark_incomplete(db, day)
+            completed.discard(day)
+        else:
+            habit.mark_completed(db, day)
+            completed.add(day)
+    _assert_engines_agree(db, habit, completed)
+
+
+def test_batch_matches_single_habits(db):
+    """Several habits of every periodicity in one round-trip give each habit's own result."""
+    habits = {}
+    for name in ("daily-gaps", "weekly-target-3", "monthly-once", "never-completed"):
+        case = CASES[name]
+        completed = _history(case, random.Random(name))
+        habit = _create_habit(db, case)
+        for day in sorted(completed):
+            habit.mark_completed(db, day)
+        habits[habit.id] = (habit, completed)
+
+    stats = compute_habit_stats(db, list(habits) + [max(habits) + 1], TODAY)
+    assert set(stats) == set(habits)
+    for habit_id, (habit, completed) in habits.items():
+        assert stats[habit_id] == reference_stats(habit.periodicity.value, habit.frequency, habit.start_date,
+                                                  habit.end_date, completed, TODAY)
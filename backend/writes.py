@@ -0,0 +1,44 @@
+"""Habit log writes, shared by the sync routes (main.py) and the async ones (async_routes.py).
+
+As with reads.py, main.py calls them with the route's session and
+async_routes.py through ``AsyncSession.run_sync``, so both answer a write
+and its idempotent retries the same way.
+"""
+from typing import Optional
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.orm import Session
+
+import idempotency
+import models
+import schemas
+
+
+def write_completion(db: Session, habit_id: int, completion: Optional[schemas.HabitCompletion],
+                     completed: bool, idempotency_key: Optional[str]) -> dict:
+    """Mark a habit completed or incomplete for a day; returns the written log, or the response a retry replays."""
+    completion = completion or schemas.HabitCompletion()
+    fingerprint = idempotency.fingerprint("complete" if completed else "incomplete", habit_id,
+                                          completion.log_date, completion.notes)
+    if idempotency_key:
+        try:
+            replayed = idempotency.replay(db, idempotency_key, fingerprint)
+        except idempotency.IdempotencyKeyReused:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+        if replayed is not None:
+            return replayed
+
+    habit = db.get(models.Habit, habit_id)
+    if habit is None:
+        raise HTTPException(status_code=404, detail="Habit not found")
+    if completed:
+        log = habit.mark_completed(db, completion.log_date, completion.notes)
+    else:
+        log = habit.mark_incomplete(db, completion.log_date)
+
+    response = jsonable_encoder({column.name: getattr(log, column.name) for column in models.HabitLog.__table__.columns})
+    if idempotency_key:
+        # After the log commit: a retry racing this store just repeats the idempotent upsert
+        idempotency.remember(db, idempotency_key, fingerprint, response)
+    return response
@@ -17,6 +17,7 @@ const HabitDashboard = () => {
   // API helper function
   const apiCall = async (endpoint, options = {}) => {
     const response = await fetch(`${API_BASE_URL}${endpoint}`, {
+      credentials: 'include',
       headers: {
         'Content-Type': 'application/json',
         ...options.headers,
@@ -46,7 +47,7 @@ const HabitDashboard = () => {
   const fetchHabitLogs = async (date = selectedDate) => {
     try {
       const data = await apiCall(`/habits/logs/?date=${date}`);
-      import React, { useState, useEffect } from 'react';
+      import React, { useState, useEffect, useRef } from 'react';
 import { Calendar, CheckCircle, Circle, TrendingUp, Target, Clock, Plus, Filter } from 'lucide-react';
 
 const HabitDashboard = () => {
@@ -56,6 +57,9 @@ const HabitDashboard = () => {
   const [error, setError] = useState(null);
   const [selectedDate, setSelectedDate] = useState(new Date().toISOString().split('T')[0]);
   const [selectedPeriodicity, setSelectedPeriodicity] = useState('all');
+  // Read by the change feed handlers, which are set up once
+  const selectedDateRef = useRef(selectedDate);
+  selectedDateRef.current = selectedDate;
 
   // API base URL - adjust this to match your FastAPI server
   const API_BASE_URL = 'http://localhost:8000'; // Change this to your API URL
@@ -63,7 +67,7 @@ const HabitDashboard = () => {
   // Fetch habits from API
   const fetchHabits = async () => {
     try {
-      const response = await fetch(`${API_BASE_URL}/habits/`);
+      const response = await fetch(`${API_BASE_URL}/habits/`, { credentials: 'include' });
       if (!response.ok) throw new Error('Failed to fetch habits');
       const data = await response.json();
       setHabits(data);
@@ -75,7 +79,7 @@ const HabitDashboard = () => {
   // Fetch habit logs from API
   const fetchHabitLogs = async (date = selectedDate) => {
     try {
-      const response = await fetch(`${API_BASE_URL}/habits/logs?date=${date}`);
+      const response = await fetch(`${API_BASE_URL}/habits/logs?date=${date}`, { credentials: 'include' });
       if (!response.ok) throw new Error('Failed to fetch habit logs');
       const data = await response.json();
       setHabitLogs(data);
@@ -90,6 +94,8 @@ const HabitDashboard = () => {
       const method = completed ? 'POST' : 'DELETE';
       const response = await fetch(`${API_BASE_URL}/habits/${habitId}/complete`, {
         method,
+        // Carries back the read-your-writes cookie, so the next reads see this write
+        credentials: 'include',
         headers: {
           'Content-Type': 'application/json',
         },
@@ -100,14 +106,27 @@ const HabitDashboard = () => {
       });
 
       if (!response.ok) throw new Error('Failed to update habit');
-      
-      // Refresh data
-      await fetchHabitLogs(selectedDate);
+
+      // The response is the written log; no need to refetch the day
+      const log = await response.json();
+      applyLogChange(log.habit_id, log.log_date, log.completed);
     } catch (err) {
       setError(err.message);
     }
   };
 
+  // Apply one log write to the loaded day, from our own writes or the change feed
+  const applyLogChange = (habitId, logDate, completed) => {
+    if (logDate !== selectedDateRef.current) return;
+    setHabitLogs(prev => {
+      const exists = prev.some(log => log.habit_id === habitId && log.log_date === logDate);
+      if (!exists) return [...prev, { habit_id: habitId, log_date: logDate, completed }];
+      return prev.map(log =>
+        log.habit_id === habitId && log.log_date === logDate ? { ...log, completed } : log
+      );
+    });
+  };
+
   // Initial data fetch
   useEffect(() => {
     const loadData = async () => {
@@ -119,6 +138,48 @@ const HabitDashboard = () => {
     loadData();
   }, []);
 
+  // Keep up with changes made elsewhere (other devices, other tabs) through the
+  // server's change feed instead of polling
+  useEffect(() => {
+    const source = new EventSource(`${API_BASE_URL}/events`, { withCredentials: true });
+    let connectedBefore = false;
+
+    source.onopen = () => {
+      // Changes made while disconnected were missed; refetching is cheap thanks to ETags
+      if (connectedBefore) {
+        fetchHabits();
+        fetchHabitLogs(selectedDateRef.current);
+      }
+      connectedBefore = true;
+    };
+
+    source.onmessage = (message) => {
+      const event = JSON.parse(message.data);
+      switch (event.type) {
+        case 'log':
+          applyLogChange(event.habit_id, event.log_date, event.completed);
+          break;
+        case 'logs_imported':
+          fetchHabitLogs(selectedDateRef.current);
+          break;
+        case 'habit_created':
+          fetchHabits();
+          break;
+        case 'habit_deleted':
+          setHabits(prev => prev.filter(habit => habit.id !== event.id));
+          break;
+        case 'resync':
+          fetchHabits();
+          fetchHabitLogs(selectedDateRef.current);
+          break;
+        default:
+          break;
+      }
+    };
+
+    return () => source.close();
+  }, []);
+
   // Refetch logs when date changes
   useEffect(() => {
     if (!loading) {
@@ -1,17 +1,45 @@
-import React from 'react';
-import { format, eachDayOfInterval } from 'date-fns';
+import React, { useEffect, useState } from 'react';
+import { format, addDays } from 'date-fns';
+
+const API_BASE_URL = 'http://localhost:8000';
+
+// Day heatmaps arrive as a base64 bitmap: bit i (least significant first) is bucket_start + i
+const decodeBitmap = (data, buckets) => {
+  const bytes = atob(data);
+  const bits = [];
+  for (let i = 0; i < buckets; i++) {
+    bits.push(((bytes.charCodeAt(i >> 3) >> (i & 7)) & 1) === 1);
+  }
+  return bits;
+};
 
 const Heatmap = ({ habit, dateRange }) => {
-  if (!habit || !dateRange.start || !dateRange.end) return null;
+  const [completions, setCompletions] = useState([]);
+
+  useEffect(() => {
+    if (!habit || !dateRange.start || !dateRange.end) return;
 
-  // Generate days in range
-  const days = eachDayOfInterval({ start: dateRange.start, end: dateRange.end });
+    const start = format(dateRange.start, 'yyyy-MM-dd');
+    const end = format(dateRange.end, 'yyyy-MM-dd');
+    fetch(`${API_BASE_URL}/habits/${habit.id}/heatmap?start=${start}&end=${end}&bucket=day`, {
+      credentials: 'include',
+    })
+      .then((response) => (response.ok ? response.json() : null))
+      .then((heatmap) => {
+        if (!heatmap || heatmap.series.length === 0) {
+          setCompletions([]);
+          return;
+        }
+        const bits = decodeBitmap(heatmap.series[0].data, heatmap.buckets);
+        setCompletions(bits.map((completed, i) => ({
+          date: addDays(dateRange.start, i),
+          completed,
+        })));
+      })
+      .catch(() => setCompletions([]));
+  }, [habit, dateRange]);
 
-  // Simulate data: random completion
-  const completions = days.map((date) => ({
-    date,
-    completed: Math.random() > 0.5,
-  }));
+  if (!habit || !dateRange.start || !dateRange.end) return null;
 
   return (
     <div>
@@ -33,4 +61,4 @@ const Heatmap = ({ habit, dateRange }) => {
   );
 };
 
-export default Heatmap;
\ No newline at end of file
+export default Heatmap;